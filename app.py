@@ -3,8 +3,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from datetime import datetime, timedelta, date
 import os
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment
+from app.utils.xlsx_export import XlsxExport, StyledRow
 from werkzeug.security import generate_password_hash, check_password_hash
 from config import Config
 from notifications import mail, send_notification_retard, send_notification_absence
@@ -13,7 +12,7 @@ import pyotp
 import qrcode
 import io
 import base64
-from pdf_generator import generate_payslip
+from pdf_generator import generate_payslip, generate_all_payslips
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -321,121 +320,69 @@ def generer_rapport(type_rapport):
         
         pointages = db.session.query(Pointage, Employe).join(Employe).filter(
             Pointage.date_pointage == date_rapport
-        ).all()
-        
-        # Créer le fichier Excel avec openpyxl
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Pointages"
-        
-        # En-têtes
-        headers = ['Matricule', 'Nom', 'Prénom', 'Département', 'Arrivée Matin', 
-                   'Départ Midi', 'Arrivée Après-midi', 'Départ Soir', 
-                   'Heures Travaillées', 'Retard Matin', 'Retard Après-midi']
-        
-        # Style pour les en-têtes
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill("solid", fgColor="366092")
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Ajouter les en-têtes
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-        
-        # Ajouter les données
-        row_num = 2
-        for p, e in pointages:
-            ws.cell(row=row_num, column=1, value=e.matricule)
-            ws.cell(row=row_num, column=2, value=e.nom)
-            ws.cell(row=row_num, column=3, value=e.prenom)
-            ws.cell(row=row_num, column=4, value=e.departement or '-')
-            ws.cell(row=row_num, column=5, value=p.arrivee_matin.strftime('%H:%M') if p.arrivee_matin else 'Non badgé')
-            ws.cell(row=row_num, column=6, value=p.depart_midi.strftime('%H:%M') if p.depart_midi else 'Non badgé')
-            ws.cell(row=row_num, column=7, value=p.arrivee_apres_midi.strftime('%H:%M') if p.arrivee_apres_midi else 'Non badgé')
-            ws.cell(row=row_num, column=8, value=p.depart_soir.strftime('%H:%M') if p.depart_soir else 'Non badgé')
-            ws.cell(row=row_num, column=9, value=p.heures_travaillees)
-            ws.cell(row=row_num, column=10, value='Oui' if p.retard_matin else 'Non')
-            ws.cell(row=row_num, column=11, value='Oui' if p.retard_apres_midi else 'Non')
-            row_num += 1
-        
-        # Ajuster la largeur des colonnes
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = (max_length + 2) * 1.2
-            ws.column_dimensions[column_letter].width = adjusted_width
-        
-        # Sauvegarder le fichier
-        filename = f'rapport_pointage_{date_rapport.isoformat()}.xlsx'
-        filepath = os.path.join('static', filename)
-        wb.save(filepath)
-        
-        return send_file(filepath, as_attachment=True)
+        ).order_by(Employe.nom).execution_options(yield_per=1000)
+        
+        def heure(valeur):
+            return valeur.strftime('%H:%M') if valeur else 'Non badgé'
+        
+        def lignes():
+            for p, e in pointages:
+                yield [
+                    e.matricule, e.nom, e.prenom, e.departement or '-',
+                    heure(p.arrivee_matin), heure(p.depart_midi),
+                    heure(p.arrivee_apres_midi), heure(p.depart_soir),
+                    p.heures_travaillees,
+                    'Oui' if p.retard_matin else 'Non',
+                    'Oui' if p.retard_apres_midi else 'Non'
+                ]
+        
+        # Classeur écrit en flux (largeurs fixes, pas de fichier dans static/)
+        export = XlsxExport(header_color='366092')
+        export.add_sheet('Pointages', [
+            ('Matricule', 14), ('Nom', 20), ('Prénom', 20), ('Département', 18),
+            ('Arrivée Matin', 16), ('Départ Midi', 16), ('Arrivée Après-midi', 20),
+            ('Départ Soir', 16), ('Heures Travaillées', 20), ('Retard Matin', 15),
+            ('Retard Après-midi', 20)
+        ], lignes())
+        
+        return export.response(f'rapport_pointage_{date_rapport.isoformat()}.xlsx')
     
     elif type_rapport == 'mensuel':
         # NOUVEAU : Rapport mensuel
         mois = int(request.args.get('mois', date.today().month))
         annee = int(request.args.get('annee', date.today().year))
         
-        # Créer le workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = f"Rapport {mois:02d}-{annee}"
-        
-        # Titre
-        ws.merge_cells('A1:H1')
-        titre = ws['A1']
-        titre.value = f"RAPPORT MENSUEL DE PRÉSENCE - {mois:02d}/{annee}"
-        titre.font = Font(size=16, bold=True)
-        titre.alignment = Alignment(horizontal="center")
-        
-        # Récupérer tous les employés actifs
-        employes = Employe.query.filter_by(actif=True).order_by(Employe.nom).all()
-        
-        row_num = 3
-        for employe in employes:
-            # Section employé
-            ws.merge_cells(f'A{row_num}:H{row_num}')
-            cell_employe = ws[f'A{row_num}']
-            cell_employe.value = f"{employe.nom} {employe.prenom} - Matricule: {employe.matricule}"
-            cell_employe.font = Font(bold=True, size=12)
-            cell_employe.fill = PatternFill("solid", fgColor="E0E0E0")
-            row_num += 1
-            
-            # Statistiques du mois
-            pointages = Pointage.query.filter_by(employe_id=employe.id).filter(
-                db.extract('month', Pointage.date_pointage) == mois,
-                db.extract('year', Pointage.date_pointage) == annee
-            ).all()
-            
-            total_heures = sum(p.heures_travaillees for p in pointages)
-            nb_retards = sum(1 for p in pointages if p.retard_matin or p.retard_apres_midi)
-            nb_absences = sum(1 for p in pointages if p.absence)
-            
-            # Ligne de stats
-            ws[f'A{row_num}'] = "Total heures:"
-            ws[f'B{row_num}'] = f"{total_heures:.2f}h"
-            ws[f'C{row_num}'] = "Retards:"
-            ws[f'D{row_num}'] = nb_retards
-            ws[f'E{row_num}'] = "Absences:"
-            ws[f'F{row_num}'] = nb_absences
-            row_num += 2
-        
-        # Sauvegarder
-        filename = f'rapport_mensuel_{annee}_{mois:02d}.xlsx'
-        filepath = os.path.join('static', filename)
-        wb.save(filepath)
-        
-        return send_file(filepath, as_attachment=True)
+        # Statistiques du mois de tous les employés actifs en une requête
+        stats = db.session.query(
+            Employe,
+            db.func.coalesce(db.func.sum(Pointage.heures_travaillees), 0),
+            db.func.count(db.case(
+                (db.or_(Pointage.retard_matin == True, Pointage.retard_apres_midi == True), Pointage.id)
+            )),
+            db.func.count(db.case((Pointage.absence == True, Pointage.id)))
+        ).outerjoin(Pointage, db.and_(
+            Pointage.employe_id == Employe.id,
+            db.extract('month', Pointage.date_pointage) == mois,
+            db.extract('year', Pointage.date_pointage) == annee
+        )).filter(
+            Employe.actif == True
+        ).group_by(Employe.id).order_by(Employe.nom).execution_options(yield_per=1000)
+        
+        def lignes():
+            yield StyledRow([f"RAPPORT MENSUEL DE PRÉSENCE - {mois:02d}/{annee}", '', '', '', '', '', ''], 'section')
+            for employe, total_heures, nb_retards, nb_absences in stats:
+                yield [
+                    employe.matricule, employe.nom, employe.prenom, employe.departement or '-',
+                    round(total_heures, 2), nb_retards, nb_absences
+                ]
+        
+        export = XlsxExport(header_color='366092')
+        export.add_sheet(f"Rapport {mois:02d}-{annee}", [
+            ('Matricule', 14), ('Nom', 20), ('Prénom', 20), ('Département', 18),
+            ('Total heures', 14), ('Retards', 10), ('Absences', 10)
+        ], lignes())
+        
+        return export.response(f'rapport_mensuel_{annee}_{mois:02d}.xlsx')
     
     return redirect(url_for('admin_dashboard'))
 
@@ -647,6 +594,35 @@ def generer_fiche_paie(employe_id):
         download_name=filename
     )
 
+@app.route('/admin/fiches-paie/lot')
+@login_required
+def generer_lot_fiches_paie():
+    """Génère un seul PDF avec les fiches de paie de tous les employés actifs"""
+    mois = request.args.get('mois', date.today().month, type=int)
+    annee = request.args.get('annee', date.today().year, type=int)
+    
+    # Heures du mois de tous les employés actifs en une requête
+    employes_data = db.session.query(
+        Employe,
+        db.func.coalesce(db.func.sum(Pointage.heures_travaillees), 0)
+    ).outerjoin(Pointage, db.and_(
+        Pointage.employe_id == Employe.id,
+        db.extract('month', Pointage.date_pointage) == mois,
+        db.extract('year', Pointage.date_pointage) == annee
+    )).filter(
+        Employe.actif == True
+    ).group_by(Employe.id).order_by(Employe.nom).execution_options(yield_per=200)
+    
+    # Fiches dessinées une par une dans un fichier temporaire
+    pdf_file = generate_all_payslips(employes_data, mois, annee)
+    
+    return send_file(
+        pdf_file,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f'fiches_paie_{annee}_{mois:02d}.pdf'
+    )
+
 @app.route('/admin/fiches-paie')
 @login_required
 def liste_fiches_paie():
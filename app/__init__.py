@@ -9,9 +9,12 @@ from flask_migrate import Migrate
 from flask_cors import CORS
 from flask_mail import Mail
 from config import Config
+from datetime import datetime
+import click
 import logging
 from logging.handlers import RotatingFileHandler
 import os
+import sys
 
 # Extensions Flask
 db = SQLAlchemy()
@@ -19,6 +22,13 @@ login_manager = LoginManager()
 migrate = Migrate()
 mail = Mail()
 
+def is_cli_command():
+    """Vrai pour une commande `flask ...` autre que `flask run`"""
+    program = os.path.basename(sys.argv[0]) if sys.argv else ''
+    launched_by_flask = program in ('flask', 'flask.exe') or \
+        sys.argv[0].endswith(os.path.join('flask', '__main__.py'))
+    return launched_by_flask and 'run' not in sys.argv[1:]
+
 def create_app(config_class=Config):
     """Factory pattern pour créer l'application"""
     app = Flask(__name__)
@@ -56,6 +66,12 @@ def create_app(config_class=Config):
     app.register_blueprint(leave_bp)
     app.register_blueprint(analytics_bp)
     
+    # Écouteurs ORM du compteur de notifications non lues (tous les processus)
+    from app.utils import unread_counter  # noqa: F401
+    
+    # Écouteurs ORM du tableau de bord incrémental
+    from app.utils import dashboard_updater  # noqa: F401
+    
     # Créer les dossiers nécessaires
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     os.makedirs('app/static/uploads/attendance', exist_ok=True)
@@ -86,15 +102,12 @@ def create_app(config_class=Config):
     @app.context_processor
     def inject_globals():
         """Injecter des variables globales dans tous les templates"""
-        from app.models import Notification
+        from app.utils.unread_counter import unread_counter
         from app.utils.permissions import ROLES, PermissionManager
         
         unread_count = 0
         if current_user.is_authenticated:
-            unread_count = Notification.query.filter_by(
-                user_id=current_user.id,
-                is_read=False
-            ).count()
+            unread_count = unread_counter.get(current_user.id)
         
         return dict(
             unread_notifications=unread_count,
@@ -140,8 +153,8 @@ def create_app(config_class=Config):
         db.session.rollback()
         return render_template('errors/500.html'), 500
     
-    # Tâches planifiées
-    with app.app_context():
+    # Tâches planifiées (un seul processus leader les exécute, jamais en CLI)
+    if app.config.get('SCHEDULER_ENABLED', True) and not is_cli_command():
         from app.utils.scheduler import start_scheduler
         start_scheduler(app)
     
@@ -195,6 +208,56 @@ def create_app(config_class=Config):
         for violation in result['violations']:
             print(f"- {violation['message']}")
     
+    @app.cli.command()
+    @click.option('--start', 'start', required=True, help='Date de début (AAAA-MM-JJ)')
+    @click.option('--end', 'end', default=None, help='Date de fin (AAAA-MM-JJ), défaut: aujourd\'hui')
+    def backfill_statistics(start, end):
+        """Reconstruire les agrégats de présence et les statistiques journalières"""
+        from app.utils.statistics import attendance_rollup
+        from datetime import date
+        
+        start_date = datetime.strptime(start, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end, '%Y-%m-%d').date() if end else date.today()
+        
+        months = attendance_rollup.backfill(start_date, end_date)
+        days = attendance_rollup.build_daily(start_date, end_date)
+        print(f"Agrégats reconstruits: {months} mois, statistiques journalières: {days} jours.")
+    
+    @app.cli.command()
+    @click.option('--month', type=int, required=True, help='Mois (1-12)')
+    @click.option('--year', type=int, required=True, help='Année')
+    def recalculate_deductions(month, year):
+        """Recalculer les déductions des fiches non payées après un changement de barème"""
+        from app.utils.payroll_engine import payroll_engine
+        
+        count = payroll_engine.recalculate_deductions(month, year)
+        db.session.commit()
+        print(f"Fiches de paie recalculées: {count}.")
+    
+    @app.cli.command()
+    @click.option('--month', type=int, required=True, help='Mois (1-12)')
+    @click.option('--year', type=int, required=True, help='Année')
+    def revalidate_expenses(month, year):
+        """Réévaluer les dépenses d'un mois après un changement de politique"""
+        from app.utils.expense_policy import expense_policy_engine
+        from app.utils.dashboard_updater import dashboard_updater
+        
+        summary = expense_policy_engine.revalidate_month(month, year)
+        db.session.commit()
+        if summary['updated']:
+            dashboard_updater.reconcile()
+        print(f"Dépenses vérifiées: {summary['checked']}, en violation: {summary['violations']}, "
+              f"mises à jour: {summary['updated']}.")
+    
+    @app.cli.command()
+    def requeue_emails():
+        """Remettre en file les emails abandonnés"""
+        from app.utils.mailer import mail_queue
+        
+        count = mail_queue.requeue_dead_letters(app)
+        mail_queue.flush()
+        print(f"Emails remis en file: {count}.")
+    
     @app.cli.command()
     def send_reminders():
         """Envoyer les rappels automatiques"""
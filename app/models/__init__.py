@@ -2,23 +2,27 @@
 Modèles de données pour Globibat CRM
 """
 from .user import User, Role
-from .employee import Employee, Attendance, Leave, Payroll
+from .employee import (Employee, Attendance, BadgeSyncEvent, Leave, Payroll,
+                       DeductionRateTable, PayslipJob)
 from .client import Client, Contact, ClientNote
 from .project import Project, ProjectPhase, ProjectTask, ProjectDocument
 from .finance import Invoice, Quote, Expense, Payment
 from .inventory import Material, Equipment, Supplier, PurchaseOrder
-from .planning import Schedule, Meeting, Reminder
+from .planning import Schedule, Meeting, Reminder, Holiday
 from .analytics import (ExpensePolicy, WorkTimeRegulation, EmployeeStatistics, 
-                       CompanyDashboard, AuditLog, Notification)
+                       CompanyDashboard, AuditLog, Notification, EmailDeadLetter,
+                       SchedulerLease)
 
 __all__ = [
     'User', 'Role',
-    'Employee', 'Attendance', 'Leave', 'Payroll',
+    'Employee', 'Attendance', 'BadgeSyncEvent', 'Leave', 'Payroll', 'DeductionRateTable',
+    'PayslipJob',
     'Client', 'Contact', 'ClientNote',
     'Project', 'ProjectPhase', 'ProjectTask', 'ProjectDocument',
     'Invoice', 'Quote', 'Expense', 'Payment',
     'Material', 'Equipment', 'Supplier', 'PurchaseOrder',
-    'Schedule', 'Meeting', 'Reminder',
+    'Schedule', 'Meeting', 'Reminder', 'Holiday',
     'ExpensePolicy', 'WorkTimeRegulation', 'EmployeeStatistics',
-    'CompanyDashboard', 'AuditLog', 'Notification'
+    'CompanyDashboard', 'AuditLog', 'Notification', 'EmailDeadLetter',
+    'SchedulerLease'
 ]
\ No newline at end of file
@@ -3,7 +3,7 @@ Modèles pour les statistiques et analyses
 """
 from app import db
 from datetime import datetime, date
-from sqlalchemy import func
+from sqlalchemy import func, UniqueConstraint
 
 class ExpensePolicy(db.Model):
     """Modèle pour les politiques de dépenses"""
@@ -88,11 +88,13 @@ class EmployeeStatistics(db.Model):
     total_hours = db.Column(db.Float, default=0)
     regular_hours = db.Column(db.Float, default=0)
     overtime_hours = db.Column(db.Float, default=0)
+    billable_hours = db.Column(db.Float, default=0)  # Heures imputées à un projet
     
     # Présence
     days_present = db.Column(db.Integer, default=0)
     days_absent = db.Column(db.Integer, default=0)
-    late_arrivals = db.Column(db.Integer, default=0)
+    late_arrivals = db.Column(db.Integer, default=0)  # Demi-journées en retard
+    late_days = db.Column(db.Integer, default=0)  # Jours avec au moins un retard
     
     # Congés
     vacation_taken = db.Column(db.Float, default=0)
@@ -112,6 +114,12 @@ class EmployeeStatistics(db.Model):
     # Relations
     employee = db.relationship('Employee', backref='statistics')
     
+    # Une seule ligne par employé et par période
+    __table_args__ = (
+        UniqueConstraint('employee_id', 'period_type', 'period_start', name='uq_employee_statistics_period'),
+        db.Index('ix_employee_statistics_period', 'period_type', 'period_start'),
+    )
+    
     def __repr__(self):
         return f'<EmployeeStatistics {self.employee_id} - {self.period_type}>'
 
@@ -220,4 +228,44 @@ class Notification(db.Model):
     user = db.relationship('User', backref='notifications')
     
     def __repr__(self):
-        return f'<Notification {self.title} - {self.user_id}>'
\ No newline at end of file
+        return f'<Notification {self.title} - {self.user_id}>'
+
+class EmailDeadLetter(db.Model):
+    """Emails abandonnés après épuisement des tentatives d'envoi"""
+    __tablename__ = 'email_dead_letters'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # Message
+    to_email = db.Column(db.String(200), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text)
+    link_url = db.Column(db.String(200))
+    
+    # Échec
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+    
+    # Dates
+    queued_at = db.Column(db.DateTime)
+    failed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    requeued_at = db.Column(db.DateTime)  # Renvoi manuel
+    
+    def __repr__(self):
+        return f'<EmailDeadLetter {self.to_email} - {self.subject}>'
+
+
+class SchedulerLease(db.Model):
+    """Bail de leadership (un seul processus exécute les tâches planifiées)"""
+    __tablename__ = 'scheduler_leases'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    
+    # Détenteur actuel (hôte:pid:jeton)
+    holder = db.Column(db.String(100))
+    acquired_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<SchedulerLease {self.name} - {self.holder}>'
@@ -147,9 +147,55 @@ class Attendance(db.Model):
         if self.total_hours > 8:
             self.overtime_hours = round(self.total_hours - 8, 2)
         
+        # Mettre à jour les agrégats journaliers/hebdomadaires/mensuels
+        from app.utils.statistics import attendance_rollup
+        attendance_rollup.refresh_attendance(self)
+        
         return self.total_hours
 
 
+class BadgeSyncEvent(db.Model):
+    """Pointage reçu d'un terminal hors ligne (clé d'idempotence)"""
+    __tablename__ = 'badge_sync_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    idempotency_key = db.Column(db.String(100), unique=True, nullable=False, index=True)
+    terminal_id = db.Column(db.String(100))
+    
+    employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'))
+    attendance_id = db.Column(db.Integer, db.ForeignKey('attendances.id'))
+    
+    # Pointage
+    event_time = db.Column(db.DateTime)
+    check_method = db.Column(db.String(20))
+    
+    # Résultat renvoyé au terminal (identique en cas de renvoi)
+    status = db.Column(db.String(20), nullable=False)  # pending, applied, rejected
+    action_type = db.Column(db.String(20))
+    message = db.Column(db.String(255))
+    
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relations
+    employee = db.relationship('Employee')
+    attendance = db.relationship('Attendance')
+    
+    def __repr__(self):
+        return f'<BadgeSyncEvent {self.idempotency_key} - {self.status}>'
+    
+    def to_result(self, duplicate=False):
+        """Résultat renvoyé au terminal pour cet événement"""
+        return {
+            'idempotency_key': self.idempotency_key,
+            'success': self.status == 'applied',
+            'status': self.status,
+            'duplicate': duplicate,
+            'action_type': self.action_type,
+            'attendance_id': self.attendance_id,
+            'message': self.message
+        }
+
+
 class Leave(db.Model):
     """Modèle de congés/absences"""
     __tablename__ = 'leaves'
@@ -184,17 +230,11 @@ class Leave(db.Model):
         return f'<Leave {self.employee_id} - {self.leave_type}>'
     
     def calculate_days(self):
-        """Calculer le nombre de jours"""
+        """Calculer le nombre de jours ouvrés (hors week-ends et jours fériés)"""
         if self.start_date and self.end_date:
-            delta = (self.end_date - self.start_date).days + 1
-            # Exclure les weekends
-            weekdays = 0
-            current = self.start_date
-            while current <= self.end_date:
-                if current.weekday() < 5:  # Lundi=0, Vendredi=4
-                    weekdays += 1
-                current += timedelta(days=1)
-            self.total_days = weekdays
+            from app.utils.business_calendar import business_calendar
+            canton = self.employee.canton if self.employee else None
+            self.total_days = business_calendar.working_days(self.start_date, self.end_date, canton=canton)
         return self.total_days
 
 
@@ -257,26 +297,87 @@ class Payroll(db.Model):
         return f'<Payroll {self.employee_id} - {self.month}/{self.year}>'
     
     def calculate_deductions(self):
-        """Calculer les déductions sociales suisses"""
+        """Calculer les déductions sociales suisses (barème en vigueur sur la période)"""
+        from app.utils.deductions import deduction_calculator
+        
         if self.gross_salary:
-            # Taux approximatifs pour la Suisse
-            self.social_security = self.gross_salary * 0.0525  # AVS/AI/APG
-            self.unemployment = self.gross_salary * 0.011     # AC
-            self.pension = self.gross_salary * 0.075          # LPP (dépend de l'âge)
-            self.accident_insurance = self.gross_salary * 0.0081  # LAA
-            
-            # Impôt à la source (taux variable)
-            self.tax_deduction = self.gross_salary * 0.10  # Approximation
-            
-            total_deductions = (self.social_security + self.unemployment + 
-                              self.pension + self.accident_insurance + 
-                              self.tax_deduction + self.other_deductions)
-            
-            self.net_salary = self.gross_salary - total_deductions
+            values = deduction_calculator.compute(
+                self.gross_salary,
+                employee=self.employee,
+                period=self.period_start or date(self.year, self.month, 1),
+                other_deductions=self.other_deductions
+            )
+            for field, value in values.items():
+                setattr(self, field, value)
         
         return self.net_salary
 
 
+class DeductionRateTable(db.Model):
+    """Barème versionné des déductions sociales suisses (part employé)"""
+    __tablename__ = 'deduction_rate_tables'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.String(20), unique=True, nullable=False)  # Ex: "2024"
+    valid_from = db.Column(db.Date, nullable=False)  # Appliqué aux périodes dès cette date
+    
+    # Assurances sociales
+    avs_rate = db.Column(db.Decimal(7, 5), nullable=False)   # AVS/AI/APG
+    ac_rate = db.Column(db.Decimal(7, 5), nullable=False)    # AC
+    ac_ceiling = db.Column(db.Decimal(10, 2))                 # Salaire annuel assuré maximal AC
+    laa_rate = db.Column(db.Decimal(7, 5), nullable=False)   # LAA non professionnelle
+    
+    # LPP: taux par tranche d'âge {"25": "0.035", "35": "0.05", ...} sur le salaire coordonné
+    lpp_rates = db.Column(db.JSON, nullable=False)
+    lpp_entry_threshold = db.Column(db.Decimal(10, 2))        # Seuil d'entrée annuel
+    lpp_coordination = db.Column(db.Decimal(10, 2))           # Déduction de coordination annuelle
+    
+    # Impôt à la source: {"VD": "0.12", ...} et taux par défaut
+    source_tax_rates = db.Column(db.JSON)
+    default_source_tax_rate = db.Column(db.Decimal(7, 5), default=0)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DeductionRateTable {self.version}>'
+
+
+class PayslipJob(db.Model):
+    """Génération en arrière-plan d'un lot de fiches de paie PDF"""
+    __tablename__ = 'payslip_jobs'
+    
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    status = db.Column(db.String(20), default='pending')  # pending, running, completed, failed
+    
+    # Progression
+    total = db.Column(db.Integer, default=0)
+    done = db.Column(db.Integer, default=0)
+    cached = db.Column(db.Integer, default=0)  # Fiches inchangées, non régénérées
+    failed = db.Column(db.Integer, default=0)
+    errors = db.Column(db.JSON)  # [{"payroll_id": ..., "message": ...}]
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    heartbeat_at = db.Column(db.DateTime)  # Dernier enregistrement de la progression
+    finished_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<PayslipJob {self.id} - {self.status}>'
+    
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'total': self.total,
+            'done': self.done,
+            'cached': self.cached,
+            'failed': self.failed,
+            'progress': round(self.done / self.total * 100, 1) if self.total else 100.0,
+            'errors': self.errors or [],
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
 # Table d'association pour les employés sur les projets
 project_employees = db.Table('project_employees',
     db.Column('project_id', db.Integer, db.ForeignKey('projects.id'), primary_key=True),
@@ -0,0 +1,138 @@
+"""
+Résolution des identifiants de badgage (badge, QR code, PIN haché)
+
+Badge et QR code sont des colonnes uniques, donc indexées: l'employé est lu
+directement par une requête. Le PIN haché n'est pas indexé (plusieurs
+centaines de badgages en quelques minutes aux prises de poste feraient
+autant de parcours de la table): un index en mémoire PIN -> id employé,
+construit en une requête, remplace ce parcours par un chargement par clé
+primaire. L'index est invalidé à chaque commit modifiant un employé et
+expire après CREDENTIAL_INDEX_TTL secondes pour borner le décalage entre
+processus (plusieurs workers gunicorn).
+"""
+
+from app import db
+from app.models import Employee
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+import hashlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Méthode d'authentification -> colonne Employee correspondante
+CREDENTIAL_FIELDS = {
+    'badge': 'badge_number',
+    'qr_code': 'qr_code',
+    'pin': 'pin_code'
+}
+
+CREDENTIAL_INDEX_TTL = 60  # secondes
+
+
+def hash_pin(pin):
+    """Hacher un code PIN comme il est stocké dans Employee.pin_code"""
+    return hashlib.sha256(pin.encode()).hexdigest()
+
+
+class CredentialIndex:
+    """Index PIN haché -> id employé, limité aux employés actifs"""
+
+    def __init__(self, ttl=CREDENTIAL_INDEX_TTL):
+        self.ttl = ttl
+        self._pins = None
+        self._built_at = 0
+        self._lock = threading.Lock()
+
+    def resolve(self, method, value):
+        """Retrouver l'employé actif correspondant à un identifiant
+
+        Retourne None si la méthode est inconnue ou si aucun employé actif
+        ne correspond.
+        """
+        field = CREDENTIAL_FIELDS.get(method)
+        if not field or not value:
+            return None
+
+        if method != 'pin':
+            # Colonne unique: la requête passe par son index
+            return Employee.query.filter(
+                getattr(Employee, field) == value,
+                Employee.is_active == True
+            ).first()
+
+        value = hash_pin(value)
+        employee_id = self._get_pins().get(value)
+
+        if employee_id is not None:
+            employee = db.session.get(Employee, employee_id)
+            if employee and employee.is_active and employee.pin_code == value:
+                return employee
+            # L'index n'est plus à jour (modification dans un autre processus)
+            self.invalidate()
+
+        employee = Employee.query.filter(
+            Employee.pin_code == value,
+            Employee.is_active == True
+        ).first()
+
+        if employee is not None:
+            # PIN créé depuis la construction de l'index
+            self.invalidate()
+
+        return employee
+
+    def invalidate(self):
+        """Forcer la reconstruction de l'index au prochain badgage"""
+        with self._lock:
+            self._pins = None
+
+    def _get_pins(self):
+        pins = self._pins
+        if pins is not None and time.monotonic() - self._built_at < self.ttl:
+            return pins
+
+        with self._lock:
+            if self._pins is None or time.monotonic() - self._built_at >= self.ttl:
+                self._pins = self._build()
+                self._built_at = time.monotonic()
+            return self._pins
+
+    def _build(self):
+        """Construire l'index en une seule requête"""
+        rows = db.session.query(Employee.id, Employee.pin_code).filter(
+            Employee.is_active == True,
+            Employee.pin_code.isnot(None)
+        ).all()
+
+        pins = {row.pin_code: row.id for row in rows if row.pin_code}
+
+        logger.debug(f"Index des PIN de badgage construit ({len(pins)} employés)")
+        return pins
+
+
+# Instance globale
+credential_index = CredentialIndex()
+
+
+# Invalidation après tout commit créant, modifiant ou supprimant un employé
+@event.listens_for(Employee, 'after_insert')
+@event.listens_for(Employee, 'after_update')
+@event.listens_for(Employee, 'after_delete')
+def _mark_credentials_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info['credentials_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_credentials(session):
+    if session.info.pop('credentials_changed', False):
+        credential_index.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_credentials_change(session):
+    session.info.pop('credentials_changed', None)
@@ -0,0 +1,139 @@
+"""
+Calendrier des jours ouvrés (week-ends et jours fériés nationaux/cantonaux)
+
+Les tables annuelles sont vidées après tout commit modifiant un jour férié
+(un jour récurrent concerne toutes les années) et expirent après
+CALENDAR_CACHE_TTL secondes pour borner le décalage entre processus.
+"""
+
+from app.models import Holiday
+from datetime import date
+from sqlalchemy import and_, or_, event
+from sqlalchemy.orm import Session
+import numpy as np
+import threading
+import time
+
+CALENDAR_CACHE_TTL = 300  # secondes, borne le décalage entre processus
+
+
+class BusinessCalendar:
+    """Calendrier des jours ouvrés avec cache annuel par canton
+
+    Pour chaque (année, canton), un tableau de sommes cumulées des jours
+    ouvrés est calculé une fois avec numpy.is_busday; le nombre de jours
+    ouvrés entre deux dates se lit ensuite par différence de deux cases.
+    """
+
+    WEEKMASK = '1111100'  # Lundi à vendredi
+
+    def __init__(self, ttl=CALENDAR_CACHE_TTL):
+        self.ttl = ttl
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def working_days(self, start_date, end_date, canton=None):
+        """Nombre de jours ouvrés entre deux dates (bornes incluses)"""
+        if not start_date or not end_date or start_date > end_date:
+            return 0
+
+        total = 0
+        for year in range(start_date.year, end_date.year + 1):
+            cumulative = self._year_table(year, canton)
+            year_start = date(year, 1, 1)
+            first = (max(start_date, year_start) - year_start).days
+            last = (min(end_date, date(year, 12, 31)) - year_start).days
+            total += int(cumulative[last + 1] - cumulative[first])
+
+        return total
+
+    def is_working_day(self, day, canton=None):
+        """Vérifier si une date est un jour ouvré"""
+        cumulative = self._year_table(day.year, canton)
+        offset = (day - date(day.year, 1, 1)).days
+        return bool(cumulative[offset + 1] - cumulative[offset])
+
+    def holidays(self, year, canton=None):
+        """Jours fériés applicables pour une année (nationaux + canton)"""
+        query = Holiday.query.filter(
+            or_(
+                Holiday.is_recurring == True,
+                and_(
+                    Holiday.date >= date(year, 1, 1),
+                    Holiday.date <= date(year, 12, 31)
+                )
+            )
+        )
+
+        if canton:
+            query = query.filter(or_(Holiday.canton == None, Holiday.canton == canton))
+        else:
+            query = query.filter(Holiday.canton == None)
+
+        days = set()
+        for holiday in query.all():
+            if holiday.date.year == year:
+                days.add(holiday.date)
+            elif holiday.is_recurring:
+                # Jour fixe repris chaque année (le 29 février est ignoré)
+                try:
+                    days.add(holiday.date.replace(year=year))
+                except ValueError:
+                    pass
+
+        return sorted(days)
+
+    def invalidate(self, year=None):
+        """Vider le cache (par exemple après modification des jours fériés)"""
+        with self._lock:
+            if year is None:
+                self._tables.clear()
+            else:
+                for key in [k for k in self._tables if k[0] == year]:
+                    del self._tables[key]
+
+    def _year_table(self, year, canton):
+        """Sommes cumulées des jours ouvrés de l'année (len = nb jours + 1)"""
+        key = (year, canton)
+        entry = self._tables.get(key)
+        if entry is not None and time.monotonic() - entry[1] < self.ttl:
+            return entry[0]
+
+        days = np.arange(
+            np.datetime64(date(year, 1, 1)),
+            np.datetime64(date(year + 1, 1, 1)),
+            dtype='datetime64[D]'
+        )
+        holidays = np.array(self.holidays(year, canton), dtype='datetime64[D]')
+        is_open = np.is_busday(days, weekmask=self.WEEKMASK, holidays=holidays)
+        table = np.concatenate(([0], np.cumsum(is_open, dtype=np.int32)))
+
+        with self._lock:
+            self._tables[key] = (table, time.monotonic())
+
+        return table
+
+
+# Instance globale
+business_calendar = BusinessCalendar()
+
+
+# Invalidation après tout commit créant, modifiant ou supprimant un jour férié
+@event.listens_for(Holiday, 'after_insert')
+@event.listens_for(Holiday, 'after_update')
+@event.listens_for(Holiday, 'after_delete')
+def _mark_holidays_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info['holidays_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_calendar(session):
+    if session.info.pop('holidays_changed', False):
+        business_calendar.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_holidays_change(session):
+    session.info.pop('holidays_changed', None)
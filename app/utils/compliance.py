@@ -7,6 +7,7 @@ from app.models import (Employee, Attendance, Leave, Payroll, WorkTimeRegulation
                        AuditLog, CompanyDashboard, Notification)
 from datetime import datetime, date, timedelta
 from sqlalchemy import and_, or_, func
+from sqlalchemy.orm import joinedload, aliased
 import calendar
 from decimal import Decimal
 
@@ -51,16 +52,7 @@ class ComplianceChecker:
         ).all()
         
         for att in overtime_attendances:
-            self.violations.append({
-                'type': 'daily_overtime',
-                'employee_id': att.employee_id,
-                'employee_name': att.employee.full_name,
-                'date': att.date,
-                'hours': att.total_hours,
-                'limit': self.SWISS_LABOR_LAWS['max_daily_hours'],
-                'severity': 'high',
-                'message': f"{att.employee.full_name} a travaillé {att.total_hours}h le {att.date.strftime('%d/%m/%Y')} (max: {self.SWISS_LABOR_LAWS['max_daily_hours']}h)"
-            })
+            self.violations.append(self._daily_overtime_entry(att, att.employee.full_name))
         
         # Vérifier les pauses obligatoires
         long_shifts = Attendance.query.filter(
@@ -71,19 +63,9 @@ class ComplianceChecker:
         ).all()
         
         for att in long_shifts:
-            if att.check_out_lunch and att.check_in_afternoon:
-                break_duration = (att.check_in_afternoon - att.check_out_lunch).total_seconds() / 60
-                if break_duration < self.SWISS_LABOR_LAWS['min_break_duration']:
-                    self.warnings.append({
-                        'type': 'insufficient_break',
-                        'employee_id': att.employee_id,
-                        'employee_name': att.employee.full_name,
-                        'date': att.date,
-                        'break_duration': break_duration,
-                        'required': self.SWISS_LABOR_LAWS['min_break_duration'],
-                        'severity': 'medium',
-                        'message': f"{att.employee.full_name} n'a pris que {break_duration:.0f} min de pause (min: {self.SWISS_LABOR_LAWS['min_break_duration']} min)"
-                    })
+            warning = self._break_entry(att, att.employee.full_name)
+            if warning:
+                self.warnings.append(warning)
         
         # Vérifier le travail de nuit
         night_start, night_end = self.SWISS_LABOR_LAWS['night_work_hours']
@@ -98,14 +80,7 @@ class ComplianceChecker:
         ).all()
         
         for att in night_work:
-            self.warnings.append({
-                'type': 'night_work',
-                'employee_id': att.employee_id,
-                'employee_name': att.employee.full_name,
-                'date': att.date,
-                'severity': 'low',
-                'message': f"{att.employee.full_name} a effectué du travail de nuit le {att.date.strftime('%d/%m/%Y')}"
-            })
+            self.warnings.append(self._night_work_entry(att, att.employee.full_name))
         
         # Vérifier le repos minimum entre deux jours
         self._check_daily_rest(date_to_check)
@@ -116,6 +91,72 @@ class ComplianceChecker:
             'compliant': len(self.violations) == 0
         }
     
+    def check_range_compliance(self, start_date, end_date):
+        """Vérifier la conformité journalière sur une période en un seul passage
+        
+        Les pointages de la période (élargie aux semaines entières et au
+        lendemain) sont chargés une fois, triés par employé et par date,
+        puis évalués en flux: heures journalières, pauses, travail de nuit,
+        repos entre deux jours et repos hebdomadaire.
+        """
+        self.violations = []
+        self.warnings = []
+        
+        load_start, load_end = self._weekly_rest_window(start_date, end_date)
+        rows = self._load_attendance_rows(load_start, load_end)
+        names = self._employee_names(load_start, load_end)
+        
+        previous = None
+        intervals = []
+        
+        for att in rows:
+            name = names.get(att.employee_id, str(att.employee_id))
+            
+            if previous is not None and previous.employee_id != att.employee_id:
+                self._check_employee_weekly_rest(
+                    previous.employee_id, names.get(previous.employee_id, str(previous.employee_id)),
+                    intervals, start_date, end_date
+                )
+                previous = None
+                intervals = []
+            
+            intervals.extend(self._work_intervals(att))
+            
+            # Repos entre la veille et ce jour
+            if previous is not None and start_date <= previous.date <= end_date:
+                violation = self._daily_rest_entry(previous, att, name)
+                if violation:
+                    self.violations.append(violation)
+            
+            previous = att
+            
+            # Les jours hors période ne servent qu'aux repos
+            if att.date < start_date or att.date > end_date:
+                continue
+            
+            if (att.total_hours or 0) > self.SWISS_LABOR_LAWS['max_daily_hours']:
+                self.violations.append(self._daily_overtime_entry(att, name))
+            
+            if (att.total_hours or 0) > self.SWISS_LABOR_LAWS['break_after_hours']:
+                warning = self._break_entry(att, name)
+                if warning:
+                    self.warnings.append(warning)
+            
+            if self._is_night_work(att):
+                self.warnings.append(self._night_work_entry(att, name))
+        
+        if previous is not None:
+            self._check_employee_weekly_rest(
+                previous.employee_id, names.get(previous.employee_id, str(previous.employee_id)),
+                intervals, start_date, end_date
+            )
+        
+        return {
+            'violations': self.violations,
+            'warnings': self.warnings,
+            'compliant': len(self.violations) == 0
+        }
+    
     def check_weekly_compliance(self, week_start=None):
         """Vérifier la conformité hebdomadaire"""
         if not week_start:
@@ -213,6 +254,9 @@ class ComplianceChecker:
                     'message': f"{emp.full_name} a accumulé {overtime:.1f}h supplémentaires en {year} (max: {self.SWISS_LABOR_LAWS['max_overtime_annual']}h)"
                 })
         
+        # Vérifier le repos hebdomadaire sur toutes les semaines de l'année
+        self._check_weekly_rest(year_start, year_end)
+        
         # Vérifier les congés minimums
         self._check_vacation_compliance(year)
         
@@ -276,15 +320,9 @@ class ComplianceChecker:
         }
         
         # Analyser toutes les violations sur la période
-        current = start_date
-        all_violations = []
-        all_warnings = []
-        
-        while current <= end_date:
-            daily_check = self.check_daily_compliance(current)
-            all_violations.extend(daily_check['violations'])
-            all_warnings.extend(daily_check['warnings'])
-            current += timedelta(days=1)
+        range_check = self.check_range_compliance(start_date, end_date)
+        all_violations = range_check['violations']
+        all_warnings = range_check['warnings']
         
         # Résumer par type
         for violation in all_violations:
@@ -305,23 +343,23 @@ class ComplianceChecker:
         
         # Identifier les employés à risque
         employee_violations = {}
+        employee_names = {}
         for violation in all_violations:
             emp_id = violation['employee_id']
             if emp_id not in employee_violations:
                 employee_violations[emp_id] = 0
             employee_violations[emp_id] += 1
+            employee_names[emp_id] = violation['employee_name']
         
         # Top 5 des employés avec le plus de violations
         sorted_employees = sorted(employee_violations.items(), key=lambda x: x[1], reverse=True)[:5]
         
         for emp_id, count in sorted_employees:
-            employee = Employee.query.get(emp_id)
-            if employee:
-                report['employees_at_risk'].append({
-                    'employee_id': emp_id,
-                    'name': employee.full_name,
-                    'violations': count
-                })
+            report['employees_at_risk'].append({
+                'employee_id': emp_id,
+                'name': employee_names[emp_id],
+                'violations': count
+            })
         
         # Calculer le taux de conformité
         total_days = (end_date - start_date).days + 1
@@ -376,59 +414,276 @@ class ComplianceChecker:
             return False
     
     def _check_daily_rest(self, check_date):
-        """Vérifier le repos minimum entre deux jours de travail"""
+        """Vérifier le repos minimum entre deux jours de travail
+        
+        Une seule auto-jointure sur les pointages retourne les couples
+        (jour, lendemain) du même employé, avec l'employé et son
+        utilisateur chargés dans la même requête.
+        """
         next_day = check_date + timedelta(days=1)
+        next_attendance = aliased(Attendance)
+        
+        # Employés ayant travaillé deux jours consécutifs
+        pairs = db.session.query(
+            Attendance,
+            next_attendance,
+            Employee
+        ).join(
+            next_attendance,
+            and_(
+                next_attendance.employee_id == Attendance.employee_id,
+                next_attendance.date == next_day
+            )
+        ).join(
+            Employee, Employee.id == Attendance.employee_id
+        ).options(
+            joinedload(Employee.user)
+        ).filter(
+            and_(
+                Attendance.date == check_date,
+                Attendance.check_out_evening != None,
+                next_attendance.check_in_morning != None
+            )
+        ).all()
         
-        # Trouver les employés qui ont travaillé deux jours consécutifs
-        today_attendance = Attendance.query.filter_by(date=check_date).all()
-        
-        for att in today_attendance:
-            if att.check_out_evening:
-                # Vérifier s'il y a un pointage le lendemain
-                next_attendance = Attendance.query.filter_by(
-                    employee_id=att.employee_id,
-                    date=next_day
-                ).first()
-                
-                if next_attendance and next_attendance.check_in_morning:
-                    # Calculer le temps de repos
-                    rest_hours = (next_attendance.check_in_morning - att.check_out_evening).total_seconds() / 3600
-                    
-                    if rest_hours < self.SWISS_LABOR_LAWS['min_daily_rest']:
-                        self.violations.append({
-                            'type': 'insufficient_daily_rest',
-                            'employee_id': att.employee_id,
-                            'employee_name': att.employee.full_name,
-                            'date': check_date,
-                            'rest_hours': rest_hours,
-                            'required': self.SWISS_LABOR_LAWS['min_daily_rest'],
-                            'severity': 'high',
-                            'message': f"{att.employee.full_name} n'a eu que {rest_hours:.1f}h de repos entre deux jours (min: {self.SWISS_LABOR_LAWS['min_daily_rest']}h)"
-                        })
+        # Le calcul de durée reste en Python pour rester portable (MySQL/PostgreSQL/SQLite)
+        for att, next_att, employee in pairs:
+            violation = self._daily_rest_entry(att, next_att, employee.full_name)
+            if violation:
+                self.violations.append(violation)
     
     def _check_weekly_rest(self, week_start, week_end):
-        """Vérifier le repos hebdomadaire minimum"""
-        # Pour chaque employé, vérifier s'il a eu 35h consécutives de repos
-        employees = Employee.query.filter_by(is_active=True).all()
+        """Vérifier le repos hebdomadaire minimum (35h consécutives)
+        
+        Accepte une période de plusieurs semaines: tous les pointages sont
+        chargés en une requête triée, puis chaque employé est traité à la
+        suite (audit annuel compris).
+        """
+        load_start, load_end = self._weekly_rest_window(week_start, week_end)
+        rows = self._load_attendance_rows(load_start, load_end)
+        names = self._employee_names(load_start, load_end)
+        
+        employee_id = None
+        intervals = []
+        
+        for att in rows:
+            if att.employee_id != employee_id:
+                if employee_id is not None:
+                    self._check_employee_weekly_rest(
+                        employee_id, names.get(employee_id, str(employee_id)),
+                        intervals, week_start, week_end
+                    )
+                employee_id = att.employee_id
+                intervals = []
+            
+            intervals.extend(self._work_intervals(att))
         
-        for emp in employees:
-            attendances = Attendance.query.filter(
-                and_(
-                    Attendance.employee_id == emp.id,
-                    Attendance.date >= week_start,
-                    Attendance.date <= week_end
-                )
-            ).order_by(Attendance.date).all()
+        if employee_id is not None:
+            self._check_employee_weekly_rest(
+                employee_id, names.get(employee_id, str(employee_id)),
+                intervals, week_start, week_end
+            )
+    
+    def _weekly_rest_window(self, start_date, end_date):
+        """Période à charger: semaines entières plus un jour de chaque côté"""
+        first_week = start_date - timedelta(days=start_date.weekday())
+        last_week = end_date - timedelta(days=end_date.weekday())
+        return first_week - timedelta(days=1), last_week + timedelta(days=7)
+    
+    def _load_attendance_rows(self, start_date, end_date):
+        """Colonnes de pointage d'une période, triées par employé et date"""
+        return db.session.query(
+            Attendance.employee_id,
+            Attendance.date,
+            Attendance.check_in_morning,
+            Attendance.check_out_lunch,
+            Attendance.check_in_afternoon,
+            Attendance.check_out_evening,
+            Attendance.total_hours
+        ).filter(
+            and_(
+                Attendance.date >= start_date,
+                Attendance.date <= end_date
+            )
+        ).order_by(
+            Attendance.employee_id, Attendance.date
+        ).yield_per(1000)
+    
+    def _work_intervals(self, att):
+        """Intervalles travaillés d'un pointage à partir des quatre horodatages
+        
+        Un pointage sans sortie correspondante est gardé comme un instant,
+        pour couper la période de repos qui l'entoure.
+        """
+        intervals = []
+        covered = set()
+        
+        if att.check_in_morning and att.check_out_lunch:
+            intervals.append((att.check_in_morning, att.check_out_lunch))
+            covered.update((att.check_in_morning, att.check_out_lunch))
+        
+        if att.check_in_afternoon and att.check_out_evening:
+            intervals.append((att.check_in_afternoon, att.check_out_evening))
+            covered.update((att.check_in_afternoon, att.check_out_evening))
+        elif att.check_in_morning and att.check_out_evening and not att.check_out_lunch:
+            # Journée continue sans pause de midi pointée
+            intervals.append((att.check_in_morning, att.check_out_evening))
+            covered.update((att.check_in_morning, att.check_out_evening))
+        
+        for moment in (att.check_in_morning, att.check_out_lunch,
+                       att.check_in_afternoon, att.check_out_evening):
+            if moment and moment not in covered:
+                intervals.append((moment, moment))
+        
+        return intervals
+    
+    def _check_employee_weekly_rest(self, employee_id, name, intervals, start_date, end_date):
+        """Plus long repos consécutif de chaque semaine de la période"""
+        load_start, load_end = self._weekly_rest_window(start_date, end_date)
+        timeline_start = datetime.combine(load_start, datetime.min.time())
+        timeline_end = datetime.combine(load_end + timedelta(days=1), datetime.min.time())
+        
+        # Fusionner les intervalles travaillés triés
+        merged = []
+        for begin, end in sorted(intervals):
+            if merged and begin <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([begin, end])
+        
+        # Périodes de repos entre deux intervalles travaillés
+        gaps = []
+        rest_start = timeline_start
+        for begin, end in merged:
+            gaps.append((rest_start, begin))
+            rest_start = end
+        gaps.append((rest_start, timeline_end))
+        
+        required = self.SWISS_LABOR_LAWS['min_weekly_rest']
+        week_start = start_date - timedelta(days=start_date.weekday())
+        index = 0
+        
+        while week_start <= end_date:
+            week_begin = datetime.combine(week_start, datetime.min.time())
+            week_end = week_begin + timedelta(days=7)
             
-            if len(attendances) >= 6:  # Travaillé au moins 6 jours
-                self.warnings.append({
-                    'type': 'insufficient_weekly_rest',
-                    'employee_id': emp.id,
-                    'employee_name': emp.full_name,
-                    'week': week_start.strftime('%d/%m/%Y'),
-                    'severity': 'medium',
-                    'message': f"{emp.full_name} pourrait ne pas avoir eu 35h de repos consécutives cette semaine"
-                })
+            # Les repos sont triés et disjoints: avancer sans revenir en arrière
+            while index < len(gaps) and gaps[index][1] <= week_begin:
+                index += 1
+            
+            longest = 0
+            position = index
+            while position < len(gaps) and gaps[position][0] < week_end:
+                longest = max(longest, (gaps[position][1] - gaps[position][0]).total_seconds() / 3600)
+                position += 1
+            
+            if longest < required:
+                self.warnings.append(self._weekly_rest_entry(employee_id, name, week_start, longest))
+            
+            week_start += timedelta(days=7)
+    
+    def _employee_names(self, start_date, end_date):
+        """Noms des employés ayant pointé sur la période (une seule requête)"""
+        employees = Employee.query.options(
+            joinedload(Employee.user)
+        ).filter(
+            Employee.id.in_(
+                db.session.query(Attendance.employee_id).filter(
+                    and_(
+                        Attendance.date >= start_date,
+                        Attendance.date <= end_date + timedelta(days=1)
+                    )
+                )
+            )
+        ).all()
+        return {emp.id: emp.full_name for emp in employees}
+    
+    def _is_night_work(self, att):
+        """Pointage commencé avant 6h ou terminé après 23h"""
+        night_start, night_end = self.SWISS_LABOR_LAWS['night_work_hours']
+        return bool(
+            (att.check_in_morning and att.check_in_morning.hour < night_end) or
+            (att.check_out_evening and att.check_out_evening.hour >= night_start)
+        )
+    
+    def _daily_overtime_entry(self, att, name):
+        """Violation: dépassement de la durée journalière maximale"""
+        return {
+            'type': 'daily_overtime',
+            'employee_id': att.employee_id,
+            'employee_name': name,
+            'date': att.date,
+            'hours': att.total_hours,
+            'limit': self.SWISS_LABOR_LAWS['max_daily_hours'],
+            'severity': 'high',
+            'message': f"{name} a travaillé {att.total_hours}h le {att.date.strftime('%d/%m/%Y')} (max: {self.SWISS_LABOR_LAWS['max_daily_hours']}h)"
+        }
+    
+    def _break_entry(self, att, name):
+        """Avertissement: pause de midi trop courte (None si conforme)"""
+        if not (att.check_out_lunch and att.check_in_afternoon):
+            return None
+        
+        break_duration = (att.check_in_afternoon - att.check_out_lunch).total_seconds() / 60
+        if break_duration >= self.SWISS_LABOR_LAWS['min_break_duration']:
+            return None
+        
+        return {
+            'type': 'insufficient_break',
+            'employee_id': att.employee_id,
+            'employee_name': name,
+            'date': att.date,
+            'break_duration': break_duration,
+            'required': self.SWISS_LABOR_LAWS['min_break_duration'],
+            'severity': 'medium',
+            'message': f"{name} n'a pris que {break_duration:.0f} min de pause (min: {self.SWISS_LABOR_LAWS['min_break_duration']} min)"
+        }
+    
+    def _night_work_entry(self, att, name):
+        """Avertissement: travail de nuit"""
+        return {
+            'type': 'night_work',
+            'employee_id': att.employee_id,
+            'employee_name': name,
+            'date': att.date,
+            'severity': 'low',
+            'message': f"{name} a effectué du travail de nuit le {att.date.strftime('%d/%m/%Y')}"
+        }
+    
+    def _daily_rest_entry(self, att, next_att, name):
+        """Violation: repos insuffisant entre deux jours (None si conforme)"""
+        if next_att.date != att.date + timedelta(days=1):
+            return None
+        if not (att.check_out_evening and next_att.check_in_morning):
+            return None
+        
+        rest_hours = (next_att.check_in_morning - att.check_out_evening).total_seconds() / 3600
+        if rest_hours >= self.SWISS_LABOR_LAWS['min_daily_rest']:
+            return None
+        
+        return {
+            'type': 'insufficient_daily_rest',
+            'employee_id': att.employee_id,
+            'employee_name': name,
+            'date': att.date,
+            'rest_hours': rest_hours,
+            'required': self.SWISS_LABOR_LAWS['min_daily_rest'],
+            'severity': 'high',
+            'message': f"{name} n'a eu que {rest_hours:.1f}h de repos entre deux jours (min: {self.SWISS_LABOR_LAWS['min_daily_rest']}h)"
+        }
+    
+    def _weekly_rest_entry(self, employee_id, name, week_start, rest_hours):
+        """Avertissement: repos hebdomadaire insuffisant"""
+        return {
+            'type': 'insufficient_weekly_rest',
+            'employee_id': employee_id,
+            'employee_name': name,
+            'week': week_start.strftime('%d/%m/%Y'),
+            'rest_hours': round(rest_hours, 1),
+            'required': self.SWISS_LABOR_LAWS['min_weekly_rest'],
+            'severity': 'medium',
+            'message': f"{name} n'a eu que {rest_hours:.1f}h de repos consécutives la semaine du {week_start.strftime('%d/%m/%Y')} (min: {self.SWISS_LABOR_LAWS['min_weekly_rest']}h)"
+        }
     
     def _check_vacation_compliance(self, year):
         """Vérifier le respect des congés minimums"""
@@ -528,16 +783,14 @@ class ComplianceChecker:
         """Notifier les admins des actions critiques"""
         from app.utils.notifications import notification_service
         
-        admins = User.query.filter_by(role='admin').all()
-        for admin in admins:
-            notification_service.send_notification(
-                user_id=admin.id,
-                title="Action critique détectée",
-                message=f"{audit.user.full_name if audit.user else 'Système'} a effectué: {audit.description}",
-                type='error',
-                category='security',
-                priority='urgent'
-            )
+        notification_service.send_bulk(
+            roles=['admin'],
+            title="Action critique détectée",
+            message=f"{audit.user.full_name if audit.user else 'Système'} a effectué: {audit.description}",
+            type='error',
+            category='security',
+            priority='urgent'
+        )
 
 
 # Instance globale
@@ -0,0 +1,365 @@
+"""
+Mise à jour incrémentale du tableau de bord de l'entreprise (CompanyDashboard)
+
+Les pointages, notes de frais et congés écrits par l'ORM produisent des
+variations (présents, heures, coût de main d'œuvre, dépenses, congés,
+approbations en attente). Après le commit, elles sont cumulées dans le
+processus puis appliquées toutes les DASHBOARD_FLUSH_INTERVAL secondes par un
+UPDATE `colonne = colonne + delta` dans une transaction courte: les pointages
+d'une prise de poste n'attendent plus le verrou de la ligne du jour, et une
+transaction annulée n'y contribue pas.
+
+Le recalcul complet (reconcile) sert à la réconciliation périodique (tâche
+planifiée), à la création de la ligne d'un jour et aux métriques sans
+variation (effectif, projets actifs, alertes de conformité). Il corrige
+aussi les écarts que les variations ne voient pas:
+- écritures en masse sans événement ORM (UPDATE/INSERT en masse, comme
+  ExpensePolicyEngine.revalidate_month): l'appelant lance reconcile() après
+  son commit;
+- variations perdues à l'arrêt brutal d'un processus, ou appliquées après un
+  recalcul qui les comptait déjà (fenêtre de DASHBOARD_FLUSH_INTERVAL).
+La lecture du tableau de bord se limite ainsi à une ligne.
+"""
+
+from app import db
+from app.models import CompanyDashboard, Employee, Attendance, Expense, Leave, Project
+from app.utils.labor_cost import labor_cost_service, attendance_labor_cost
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+from flask import current_app, has_app_context
+from collections import defaultdict
+from datetime import datetime, date
+from decimal import Decimal
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_FLUSH_INTERVAL = 5  # secondes entre deux applications des variations
+
+
+def serialize_dashboard(dashboard):
+    """Représentation JSON du tableau de bord (API et flux temps réel)"""
+    labor_cost = float(dashboard.labor_cost_today or 0)
+    expense_cost = float(dashboard.expense_cost_today or 0)
+
+    return {
+        'date': dashboard.date.strftime('%d/%m/%Y'),
+        'employees': {
+            'total': dashboard.total_employees,
+            'present': dashboard.present_today,
+            'absent': dashboard.absent_today,
+            'on_leave': dashboard.on_leave
+        },
+        'hours': {
+            'total': dashboard.total_hours_today,
+            'overtime': dashboard.overtime_hours_today
+        },
+        'costs': {
+            'labor': labor_cost,
+            'expenses': expense_cost,
+            'total': labor_cost + expense_cost
+        },
+        'projects': {
+            'active': dashboard.active_projects
+        },
+        'alerts': {
+            'pending_approvals': dashboard.pending_approvals,
+            'compliance': dashboard.compliance_alerts
+        }
+    }
+
+
+class DashboardUpdater:
+    """Variations et réconciliation des lignes de company_dashboard"""
+
+    def __init__(self):
+        self._engine = None
+        self._deltas = defaultdict(lambda: defaultdict(int))
+        self._labor = []
+        self._lock = threading.Lock()
+        self._timer = None
+        self._exit_hook = False
+
+    def get(self, day=None):
+        """Ligne du jour (recalculée seulement si elle n'existe pas encore)"""
+        day = day or date.today()
+        dashboard = CompanyDashboard.query.filter_by(date=day).first()
+        if dashboard is None:
+            dashboard = self.reconcile(day)
+        return dashboard
+
+    def reconcile(self, day=None):
+        """Recalculer entièrement la ligne d'un jour et la commiter"""
+        from app.views.dashboard import check_compliance_issues
+
+        day = day or date.today()
+
+        # Variations du processus déjà commitées: comptées par le recalcul
+        self.flush()
+
+        total_employees = Employee.query.filter_by(is_active=True).count()
+
+        present = db.session.query(func.count(Attendance.id)).filter(
+            Attendance.date == day,
+            Attendance.check_in_morning != None
+        ).scalar() or 0
+
+        hours, overtime = db.session.query(
+            func.coalesce(func.sum(Attendance.total_hours), 0),
+            func.coalesce(func.sum(Attendance.overtime_hours), 0)
+        ).filter(Attendance.date == day).one()
+
+        on_leave = Leave.query.filter(
+            Leave.start_date <= day,
+            Leave.end_date >= day,
+            Leave.status == 'approved'
+        ).count()
+
+        expense_cost = db.session.query(func.sum(Expense.total_amount)).filter(
+            Expense.expense_date == day,
+            Expense.payment_status == 'approved'
+        ).scalar() or 0
+
+        pending_expenses = Expense.query.filter_by(payment_status='pending').count()
+        pending_leaves = Leave.query.filter_by(status='pending').count()
+
+        dashboard = CompanyDashboard.query.filter_by(date=day).first()
+        if not dashboard:
+            dashboard = CompanyDashboard(date=day)
+            db.session.add(dashboard)
+
+        dashboard.total_employees = total_employees
+        dashboard.present_today = present
+        dashboard.absent_today = total_employees - present - on_leave
+        dashboard.on_leave = on_leave
+        dashboard.total_hours_today = float(hours)
+        dashboard.overtime_hours_today = float(overtime)
+        dashboard.labor_cost_today = labor_cost_service.total(day, day)['total_cost']
+        dashboard.expense_cost_today = Decimal(str(expense_cost))
+        dashboard.active_projects = Project.query.filter_by(status='active').count()
+        dashboard.pending_approvals = pending_expenses + pending_leaves
+        if day == date.today():
+            dashboard.compliance_alerts = check_compliance_issues()
+        dashboard.last_updated = datetime.utcnow()
+
+        db.session.commit()
+        return dashboard
+
+    def prepare(self, day):
+        """Créer à l'avance la ligne d'un jour pour que les variations s'y appliquent"""
+        if not db.session.query(CompanyDashboard.id).filter_by(date=day).first():
+            self.reconcile(day)
+
+    def defer(self, engine, deltas, labor, interval=DASHBOARD_FLUSH_INTERVAL):
+        """Cumuler les variations d'un commit, appliquées par flush() dans `interval` secondes"""
+        with self._lock:
+            self._engine = engine
+            for day, changes in deltas.items():
+                for column, value in changes.items():
+                    self._deltas[day][column] += value
+            self._labor.extend(labor)
+
+            if self._timer is None:
+                self._timer = threading.Timer(interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+                if not self._exit_hook:
+                    atexit.register(self.flush)
+                    self._exit_hook = True
+
+    def flush(self):
+        """Appliquer les variations cumulées en une transaction courte"""
+        with self._lock:
+            engine, deltas, labor = self._engine, self._deltas, self._labor
+            self._deltas = defaultdict(lambda: defaultdict(int))
+            self._labor = []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        if engine is None or not (deltas or labor):
+            return
+
+        try:
+            with engine.begin() as connection:
+                self.apply(connection, deltas, labor)
+        except Exception as e:
+            logger.error(f"Erreur application des variations du tableau de bord: {e}")
+
+    def apply(self, connection, deltas, labor):
+        """Appliquer des variations cumulées sur une connexion
+
+        `deltas` est {jour: {colonne: variation}}, `labor` la liste des
+        (jour, employee_id, heures, signe) dont le coût dépend du taux horaire.
+        Un jour sans ligne est ignoré: la réconciliation le calculera.
+        """
+        if labor:
+            employee_ids = {employee_id for _, employee_id, _, _ in labor}
+            rates = dict(connection.execute(
+                select(Employee.id, Employee.hourly_rate).where(Employee.id.in_(employee_ids))
+            ).all())
+
+            for day, employee_id, hours, sign in labor:
+                cost = attendance_labor_cost(hours, rates.get(employee_id))
+                if cost:
+                    deltas[day]['labor_cost_today'] += sign * cost
+
+        table = CompanyDashboard.__table__
+        now = datetime.utcnow()
+
+        for day, changes in deltas.items():
+            changes = {column: value for column, value in changes.items() if value}
+            if not changes:
+                continue
+
+            values = {
+                column: func.coalesce(table.c[column], 0) + value
+                for column, value in changes.items()
+            }
+            connection.execute(
+                table.update().where(table.c.date == day).values(last_updated=now, **values)
+            )
+
+
+# Instance globale
+dashboard_updater = DashboardUpdater()
+
+
+# Contributions de chaque enregistrement au tableau de bord. `value(attr)`
+# retourne la valeur avant ou après le flush.
+def _previous_value(target):
+    state = inspect(target)
+
+    def value(attr):
+        history = state.attrs[attr].history
+        if history.deleted:
+            return history.deleted[0]
+        if history.added:
+            return None
+        return getattr(target, attr)
+
+    return value
+
+
+def _current_value(target):
+    return lambda attr: getattr(target, attr)
+
+
+def _attendance_contribution(value, deltas, labor, sign):
+    day = value('date')
+    if day is None:
+        return
+
+    present = 1 if value('check_in_morning') is not None else 0
+    changes = deltas[day]
+    changes['present_today'] += sign * present
+    changes['absent_today'] -= sign * present
+    changes['total_hours_today'] += sign * float(value('total_hours') or 0)
+    changes['overtime_hours_today'] += sign * float(value('overtime_hours') or 0)
+
+    if value('total_hours'):
+        labor.append((day, value('employee_id'), value('total_hours'), sign))
+
+
+def _expense_contribution(value, deltas, labor, sign):
+    status = value('payment_status')
+
+    if status == 'approved' and value('expense_date') is not None:
+        amount = Decimal(str(value('total_amount') or 0))
+        deltas[value('expense_date')]['expense_cost_today'] += sign * amount
+
+    if status == 'pending':
+        deltas[date.today()]['pending_approvals'] += sign
+
+
+def _leave_contribution(value, deltas, labor, sign):
+    today = date.today()
+    status = value('status')
+
+    if status == 'pending':
+        deltas[today]['pending_approvals'] += sign
+
+    if status == 'approved' and value('start_date') and value('end_date') \
+            and value('start_date') <= today <= value('end_date'):
+        deltas[today]['on_leave'] += sign
+        deltas[today]['absent_today'] -= sign
+
+
+_CONTRIBUTIONS = {
+    Attendance: _attendance_contribution,
+    Expense: _expense_contribution,
+    Leave: _leave_contribution,
+}
+
+# Attributs lus par les contributions: leur ancienne valeur est chargée avant
+# modification (active_history), même si l'objet a expiré après un commit
+_TRACKED_ATTRIBUTES = (
+    Attendance.employee_id, Attendance.date, Attendance.check_in_morning,
+    Attendance.total_hours, Attendance.overtime_hours,
+    Expense.expense_date, Expense.total_amount, Expense.payment_status,
+    Leave.start_date, Leave.end_date, Leave.status,
+)
+
+
+def _keep_previous(target, value, oldvalue, initiator):
+    pass
+
+
+for _attribute in _TRACKED_ATTRIBUTES:
+    event.listen(_attribute, 'set', _keep_previous, active_history=True)
+
+
+def _pending(target):
+    session = Session.object_session(target)
+    if session is None:
+        return None, None
+    deltas = session.info.setdefault('dashboard_deltas', defaultdict(lambda: defaultdict(int)))
+    labor = session.info.setdefault('dashboard_labor', [])
+    return deltas, labor
+
+
+@event.listens_for(Attendance, 'after_insert')
+@event.listens_for(Expense, 'after_insert')
+@event.listens_for(Leave, 'after_insert')
+def _record_insert(mapper, connection, target):
+    deltas, labor = _pending(target)
+    if deltas is not None:
+        _CONTRIBUTIONS[mapper.class_](_current_value(target), deltas, labor, 1)
+
+
+@event.listens_for(Attendance, 'after_update')
+@event.listens_for(Expense, 'after_update')
+@event.listens_for(Leave, 'after_update')
+def _record_update(mapper, connection, target):
+    deltas, labor = _pending(target)
+    if deltas is not None:
+        contribution = _CONTRIBUTIONS[mapper.class_]
+        contribution(_previous_value(target), deltas, labor, -1)
+        contribution(_current_value(target), deltas, labor, 1)
+
+
+@event.listens_for(Attendance, 'after_delete')
+@event.listens_for(Expense, 'after_delete')
+@event.listens_for(Leave, 'after_delete')
+def _record_delete(mapper, connection, target):
+    deltas, labor = _pending(target)
+    if deltas is not None:
+        _CONTRIBUTIONS[mapper.class_](_current_value(target), deltas, labor, -1)
+
+
+@event.listens_for(Session, 'after_commit')
+def _defer_dashboard_deltas(session):
+    deltas = session.info.pop('dashboard_deltas', None)
+    labor = session.info.pop('dashboard_labor', None)
+    if deltas or labor:
+        interval = current_app.config.get('DASHBOARD_FLUSH_INTERVAL', DASHBOARD_FLUSH_INTERVAL) \
+            if has_app_context() else DASHBOARD_FLUSH_INTERVAL
+        dashboard_updater.defer(session.get_bind(), deltas or {}, labor or [], interval)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_dashboard_deltas(session):
+    session.info.pop('dashboard_deltas', None)
+    session.info.pop('dashboard_labor', None)
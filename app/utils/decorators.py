@@ -2,8 +2,10 @@
 Décorateurs personnalisés pour l'application
 """
 from functools import wraps
-from flask import redirect, url_for, flash, request, jsonify
+from flask import redirect, url_for, flash, request, jsonify, make_response, current_app
 from flask_login import current_user
+from app import db
+from app.models import AuditLog
 
 def admin_required(f):
     """Décorateur pour restreindre l'accès aux administrateurs"""
@@ -50,4 +52,40 @@ def api_key_required(f):
             return jsonify({'error': 'Invalid API key'}), 401
         
         return f(*args, **kwargs)
-    return decorated_function
\ No newline at end of file
+    return decorated_function
+
+def log_action(action, category=None):
+    """Décorateur pour journaliser un appel dans l'audit trail
+    
+    La vue s'exécute normalement puis l'appel (utilisateur, IP, statut HTTP)
+    est enregistré dans AuditLog. Une erreur d'écriture du journal est
+    loggée sans modifier la réponse.
+    
+    L'entrée est écrite par un commit distinct de celui de la vue: réservé
+    aux actions peu fréquentes (approbations, soumissions). Les vues à fort
+    débit, comme le pointage, ajoutent leur AuditLog dans leur propre
+    transaction.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            response = make_response(f(*args, **kwargs))
+            
+            try:
+                db.session.add(AuditLog(
+                    user_id=current_user.id if current_user.is_authenticated else None,
+                    user_ip=request.remote_addr,
+                    user_agent=(request.user_agent.string or '')[:200],
+                    action=action,
+                    description=f"{request.method} {request.path} -> {response.status_code}",
+                    category=category,
+                    severity='warning' if response.status_code >= 400 else 'info'
+                ))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"Erreur journal d'audit ({action}): {e}")
+            
+            return response
+        return decorated_function
+    return decorator
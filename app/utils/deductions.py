@@ -0,0 +1,206 @@
+"""
+Déductions sociales suisses calculées par lot
+
+Les taux viennent du barème versionné (table deduction_rate_tables) en
+vigueur sur la période de paie, ou de DEFAULT_RATES si aucun barème n'est
+enregistré (taux forfaitaires sur le brut, identiques à l'ancien calcul de
+Payroll.calculate_deductions: les tranches d'âge LPP, le plafond AC et la
+déduction de coordination ne s'appliquent que via un barème enregistré).
+Pour un lot de salaires bruts, le barème est résolu une seule fois (tranches
+LPP triées, plafonds mensuels, taux par canton) puis toutes les déductions
+sont calculées en une passe, en Decimal arrondi au centime. Recalculer toute
+l'entreprise après un changement de barème revient à un appel à
+compute_batch (voir PayrollEngine.recalculate_deductions).
+
+Par employé:
+- AVS/AI/APG et LAA: pourcentage du brut;
+- AC: pourcentage du brut plafonné au salaire assuré maximal (ac_ceiling / 12);
+- LPP: taux de la tranche d'âge sur le salaire coordonné (brut moins la
+  déduction de coordination / 12), si le salaire annualisé atteint le seuil
+  d'entrée; clé 'default' des tranches si la date de naissance est inconnue
+  ou si le barème n'a pas de tranches;
+- impôt à la source: taux du canton, sinon taux par défaut.
+"""
+
+from app.models import DeductionRateTable
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from bisect import bisect_right
+from datetime import date
+from decimal import Decimal
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal('0.01')
+MONTHS = Decimal('12')
+
+RATE_TABLE_TTL = 300  # secondes, borne le décalage entre processus
+
+# Barème utilisé tant qu'aucune version n'est enregistrée (taux historiques)
+DEFAULT_RATES = {
+    'version': 'defaut',
+    'valid_from': date(2000, 1, 1),
+    'avs_rate': Decimal('0.0525'),
+    'ac_rate': Decimal('0.011'),
+    'ac_ceiling': None,
+    'laa_rate': Decimal('0.0081'),
+    'lpp_rates': {'default': Decimal('0.075')},
+    'lpp_entry_threshold': None,
+    'lpp_coordination': None,
+    'source_tax_rates': {},
+    'default_source_tax_rate': Decimal('0.10'),
+}
+
+
+def _decimal(value):
+    return Decimal(str(value)) if value is not None else None
+
+
+def age_at(birth_date, day):
+    """Âge en années révolues à une date"""
+    return day.year - birth_date.year - ((day.month, day.day) < (birth_date.month, birth_date.day))
+
+
+class DeductionCalculator:
+    """Calcul des déductions d'un lot de salaires bruts selon le barème en vigueur"""
+
+    def __init__(self, ttl=RATE_TABLE_TTL):
+        self.ttl = ttl
+        self._versions = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def rates_for(self, period):
+        """Barème (dict) applicable à une période: dernière version valide à cette date"""
+        versions = self._get_versions()
+        applicable = [rates for rates in versions if rates['valid_from'] <= period]
+        return applicable[-1] if applicable else DEFAULT_RATES
+
+    def compute(self, gross_salary, employee=None, period=None, other_deductions=None):
+        """Déductions et salaire net d'un seul salaire"""
+        return self.compute_batch([{
+            'gross_salary': gross_salary,
+            'birth_date': employee.birth_date if employee else None,
+            'canton': employee.canton if employee else None,
+            'other_deductions': other_deductions
+        }], period or date.today())[0]
+
+    def compute_batch(self, items, period):
+        """Calculer un lot en une passe
+
+        `items` est une liste de dicts avec gross_salary, birth_date, canton
+        et other_deductions (optionnels sauf le brut). Retourne, dans le même
+        ordre, les dicts des champs de déduction et de net_salary.
+        """
+        rates = self.rates_for(period)
+
+        # Barème résolu une fois pour tout le lot
+        avs_rate = rates['avs_rate']
+        ac_rate = rates['ac_rate']
+        ac_ceiling = rates['ac_ceiling'] / MONTHS if rates['ac_ceiling'] else None
+        laa_rate = rates['laa_rate']
+
+        bands = sorted((int(age), rate) for age, rate in rates['lpp_rates'].items() if age != 'default')
+        band_ages = [age for age, _ in bands]
+        band_rates = [rate for _, rate in bands]
+        lpp_default = rates['lpp_rates'].get('default', Decimal('0'))
+        lpp_threshold = (rates['lpp_entry_threshold'] or 0) / MONTHS
+        lpp_coordination = (rates['lpp_coordination'] or 0) / MONTHS
+
+        cantons = {canton.upper(): rate for canton, rate in (rates['source_tax_rates'] or {}).items()}
+        default_tax_rate = rates['default_source_tax_rate'] or Decimal('0')
+
+        results = []
+        for item in items:
+            gross = _decimal(item['gross_salary']) or Decimal('0')
+
+            insured_ac = min(gross, ac_ceiling) if ac_ceiling is not None else gross
+
+            birth_date = item.get('birth_date')
+            if birth_date is None or not band_ages:
+                lpp_rate = lpp_default
+            else:
+                index = bisect_right(band_ages, age_at(birth_date, period)) - 1
+                lpp_rate = band_rates[index] if index >= 0 else Decimal('0')
+            coordinated = max(Decimal('0'), gross - lpp_coordination) if gross >= lpp_threshold else Decimal('0')
+
+            canton = (item.get('canton') or '').strip().upper()
+            tax_rate = cantons.get(canton, default_tax_rate)
+
+            values = {
+                'social_security': (gross * avs_rate).quantize(CENT),
+                'unemployment': (insured_ac * ac_rate).quantize(CENT),
+                'pension': (coordinated * lpp_rate).quantize(CENT),
+                'accident_insurance': (gross * laa_rate).quantize(CENT),
+                'tax_deduction': (gross * tax_rate).quantize(CENT),
+            }
+            other = _decimal(item.get('other_deductions')) or Decimal('0')
+            values['net_salary'] = gross - sum(values.values()) - other
+            results.append(values)
+
+        return results
+
+    def invalidate(self):
+        """Recharger les barèmes au prochain calcul"""
+        with self._lock:
+            self._versions = None
+
+    def _get_versions(self):
+        versions = self._versions
+        if versions is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return versions
+
+        with self._lock:
+            if self._versions is None or time.monotonic() - self._loaded_at >= self.ttl:
+                self._versions = self._load()
+                self._loaded_at = time.monotonic()
+            return self._versions
+
+    def _load(self):
+        """Toutes les versions du barème, triées par date d'entrée en vigueur"""
+        versions = []
+        for table in DeductionRateTable.query.order_by(DeductionRateTable.valid_from).all():
+            versions.append({
+                'version': table.version,
+                'valid_from': table.valid_from,
+                'avs_rate': _decimal(table.avs_rate),
+                'ac_rate': _decimal(table.ac_rate),
+                'ac_ceiling': _decimal(table.ac_ceiling),
+                'laa_rate': _decimal(table.laa_rate),
+                'lpp_rates': {age: _decimal(rate) for age, rate in (table.lpp_rates or {}).items()},
+                'lpp_entry_threshold': _decimal(table.lpp_entry_threshold),
+                'lpp_coordination': _decimal(table.lpp_coordination),
+                'source_tax_rates': {canton: _decimal(rate) for canton, rate in (table.source_tax_rates or {}).items()},
+                'default_source_tax_rate': _decimal(table.default_source_tax_rate),
+            })
+
+        logger.debug(f"Barèmes de déductions chargés ({len(versions)} versions)")
+        return versions
+
+
+# Instance globale
+deduction_calculator = DeductionCalculator()
+
+
+# Rechargement après tout commit modifiant un barème
+@event.listens_for(DeductionRateTable, 'after_insert')
+@event.listens_for(DeductionRateTable, 'after_update')
+@event.listens_for(DeductionRateTable, 'after_delete')
+def _mark_rates_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info['deduction_rates_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _reload_rates(session):
+    if session.info.pop('deduction_rates_changed', False):
+        deduction_calculator.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rates_change(session):
+    session.info.pop('deduction_rates_changed', None)
@@ -0,0 +1,230 @@
+"""
+Diffusion en temps réel (Server-Sent Events) des notifications et du tableau de bord
+
+Chaque processus possède un EventBroker: les connexions SSE s'y abonnent avec
+une file bornée. Les événements y sont publiés:
+- immédiatement après le commit d'une notification ou d'une mise à jour de
+  CompanyDashboard dans le processus courant (écouteurs ORM);
+- par un thread de surveillance par processus, qui lit toutes les
+  SSE_POLL_INTERVAL secondes les notifications et le tableau de bord modifiés
+  par les autres workers gunicorn, le planificateur ou les insertions en masse.
+  Une requête par intervalle et par worker remplace l'interrogation de chaque
+  écran connecté.
+
+Les connexions SSE restent ouvertes jusqu'à SSE_MAX_DURATION secondes et
+occupent chacune un thread: les déploiements (deploy_on_vps.sh,
+deploy_vps_complete.sh, render.yaml) lancent gunicorn avec des workers
+gthread (--threads 16) et un --timeout de 360 secondes, supérieur à
+SSE_MAX_DURATION.
+"""
+
+from app import db
+from app.models import Notification, CompanyDashboard
+from app.utils.dashboard_updater import serialize_dashboard
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from collections import deque
+from datetime import date
+import json
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def notification_payload(notification):
+    """Représentation JSON d'une notification poussée au navigateur"""
+    return {
+        'id': notification.id,
+        'title': notification.title,
+        'message': notification.message,
+        'type': notification.type,
+        'category': notification.category,
+        'priority': notification.priority,
+        'link_url': notification.link_url,
+        'created_at': notification.created_at.isoformat() if notification.created_at else None
+    }
+
+
+def format_sse(event_name, data, event_id=None):
+    """Sérialiser un événement au format text/event-stream"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_name}")
+    for line in json.dumps(data, default=str).splitlines():
+        lines.append(f"data: {line}")
+    return "\n".join(lines) + "\n\n"
+
+
+class EventBroker:
+    """Pub/sub en mémoire vers les connexions SSE du processus"""
+
+    RECENT_IDS = 10000
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._recent = deque()
+        self._recent_set = set()
+        self._dashboard = {}
+
+        self._app = None
+        self._watcher = None
+        self._notification_cursor = None
+        self._dashboard_version = None
+
+    def subscribe(self, app, user_id):
+        """Ouvrir un abonnement (file bornée) pour un utilisateur connecté"""
+        subscriber = {
+            'user_id': user_id,
+            'queue': queue.Queue(maxsize=app.config.get('SSE_QUEUE_SIZE', 100))
+        }
+        with self._lock:
+            self._subscribers[id(subscriber)] = subscriber
+
+        self._ensure_watcher(app)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.pop(id(subscriber), None)
+
+    def publish_notification(self, user_id, payload):
+        """Pousser une notification à ses destinataires (une seule fois par id)"""
+        with self._lock:
+            if payload['id'] in self._recent_set:
+                return
+            self._recent.append(payload['id'])
+            self._recent_set.add(payload['id'])
+            if len(self._recent) > self.RECENT_IDS:
+                self._recent_set.discard(self._recent.popleft())
+
+        self._dispatch('notification', payload, user_id=user_id, event_id=payload['id'])
+
+    def publish_dashboard(self, payload):
+        """Pousser les sections du tableau de bord qui ont changé"""
+        with self._lock:
+            previous = self._dashboard if self._dashboard.get('date') == payload.get('date') else {}
+            changes = {key: value for key, value in payload.items() if previous.get(key) != value}
+            self._dashboard = payload
+
+        if changes:
+            changes['date'] = payload.get('date')
+            self._dispatch('dashboard', changes)
+
+    def dashboard_snapshot(self):
+        """Dernier état connu du tableau de bord (envoyé à la connexion)"""
+        with self._lock:
+            return dict(self._dashboard)
+
+    def _dispatch(self, event_name, data, user_id=None, event_id=None):
+        message = format_sse(event_name, data, event_id)
+
+        with self._lock:
+            targets = [
+                subscriber for subscriber in self._subscribers.values()
+                if user_id is None or subscriber['user_id'] == user_id
+            ]
+
+        for subscriber in targets:
+            try:
+                subscriber['queue'].put_nowait(message)
+            except queue.Full:
+                # Client trop lent: il recevra l'état complet à sa reconnexion
+                logger.debug("File SSE pleine, événement ignoré")
+
+    def _ensure_watcher(self, app):
+        """Démarrer le thread de surveillance dans le processus courant"""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+
+        with self._lock:
+            if self._watcher is not None and self._watcher.is_alive():
+                return
+            self._app = app
+            self._watcher = threading.Thread(target=self._watch, name='sse-watcher', daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        interval = self._app.config.get('SSE_POLL_INTERVAL', 2)
+
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    # Plus aucun abonné: le thread sera relancé au prochain
+                    self._watcher = None
+                    return
+
+            try:
+                with self._app.app_context():
+                    self._poll()
+            except Exception as e:
+                logger.error(f"Erreur surveillance des événements: {e}")
+
+            time.sleep(interval)
+
+    def _poll(self):
+        """Lire les notifications et le tableau de bord modifiés depuis le dernier passage"""
+        if self._notification_cursor is None:
+            self._notification_cursor = db.session.query(func.max(Notification.id)).scalar() or 0
+        else:
+            rows = Notification.query.filter(
+                Notification.id > self._notification_cursor,
+                Notification.is_read == False
+            ).order_by(Notification.id).limit(500).all()
+
+            for notification in rows:
+                self.publish_notification(notification.user_id, notification_payload(notification))
+                self._notification_cursor = notification.id
+
+        dashboard = CompanyDashboard.query.filter_by(date=date.today()).first()
+        if dashboard and dashboard.last_updated != self._dashboard_version:
+            self._dashboard_version = dashboard.last_updated
+            self.publish_dashboard(serialize_dashboard(dashboard))
+
+
+# Instance globale
+event_broker = EventBroker()
+
+
+# Publication immédiate après commit dans le processus courant. Les données
+# sont capturées pendant le flush: la session ne peut plus émettre de SQL
+# dans after_commit.
+@event.listens_for(Notification, 'after_insert')
+def _notification_inserted(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault('sse_notifications', []).append(
+            (target.user_id, notification_payload(target))
+        )
+
+
+@event.listens_for(CompanyDashboard, 'after_insert')
+@event.listens_for(CompanyDashboard, 'after_update')
+def _dashboard_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None and target.date == date.today():
+        try:
+            session.info['sse_dashboard'] = serialize_dashboard(target)
+        except Exception as e:
+            # Le thread de surveillance publiera la mise à jour
+            logger.debug(f"Tableau de bord non publié au commit: {e}")
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_committed(session):
+    for user_id, payload in session.info.pop('sse_notifications', None) or []:
+        event_broker.publish_notification(user_id, payload)
+
+    dashboard = session.info.pop('sse_dashboard', None)
+    if dashboard is not None:
+        event_broker.publish_dashboard(dashboard)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_uncommitted(session):
+    session.info.pop('sse_notifications', None)
+    session.info.pop('sse_dashboard', None)
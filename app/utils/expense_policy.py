@@ -0,0 +1,273 @@
+"""
+Évaluation des politiques de dépenses
+
+Les politiques actives sont gardées en mémoire par catégorie (catégorie
+'all' comprise) et rechargées après tout commit qui en modifie une; un TTL
+borne le décalage avec les autres processus. Pour une dépense, les totaux du
+jour et du mois de l'employé dans la catégorie viennent d'une seule requête
+(somme conditionnelle sur le mois), puis toutes les règles applicables sont
+évaluées en une passe. La dépense évaluée n'est jamais comptée dans ces
+totaux, même déjà flushée.
+
+En mode lot (revalidate_month), les dépenses du mois sont lues en une requête
+et évaluées dans l'ordre de saisie avec des totaux cumulés par employé,
+catégorie, jour et mois: chaque dépense est comparée à celles saisies avant
+elle, comme lors de sa soumission.
+"""
+
+from app import db
+from app.models import Employee, Expense, ExpensePolicy
+from sqlalchemy import event, func, case, update
+from sqlalchemy.orm import Session
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+import calendar
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+POLICY_CACHE_TTL = 300  # secondes, borne le décalage entre processus
+
+
+def _decimal(value):
+    return Decimal(str(value)) if value is not None else None
+
+
+def month_bounds(day):
+    """Premier et dernier jour du mois d'une date"""
+    return day.replace(day=1), day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def policy_outcome(violations, payment_status):
+    """Champs de la dépense correspondant au résultat de l'évaluation
+
+    Une violation bloquante (severity 'error') met une dépense en attente en
+    revue de politique; une dépense en revue sans violation bloquante revient
+    en attente. Les autres statuts (approuvée, payée...) ne changent pas.
+    """
+    blocking = any(violation['severity'] == 'error' for violation in violations)
+
+    if payment_status == 'pending' and blocking:
+        payment_status = 'policy_review'
+    elif payment_status == 'policy_review' and not blocking:
+        payment_status = 'pending'
+
+    return {
+        'policy_violation': bool(violations),
+        'policy_violation_reason': ', '.join(violation['violation'] for violation in violations) or None,
+        'payment_status': payment_status
+    }
+
+
+class ExpensePolicyEngine:
+    """Politiques actives en cache et évaluation des règles de dépenses"""
+
+    def __init__(self, ttl=POLICY_CACHE_TTL):
+        self.ttl = ttl
+        self._policies = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def policies_for(self, category, department=None):
+        """Politiques actives applicables à une catégorie et un département"""
+        policies = self._get_policies()
+        return [
+            policy for policy in policies.get(category, []) + policies.get('all', [])
+            if policy['applies_to_all'] or not policy['department'] or policy['department'] == department
+        ]
+
+    def check(self, expense, department=None):
+        """Violations d'une dépense (liste de dicts policy, violation, severity)"""
+        policies = self.policies_for(expense.category, department)
+        if not policies:
+            return []
+
+        amount = _decimal(expense.total_amount) or Decimal('0')
+        if any(policy['daily_limit'] or policy['monthly_limit'] for policy in policies):
+            daily_total, monthly_total = self.totals(expense)
+        else:
+            daily_total = monthly_total = Decimal('0')
+
+        return self.evaluate(policies, amount, daily_total, monthly_total)
+
+    def totals(self, expense):
+        """(total du jour, total du mois) de l'employé dans la catégorie, hors cette dépense"""
+        month_start, month_end = month_bounds(expense.expense_date)
+
+        query = db.session.query(
+            func.coalesce(func.sum(case(
+                (Expense.expense_date == expense.expense_date, Expense.total_amount),
+                else_=0
+            )), 0),
+            func.coalesce(func.sum(Expense.total_amount), 0)
+        ).filter(
+            Expense.employee_id == expense.employee_id,
+            Expense.category == expense.category,
+            Expense.expense_date >= month_start,
+            Expense.expense_date <= month_end,
+            Expense.payment_status != 'rejected'
+        )
+        if expense.id is not None:
+            query = query.filter(Expense.id != expense.id)
+
+        daily_total, monthly_total = query.one()
+        return _decimal(daily_total), _decimal(monthly_total)
+
+    def evaluate(self, policies, amount, daily_total, monthly_total):
+        """Toutes les règles des politiques en une passe"""
+        violations = []
+        for policy in policies:
+            # Limite par dépense
+            if policy['per_expense_limit'] and amount > policy['per_expense_limit']:
+                violations.append({
+                    'policy': policy['name'],
+                    'violation': f"Montant dépasse la limite ({policy['per_expense_limit']} CHF)",
+                    'severity': 'warning'
+                })
+
+            # Limite journalière
+            if policy['daily_limit'] and daily_total + amount > policy['daily_limit']:
+                violations.append({
+                    'policy': policy['name'],
+                    'violation': f"Limite journalière dépassée ({policy['daily_limit']} CHF)",
+                    'severity': 'error'
+                })
+
+            # Limite mensuelle
+            if policy['monthly_limit'] and monthly_total + amount > policy['monthly_limit']:
+                violations.append({
+                    'policy': policy['name'],
+                    'violation': f"Limite mensuelle dépassée ({policy['monthly_limit']} CHF)",
+                    'severity': 'error'
+                })
+
+        return violations
+
+    def revalidate_month(self, month, year, dry_run=False):
+        """Réévaluer toutes les dépenses non rejetées d'un mois (changement de politique)
+
+        Une requête pour les dépenses et les départements, une passe avec
+        totaux cumulés et un UPDATE en masse des dépenses dont le résultat
+        change (sans commit). Seules les dépenses en attente ou en revue
+        changent de statut. L'UPDATE en masse ne passe pas par les événements
+        ORM: après le commit, l'appelant recalcule le tableau de bord
+        (dashboard_updater.reconcile) si des dépenses ont changé.
+        """
+        month_start, month_end = month_bounds(date(year, month, 1))
+
+        rows = db.session.query(
+            Expense.id,
+            Expense.employee_id,
+            Expense.category,
+            Expense.expense_date,
+            Expense.total_amount,
+            Expense.payment_status,
+            Expense.policy_violation,
+            Expense.policy_violation_reason,
+            Employee.department
+        ).join(
+            Employee, Expense.employee_id == Employee.id
+        ).filter(
+            Expense.expense_date >= month_start,
+            Expense.expense_date <= month_end,
+            Expense.payment_status != 'rejected'
+        ).order_by(Expense.id).all()
+
+        daily_totals = defaultdict(Decimal)
+        monthly_totals = defaultdict(Decimal)
+        updates = []
+        flagged = 0
+
+        for row in rows:
+            amount = _decimal(row.total_amount) or Decimal('0')
+            month_key = (row.employee_id, row.category)
+            day_key = (row.employee_id, row.category, row.expense_date)
+
+            violations = self.evaluate(
+                self.policies_for(row.category, row.department),
+                amount, daily_totals[day_key], monthly_totals[month_key]
+            )
+            daily_totals[day_key] += amount
+            monthly_totals[month_key] += amount
+
+            flagged += bool(violations)
+            values = policy_outcome(violations, row.payment_status)
+
+            if (values['policy_violation'] != bool(row.policy_violation)
+                    or values['policy_violation_reason'] != (row.policy_violation_reason or None)
+                    or values['payment_status'] != row.payment_status):
+                updates.append(dict(values, id=row.id))
+
+        if updates and not dry_run:
+            db.session.execute(update(Expense), updates)
+
+        logger.info(f"Politiques de dépenses {month:02d}/{year}: {len(rows)} dépenses, "
+                    f"{flagged} en violation, {len(updates)} modifiées")
+
+        return {
+            'checked': len(rows),
+            'violations': flagged,
+            'updated': len(updates)
+        }
+
+    def invalidate(self):
+        """Recharger les politiques au prochain appel"""
+        with self._lock:
+            self._policies = None
+
+    def _get_policies(self):
+        policies = self._policies
+        if policies is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return policies
+
+        with self._lock:
+            if self._policies is None or time.monotonic() - self._loaded_at >= self.ttl:
+                self._policies = self._load()
+                self._loaded_at = time.monotonic()
+            return self._policies
+
+    def _load(self):
+        """Politiques actives regroupées par catégorie"""
+        policies = defaultdict(list)
+        for policy in ExpensePolicy.query.filter(ExpensePolicy.is_active == True).order_by(ExpensePolicy.id):
+            policies[policy.category].append({
+                'id': policy.id,
+                'name': policy.name,
+                'category': policy.category,
+                'daily_limit': _decimal(policy.daily_limit),
+                'monthly_limit': _decimal(policy.monthly_limit),
+                'per_expense_limit': _decimal(policy.per_expense_limit),
+                'applies_to_all': policy.applies_to_all is not False,
+                'department': policy.department
+            })
+
+        logger.debug(f"Politiques de dépenses chargées ({sum(len(p) for p in policies.values())})")
+        return dict(policies)
+
+
+# Instance globale
+expense_policy_engine = ExpensePolicyEngine()
+
+
+# Rechargement après tout commit modifiant une politique
+@event.listens_for(ExpensePolicy, 'after_insert')
+@event.listens_for(ExpensePolicy, 'after_update')
+@event.listens_for(ExpensePolicy, 'after_delete')
+def _mark_policies_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info['expense_policies_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _reload_policies(session):
+    if session.info.pop('expense_policies_changed', False):
+        expense_policy_engine.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_policies_change(session):
+    session.info.pop('expense_policies_changed', None)
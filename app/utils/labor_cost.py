@@ -0,0 +1,118 @@
+"""
+Calcul du coût de main d'œuvre à partir des pointages
+
+Le coût d'un pointage est min(heures, 8) × taux horaire + heures au-delà de
+8h × taux horaire × 1.25. Les agrégats (par jour, par projet, par
+département) sont calculés en une requête jointe aux employés, en
+arithmétique décimale SQL (NUMERIC) et retournés en Decimal arrondis au
+centime, sur n'importe quelle plage de dates.
+"""
+
+from app import db
+from app.models import Attendance, Employee, Project
+from sqlalchemy import func, case, cast, literal, Numeric
+from decimal import Decimal
+
+STANDARD_DAY_HOURS = Decimal('8')
+OVERTIME_RATE = Decimal('1.25')
+
+CENT = Decimal('0.01')
+
+
+def attendance_labor_cost(hours, hourly_rate):
+    """Coût d'un pointage (même règle que les agrégats SQL)"""
+    if not hours or not hourly_rate:
+        return Decimal('0')
+
+    hours = Decimal(str(hours))
+    rate = Decimal(str(hourly_rate))
+    regular = min(hours, STANDARD_DAY_HOURS)
+    overtime = max(Decimal('0'), hours - STANDARD_DAY_HOURS)
+    return regular * rate + overtime * rate * OVERTIME_RATE
+
+
+class LaborCostService:
+    """Agrégats de coût de main d'œuvre (heures normales / supplémentaires)"""
+
+    def by_day(self, start_date, end_date, **filters):
+        """Coût par jour: [{'date', 'hours', 'regular_cost', 'overtime_cost', 'total_cost'}]"""
+        return self._aggregate(start_date, end_date, [Attendance.date.label('date')], **filters)
+
+    def by_project(self, start_date, end_date, **filters):
+        """Coût par projet (project_id None = heures non affectées)"""
+        return self._aggregate(
+            start_date, end_date,
+            [Attendance.project_id.label('project_id'), Project.name.label('project_name')],
+            join_project=True, **filters
+        )
+
+    def by_department(self, start_date, end_date, **filters):
+        """Coût par département"""
+        return self._aggregate(start_date, end_date, [Employee.department.label('department')], **filters)
+
+    def total(self, start_date, end_date, **filters):
+        """Coût total de la période"""
+        rows = self._aggregate(start_date, end_date, [], **filters)
+        return rows[0] if rows else self._row({}, 0, 0, 0)
+
+    def _aggregate(self, start_date, end_date, group_columns, join_project=False,
+                   project_id=None, department=None, employee_id=None):
+        """Une requête GROUP BY sur les pointages joints aux employés"""
+        hours = cast(Attendance.total_hours, Numeric(10, 2))
+        rate = Employee.hourly_rate
+        day_hours = literal(STANDARD_DAY_HOURS, Numeric(4, 2))
+
+        regular_hours = case((hours > day_hours, day_hours), else_=hours)
+        overtime_hours = case((hours > day_hours, hours - day_hours), else_=0)
+
+        query = db.session.query(
+            *group_columns,
+            func.coalesce(func.sum(hours), 0).label('hours'),
+            func.coalesce(func.sum(regular_hours * rate), 0).label('regular_cost'),
+            func.coalesce(func.sum(
+                overtime_hours * rate * literal(OVERTIME_RATE, Numeric(4, 2))
+            ), 0).label('overtime_cost')
+        ).join(
+            Employee, Attendance.employee_id == Employee.id
+        ).filter(
+            Attendance.date >= start_date,
+            Attendance.date <= end_date,
+            Attendance.total_hours > 0,
+            Employee.hourly_rate != None
+        )
+
+        if join_project:
+            query = query.outerjoin(Project, Attendance.project_id == Project.id)
+
+        if project_id is not None:
+            query = query.filter(Attendance.project_id == project_id)
+        if department:
+            query = query.filter(Employee.department == department)
+        if employee_id is not None:
+            query = query.filter(Attendance.employee_id == employee_id)
+
+        if group_columns:
+            query = query.group_by(*group_columns).order_by(*group_columns)
+
+        rows = []
+        for row in query.all():
+            values = row._asdict()
+            keys = {column.key: values[column.key] for column in group_columns}
+            rows.append(self._row(keys, values['hours'], values['regular_cost'], values['overtime_cost']))
+        return rows
+
+    def _row(self, keys, hours, regular_cost, overtime_cost):
+        # Certains moteurs (SQLite) rendent des flottants: repasser par str
+        regular_cost = Decimal(str(regular_cost or 0)).quantize(CENT)
+        overtime_cost = Decimal(str(overtime_cost or 0)).quantize(CENT)
+        return dict(
+            keys,
+            hours=Decimal(str(hours or 0)).quantize(CENT),
+            regular_cost=regular_cost,
+            overtime_cost=overtime_cost,
+            total_cost=regular_cost + overtime_cost
+        )
+
+
+# Instance globale
+labor_cost_service = LaborCostService()
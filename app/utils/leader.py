@@ -0,0 +1,148 @@
+"""
+Élection d'un processus leader par bail en base de données
+
+Chaque processus (worker gunicorn, serveur de développement) tente
+régulièrement de prendre ou de renouveler le bail `name` de la table
+scheduler_leases. Le bail est pris par une mise à jour conditionnelle
+(détenteur actuel ou bail expiré), donc un seul processus le détient à la
+fois. Si le leader meurt sans le libérer, un autre le reprend après
+expiration (SCHEDULER_LEASE_TTL).
+"""
+
+from app import db
+from app.models import SchedulerLease
+from datetime import datetime, timedelta
+from sqlalchemy import update, or_, case
+from sqlalchemy.exc import IntegrityError
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderElection:
+    """Boucle d'élection appelant on_elected / on_demoted selon le bail"""
+
+    def __init__(self, app, name, on_elected, on_demoted, ttl=None):
+        self.app = app
+        self.name = name
+        self.ttl = ttl or app.config.get('SCHEDULER_LEASE_TTL', 60)
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+
+        self.is_leader = False
+        self._renewed_at = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Lancer la boucle d'élection dans un thread du processus courant"""
+        self._thread = threading.Thread(target=self._run, name=f'leader-{self.name}', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Arrêter la boucle et libérer le bail pour une reprise immédiate"""
+        self._stop.set()
+        if self.is_leader:
+            self._demote()
+            try:
+                with self.app.app_context():
+                    self.release()
+            except Exception as e:
+                logger.warning(f"Bail {self.name} non libéré: {e}")
+
+    def try_acquire(self):
+        """Prendre ou renouveler le bail, retourne True si ce processus le détient"""
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl)
+
+        result = db.session.execute(
+            update(SchedulerLease)
+            .where(
+                SchedulerLease.name == self.name,
+                or_(
+                    SchedulerLease.holder == self.holder,
+                    SchedulerLease.holder == None,
+                    SchedulerLease.expires_at < now
+                )
+            )
+            .values(
+                holder=self.holder,
+                expires_at=expires_at,
+                acquired_at=case(
+                    (SchedulerLease.holder == self.holder, SchedulerLease.acquired_at),
+                    else_=now
+                )
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+        if result.rowcount:
+            db.session.commit()
+            return True
+
+        db.session.rollback()
+
+        # Première utilisation: créer la ligne du bail
+        if not db.session.query(SchedulerLease.id).filter_by(name=self.name).first():
+            try:
+                db.session.add(SchedulerLease(
+                    name=self.name,
+                    holder=self.holder,
+                    acquired_at=now,
+                    expires_at=expires_at
+                ))
+                db.session.commit()
+                return True
+            except IntegrityError:
+                db.session.rollback()
+
+        return False
+
+    def release(self):
+        """Libérer le bail s'il est détenu par ce processus"""
+        db.session.execute(
+            update(SchedulerLease)
+            .where(SchedulerLease.name == self.name, SchedulerLease.holder == self.holder)
+            .values(holder=None, expires_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    def _run(self):
+        interval = max(1, self.ttl / 3)
+
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    held = self.try_acquire()
+                if held:
+                    self._renewed_at = time.monotonic()
+            except Exception as e:
+                logger.error(f"Erreur renouvellement du bail {self.name}: {e}")
+                # Sans confirmation, le bail est considéré perdu à son expiration
+                held = self.is_leader and time.monotonic() - self._renewed_at < self.ttl - interval
+
+            if held and not self.is_leader:
+                self.is_leader = True
+                logger.info(f"Processus {self.holder} élu pour {self.name}")
+                self.on_elected()
+            elif not held and self.is_leader:
+                self._demote()
+
+            self._stop.wait(interval)
+
+    def _demote(self):
+        self.is_leader = False
+        logger.info(f"Processus {self.holder} n'est plus leader pour {self.name}")
+        try:
+            self.on_demoted()
+        except Exception as e:
+            logger.error(f"Erreur arrêt des tâches de {self.name}: {e}")
@@ -0,0 +1,321 @@
+"""
+File d'envoi des emails avec connexion SMTP persistante
+
+Les emails sont mis en file par NotificationService et envoyés par un thread
+dédié qui garde une connexion SMTP ouverte (STARTTLS + login une seule fois),
+traite les messages par lots, réessaie avec un délai exponentiel et range
+les messages abandonnés dans la table email_dead_letters.
+
+Pour tester en local sans serveur réel:
+    python -m aiosmtpd -n -l localhost:8025
+avec MAIL_SERVER=localhost, MAIL_PORT=8025, MAIL_USE_TLS=false.
+"""
+
+from app import db
+from app.models import EmailDeadLetter
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from datetime import datetime
+import atexit
+import heapq
+import itertools
+import logging
+import queue
+import smtplib
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def build_message(sender, to_email, subject, body, link_url=None):
+    """Construire le message (texte + HTML) d'une notification"""
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = f"[Globibat] {subject}"
+    msg['From'] = sender
+    msg['To'] = to_email
+
+    html = f"""
+    <html>
+    <body>
+        <h2>{subject}</h2>
+        <p>{body}</p>
+        {f'<p><a href="{link_url}">Voir plus de détails</a></p>' if link_url else ''}
+        <hr>
+        <p><small>Ceci est un message automatique de Globibat CRM.</small></p>
+    </body>
+    </html>
+    """
+
+    msg.attach(MIMEText(body, 'plain'))
+    msg.attach(MIMEText(html, 'html'))
+    return msg
+
+
+class MailQueue:
+    """File d'emails sortants servie par un thread et une connexion SMTP"""
+
+    def __init__(self):
+        self._queue = None
+        self._thread = None
+        self._app = None
+        self._lock = threading.Lock()
+        self._exit_hook = False
+
+        # Réservés au thread d'envoi
+        self._smtp = None
+        self._last_used = 0
+        self._retries = []
+        self._sequence = itertools.count()
+
+    def send(self, app, to_email, subject, body, link_url=None):
+        """Mettre un email en file (retourne False s'il a dû être abandonné)"""
+        return self.send_many(app, [{
+            'to_email': to_email,
+            'subject': subject,
+            'body': body,
+            'link_url': link_url
+        }]) == 1
+
+    def send_many(self, app, messages):
+        """Mettre en file plusieurs emails, retourne le nombre accepté"""
+        if app.config.get('MAIL_SUPPRESS_SEND'):
+            logger.info(f"Envoi d'emails désactivé, {len(messages)} message(s) ignoré(s)")
+            return len(messages)
+
+        self._ensure_started(app)
+        accepted = 0
+        rejected = []
+        now = datetime.utcnow()
+
+        for message in messages:
+            if not message.get('to_email'):
+                continue
+            item = dict(message, attempts=0, queued_at=now, last_error=None)
+            try:
+                self._queue.put_nowait(item)
+                accepted += 1
+            except queue.Full:
+                item['last_error'] = "File d'envoi pleine"
+                rejected.append(item)
+
+        if rejected:
+            logger.error(f"File d'envoi pleine: {len(rejected)} email(s) mis en échec")
+            self._dead_letter(rejected)
+
+        return accepted
+
+    def flush(self):
+        """Attendre que chaque email en file ait fait sa première tentative"""
+        if self._queue is not None:
+            self._queue.join()
+
+    def shutdown(self):
+        """Envoyer la file puis arrêter le thread (appelé à l'arrêt du processus)"""
+        if self._thread is None:
+            return
+
+        self._queue.put(_STOP)
+        self._thread.join(timeout=30)
+        self._thread = None
+
+    def requeue_dead_letters(self, app, ids=None):
+        """Remettre en file des emails abandonnés (tous si ids est None)"""
+        query = EmailDeadLetter.query.filter(EmailDeadLetter.requeued_at == None)
+        if ids:
+            query = query.filter(EmailDeadLetter.id.in_(ids))
+
+        letters = query.all()
+        accepted = self.send_many(app, [{
+            'to_email': letter.to_email,
+            'subject': letter.subject,
+            'body': letter.body,
+            'link_url': letter.link_url
+        } for letter in letters])
+
+        now = datetime.utcnow()
+        for letter in letters:
+            letter.requeued_at = now
+        db.session.commit()
+
+        return accepted
+
+    def _ensure_started(self, app):
+        """Démarrer le thread d'envoi dans le processus courant"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+
+            self._app = app
+            self._queue = queue.Queue(maxsize=app.config.get('MAIL_QUEUE_SIZE', 5000))
+            self._smtp = None
+            self._retries = []
+            self._thread = threading.Thread(target=self._run, name='mail-sender', daemon=True)
+            self._thread.start()
+
+            if not self._exit_hook:
+                atexit.register(self.shutdown)
+                self._exit_hook = True
+
+    def _run(self):
+        config = self._app.config
+        batch_size = config.get('MAIL_BATCH_SIZE', 50)
+        idle_timeout = config.get('MAIL_SMTP_IDLE_TIMEOUT', 60)
+
+        while True:
+            # Attendre un message, la prochaine relance ou l'expiration de la connexion
+            wait = idle_timeout
+            if self._retries:
+                wait = max(0, min(wait, self._retries[0][0] - time.monotonic()))
+
+            batch = []
+            stopping = False
+            try:
+                item = self._queue.get(timeout=wait)
+                if item is _STOP:
+                    stopping = True
+                    self._queue.task_done()
+                else:
+                    batch.append(item)
+
+                while len(batch) < batch_size and not stopping:
+                    item = self._queue.get_nowait()
+                    if item is _STOP:
+                        stopping = True
+                        self._queue.task_done()
+                    else:
+                        batch.append(item)
+            except queue.Empty:
+                pass
+
+            taken = len(batch)
+            now = time.monotonic()
+            while self._retries and self._retries[0][0] <= now and len(batch) < batch_size:
+                batch.append(heapq.heappop(self._retries)[2])
+
+            if batch:
+                try:
+                    self._deliver(batch)
+                except Exception as e:
+                    logger.error(f"Erreur thread d'envoi des emails: {e}")
+                finally:
+                    for _ in range(taken):
+                        self._queue.task_done()
+            elif self._smtp is not None and now - self._last_used >= idle_timeout:
+                self._close()
+
+            if stopping:
+                self._drain()
+                return
+
+    def _drain(self):
+        """À l'arrêt: envoyer ce qui reste, abandonner les relances en attente"""
+        remaining = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._queue.task_done()
+            if item is not _STOP:
+                remaining.append(item)
+
+        if remaining:
+            self._deliver(remaining, final=True)
+
+        if self._retries:
+            self._dead_letter([entry[2] for entry in self._retries])
+            self._retries = []
+
+        self._close()
+
+    def _deliver(self, batch, final=False):
+        """Envoyer un lot sur la connexion persistante"""
+        config = self._app.config
+        sender = config.get('MAIL_DEFAULT_SENDER') or config.get('FROM_EMAIL', 'noreply@globibat.ch')
+        max_attempts = config.get('MAIL_MAX_ATTEMPTS', 5)
+        backoff = config.get('MAIL_RETRY_BACKOFF', 30)
+        failed = []
+
+        for item in batch:
+            msg = build_message(sender, item['to_email'], item['subject'], item['body'], item.get('link_url'))
+
+            try:
+                self._send(msg)
+            except (smtplib.SMTPException, OSError) as e:
+                item['attempts'] += 1
+                item['last_error'] = str(e)
+
+                if isinstance(e, smtplib.SMTPRecipientsRefused) or item['attempts'] >= max_attempts or final:
+                    failed.append(item)
+                else:
+                    delay = backoff * 2 ** (item['attempts'] - 1)
+                    heapq.heappush(self._retries, (time.monotonic() + delay, next(self._sequence), item))
+                    logger.warning(f"Envoi à {item['to_email']} échoué ({e}), nouvel essai dans {delay}s")
+
+        if failed:
+            self._dead_letter(failed)
+
+    def _send(self, msg):
+        """Envoyer un message, en rouvrant la connexion une fois si elle a été coupée"""
+        try:
+            self._connection().send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self._close()
+            self._connection().send_message(msg)
+        self._last_used = time.monotonic()
+
+    def _connection(self):
+        if self._smtp is None:
+            config = self._app.config
+            server = config.get('SMTP_SERVER') or config.get('MAIL_SERVER')
+            port = config.get('SMTP_PORT') or config.get('MAIL_PORT', 587)
+            username = config.get('SMTP_USER') or config.get('MAIL_USERNAME')
+            password = config.get('SMTP_PASSWORD') or config.get('MAIL_PASSWORD')
+
+            smtp = smtplib.SMTP(server, port, timeout=config.get('MAIL_SMTP_TIMEOUT', 30))
+            if config.get('MAIL_USE_TLS', True):
+                smtp.starttls()
+            if username:
+                smtp.login(username, password)
+
+            self._smtp = smtp
+            self._last_used = time.monotonic()
+
+        return self._smtp
+
+    def _close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+    def _dead_letter(self, items):
+        """Enregistrer des emails abandonnés dans la table des échecs"""
+        try:
+            with self._app.app_context():
+                for item in items:
+                    db.session.add(EmailDeadLetter(
+                        to_email=item['to_email'],
+                        subject=item['subject'][:255],
+                        body=item['body'],
+                        link_url=item.get('link_url'),
+                        attempts=item['attempts'],
+                        last_error=item['last_error'],
+                        queued_at=item['queued_at']
+                    ))
+                db.session.commit()
+            logger.error(f"{len(items)} email(s) abandonné(s), voir email_dead_letters")
+        except Exception as e:
+            logger.error(f"Erreur enregistrement des emails en échec: {e}")
+
+
+# Instance globale
+mail_queue = MailQueue()
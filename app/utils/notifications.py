@@ -3,25 +3,18 @@ Système de notifications et rappels automatiques
 """
 
 from app import db
-from app.models import (Notification, Employee, Leave, Expense, Payroll, 
+from app.models import (User, Role, Notification, Employee, Attendance, Leave, Expense, Payroll, 
                        Document, WorkTimeRegulation, AuditLog)
+from app.utils.mailer import mail_queue
+from app.utils.unread_counter import unread_counter
 from datetime import datetime, date, timedelta
-from sqlalchemy import and_, or_
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from sqlalchemy import and_, or_, func, insert
 from flask import current_app
+import calendar
 
 class NotificationService:
     """Service de gestion des notifications"""
     
-    def __init__(self):
-        self.smtp_server = current_app.config.get('SMTP_SERVER')
-        self.smtp_port = current_app.config.get('SMTP_PORT', 587)
-        self.smtp_user = current_app.config.get('SMTP_USER')
-        self.smtp_password = current_app.config.get('SMTP_PASSWORD')
-        self.from_email = current_app.config.get('FROM_EMAIL', 'noreply@globibat.ch')
-    
     def send_notification(self, user_id, title, message, type='info', category=None, 
                          priority='normal', link_url=None, send_email=True):
         """Créer et envoyer une notification"""
@@ -51,41 +44,86 @@ class NotificationService:
             current_app.logger.error(f"Erreur envoi notification: {e}")
             return False
     
-    def send_email_notification(self, to_email, subject, body, link_url=None):
-        """Envoyer une notification par email"""
+    def send_bulk(self, title, message, user_ids=None, roles=None, type='info', category=None,
+                  priority='normal', link_url=None, send_email=True):
+        """Envoyer la même notification à un ensemble de destinataires
+        
+        Les destinataires sont les utilisateurs actifs listés dans `user_ids`
+        et/ou ceux ayant un des rôles `roles` (noms insensibles à la casse).
+        Toutes les notifications sont insérées en une seule requête et un seul
+        commit; les emails des priorités hautes partent en un seul lot.
+        Retourne le nombre de notifications créées.
+        """
+        user_ids = set(user_ids or [])
+        role_names = [name.lower() for name in (roles or [])]
+        
+        if not user_ids and not role_names:
+            return 0
+        
         try:
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = f"[Globibat] {subject}"
-            msg['From'] = self.from_email
-            msg['To'] = to_email
+            criteria = []
+            if user_ids:
+                criteria.append(User.id.in_(user_ids))
+            if role_names:
+                criteria.append(User.role_id.in_(
+                    db.session.query(Role.id).filter(func.lower(Role.name).in_(role_names))
+                ))
             
-            # Corps du message
-            text = body
-            html = f"""
-            <html>
-            <body>
-                <h2>{subject}</h2>
-                <p>{body}</p>
-                {f'<p><a href="{link_url}">Voir plus de détails</a></p>' if link_url else ''}
-                <hr>
-                <p><small>Ceci est un message automatique de Globibat CRM.</small></p>
-            </body>
-            </html>
-            """
+            recipients = db.session.query(User.id, User.email).filter(
+                User.is_active == True,
+                or_(*criteria)
+            ).all()
             
-            part1 = MIMEText(text, 'plain')
-            part2 = MIMEText(html, 'html')
+            if not recipients:
+                return 0
             
-            msg.attach(part1)
-            msg.attach(part2)
+            now = datetime.utcnow()
+            db.session.execute(insert(Notification), [
+                {
+                    'user_id': recipient.id,
+                    'title': title,
+                    'message': message,
+                    'type': type,
+                    'category': category,
+                    'priority': priority,
+                    'link_url': link_url,
+                    'is_read': False,
+                    'created_at': now
+                }
+                for recipient in recipients
+            ])
+            db.session.commit()
             
-            # Envoyer l'email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_user, self.smtp_password)
-                server.send_message(msg)
+            # Insertion en masse: pas d'événement ORM, on ajuste les compteurs ici
+            for recipient in recipients:
+                unread_counter.add(recipient.id, 1)
             
-            return True
+            if send_email and priority in ['high', 'urgent']:
+                mail_queue.send_many(current_app._get_current_object(), [
+                    {
+                        'to_email': recipient.email,
+                        'subject': title,
+                        'body': message,
+                        'link_url': link_url
+                    }
+                    for recipient in recipients if recipient.email
+                ])
+            
+            return len(recipients)
+            
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Erreur envoi notifications groupées: {e}")
+            return 0
+    
+    def send_email_notification(self, to_email, subject, body, link_url=None):
+        """Mettre une notification email dans la file d'envoi
+        
+        L'envoi réel (connexion SMTP persistante, relances, échecs) est
+        assuré par mail_queue, hors de la requête ou de la tâche planifiée.
+        """
+        try:
+            return mail_queue.send(current_app._get_current_object(), to_email, subject, body, link_url)
             
         except Exception as e:
             current_app.logger.error(f"Erreur envoi email: {e}")
@@ -142,16 +180,14 @@ class NotificationService:
                 )
             
             # Notification aux RH
-            hr_users = User.query.filter_by(role='hr').all()
-            for hr in hr_users:
-                self.send_notification(
-                    user_id=hr.id,
-                    title=f"Document expiré - {doc.employee.full_name}",
-                    message=f"Le {doc.document_type} de {doc.employee.full_name} a expiré.",
-                    type='warning',
-                    category='document',
-                    priority='normal'
-                )
+            self.send_bulk(
+                roles=['hr'],
+                title=f"Document expiré - {doc.employee.full_name}",
+                message=f"Le {doc.document_type} de {doc.employee.full_name} a expiré.",
+                type='warning',
+                category='document',
+                priority='normal'
+            )
             
             doc.is_expired_notified = True
         
@@ -265,22 +301,19 @@ class NotificationService:
         
         if violations:
             # Notification aux RH
-            hr_users = User.query.filter_by(role='hr').all()
+            message = f"{len(violations)} employé(s) ont dépassé 10h de travail hier:\n"
+            for v in violations[:5]:  # Limiter à 5
+                message += f"- {v.employee.full_name}: {v.total_hours}h\n"
             
-            for hr in hr_users:
-                message = f"{len(violations)} employé(s) ont dépassé 10h de travail hier:\n"
-                for v in violations[:5]:  # Limiter à 5
-                    message += f"- {v.employee.full_name}: {v.total_hours}h\n"
-                
-                self.send_notification(
-                    user_id=hr.id,
-                    title="Alerte: Dépassement des heures légales",
-                    message=message,
-                    type='error',
-                    category='compliance',
-                    priority='high',
-                    link_url="/compliance/violations"
-                )
+            self.send_bulk(
+                roles=['hr'],
+                title="Alerte: Dépassement des heures légales",
+                message=message,
+                type='error',
+                category='compliance',
+                priority='high',
+                link_url="/compliance/violations"
+            )
         
         # Vérifier les heures hebdomadaires
         week_start = today - timedelta(days=today.weekday())
@@ -340,16 +373,14 @@ class NotificationService:
             
             # Notification aux RH
             if days_left <= 30:  # Urgence à 1 mois
-                hr_users = User.query.filter_by(role='hr').all()
-                for hr in hr_users:
-                    self.send_notification(
-                        user_id=hr.id,
-                        title=f"Fin de contrat - {emp.full_name}",
-                        message=f"Le contrat de {emp.full_name} se termine dans {days_left} jours. Action requise.",
-                        type='warning',
-                        category='contract',
-                        priority='high'
-                    )
+                self.send_bulk(
+                    roles=['hr'],
+                    title=f"Fin de contrat - {emp.full_name}",
+                    message=f"Le contrat de {emp.full_name} se termine dans {days_left} jours. Action requise.",
+                    type='warning',
+                    category='contract',
+                    priority='high'
+                )
     
     def check_payroll_reminders(self):
         """Rappels pour le calcul de la paie"""
@@ -357,18 +388,15 @@ class NotificationService:
         
         # Si on est le 25 du mois, rappeler de calculer la paie
         if today.day == 25:
-            finance_users = User.query.filter_by(role='finance').all()
-            
-            for user in finance_users:
-                self.send_notification(
-                    user_id=user.id,
-                    title="Rappel: Calcul de la paie mensuelle",
-                    message=f"N'oubliez pas de lancer le calcul de la paie pour le mois de {calendar.month_name[today.month]}.",
-                    type='info',
-                    category='payroll',
-                    priority='high',
-                    link_url="/payroll/calculate"
-                )
+            self.send_bulk(
+                roles=['finance'],
+                title="Rappel: Calcul de la paie mensuelle",
+                message=f"N'oubliez pas de lancer le calcul de la paie pour le mois de {calendar.month_name[today.month]}.",
+                type='info',
+                category='payroll',
+                priority='high',
+                link_url="/payroll/calculate"
+            )
         
         # Vérifier les paies non validées
         if today.day == 28:
@@ -381,18 +409,15 @@ class NotificationService:
             ).count()
             
             if unvalidated > 0:
-                finance_users = User.query.filter_by(role='finance').all()
-                
-                for user in finance_users:
-                    self.send_notification(
-                        user_id=user.id,
-                        title="Urgent: Fiches de paie à valider",
-                        message=f"{unvalidated} fiches de paie sont en attente de validation pour ce mois.",
-                        type='error',
-                        category='payroll',
-                        priority='urgent',
-                        link_url="/payroll/validation"
-                    )
+                self.send_bulk(
+                    roles=['finance'],
+                    title="Urgent: Fiches de paie à valider",
+                    message=f"{unvalidated} fiches de paie sont en attente de validation pour ce mois.",
+                    type='error',
+                    category='payroll',
+                    priority='urgent',
+                    link_url="/payroll/validation"
+                )
     
     def check_training_reminders(self):
         """Rappels de formations obligatoires"""
@@ -406,8 +431,14 @@ class NotificationService:
         if notification_ids:
             query = query.filter(Notification.id.in_(notification_ids))
         
-        query.update({'is_read': True, 'read_at': datetime.utcnow()})
+        updated = query.update({'is_read': True, 'read_at': datetime.utcnow()},
+                               synchronize_session=False)
         db.session.commit()
+        
+        # Mise à jour en masse: pas d'événement ORM, on ajuste le compteur ici
+        unread_counter.add(user_id, -updated)
+        
+        return updated
     
     def get_user_notifications(self, user_id, unread_only=False, limit=50):
         """Récupérer les notifications d'un utilisateur"""
@@ -0,0 +1,235 @@
+"""
+Calcul de la paie par lot
+
+Un calcul mensuel pour N employés fait un nombre fixe de requêtes:
+- les employés ciblés (avec leur utilisateur);
+- les heures du mois de tous ces employés en une requête GROUP BY;
+- les fiches de paie existantes en une requête IN;
+puis calcule tout en mémoire (déductions du lot en un appel à
+deduction_calculator) et écrit les fiches en masse (INSERT et UPDATE par clé
+primaire) dans une seule transaction: une erreur n'enregistre aucune fiche
+du lot. En mode simulation (dry_run), rien n'est écrit.
+"""
+
+from app import db
+from app.models import Employee, Payroll, Attendance
+from app.utils.deductions import deduction_calculator
+from sqlalchemy import func, insert, update
+from sqlalchemy.orm import joinedload
+from datetime import date
+from decimal import Decimal
+import calendar
+import logging
+
+logger = logging.getLogger(__name__)
+
+MONTHLY_HOURS = Decimal('160')  # Base horaire d'un salaire mensuel
+OVERTIME_RATE = Decimal('1.25')
+CENT = Decimal('0.01')
+
+
+def gross_amounts(employee, regular_hours, overtime_hours):
+    """(salaire de base, heures supplémentaires) d'un employé, None sans salaire défini"""
+    overtime_hours = Decimal(str(overtime_hours))
+
+    if employee.base_salary:
+        # Salaire mensuel fixe, heures supplémentaires sur la base de 160h/mois
+        overtime_rate = employee.base_salary / MONTHLY_HOURS * OVERTIME_RATE
+        return employee.base_salary, (overtime_rate * overtime_hours).quantize(CENT)
+
+    if employee.hourly_rate:
+        base_amount = employee.hourly_rate * Decimal(str(regular_hours))
+        overtime_amount = employee.hourly_rate * OVERTIME_RATE * overtime_hours
+        return base_amount.quantize(CENT), overtime_amount.quantize(CENT)
+
+    return None
+
+
+class PayrollEngine:
+    """Calcul et enregistrement en masse des fiches de paie d'un mois"""
+
+    def run(self, month, year, employee_ids=None, dry_run=False, skip_existing=False):
+        """Calculer la paie du mois pour les employés actifs ciblés (tous si None)
+
+        Les fiches déjà payées ne sont jamais modifiées; avec skip_existing,
+        aucune fiche existante ne l'est. Retourne la liste des résultats par
+        employé; les fiches sont écrites (sans commit) sauf en simulation.
+        """
+        period_start = date(year, month, 1)
+        period_end = date(year, month, calendar.monthrange(year, month)[1])
+
+        query = Employee.query.options(joinedload(Employee.user)).filter(Employee.is_active == True)
+        if employee_ids:
+            query = query.filter(Employee.id.in_(employee_ids))
+        employees = query.order_by(Employee.id).all()
+
+        ids = [employee.id for employee in employees]
+        hours = self._load_hours(ids, period_start, period_end)
+        existing = self._load_existing(ids, month, year)
+
+        results = []
+        inserts = []
+        updates = []
+        pending = []  # (ligne, résultat, employé) en attente des déductions
+
+        for employee in employees:
+            payroll = existing.get(employee.id)
+
+            if payroll and (payroll.status == 'paid' or skip_existing):
+                results.append({
+                    'employee_id': employee.id,
+                    'status': 'already_paid' if payroll.status == 'paid' else 'exists',
+                    'payroll_id': payroll.id,
+                    'message': f"Paie déjà {'versée' if payroll.status == 'paid' else 'générée'} pour {employee.full_name}"
+                })
+                continue
+
+            total_hours, overtime_hours = hours.get(employee.id, (0, 0))
+            regular_hours = total_hours - overtime_hours
+
+            amounts = gross_amounts(employee, regular_hours, overtime_hours)
+            if amounts is None:
+                results.append({
+                    'employee_id': employee.id,
+                    'status': 'error',
+                    'message': f"Pas de salaire défini pour {employee.full_name}"
+                })
+                continue
+
+            base_amount, overtime_amount = amounts
+            bonuses = Decimal('0')  # TODO: Implémenter la logique des bonus
+            gross_salary = base_amount + overtime_amount + bonuses
+            other_deductions = payroll.other_deductions if payroll else Decimal('0')
+
+            row = {
+                'regular_hours': float(regular_hours),
+                'overtime_hours': float(overtime_hours),
+                'base_amount': base_amount,
+                'overtime_amount': overtime_amount,
+                'bonuses': bonuses,
+                'gross_salary': gross_salary,
+                'other_deductions': other_deductions or Decimal('0'),
+                'status': 'draft'
+            }
+
+            if payroll:
+                row['id'] = payroll.id
+                updates.append(row)
+            else:
+                row.update(employee_id=employee.id, month=month, year=year,
+                           period_start=period_start, period_end=period_end)
+                inserts.append(row)
+
+            result = {
+                'employee_id': employee.id,
+                'employee_name': employee.full_name,
+                'status': 'calculated',
+                'payroll_id': payroll.id if payroll else None,
+                'gross_salary': float(gross_salary),
+                'hours': {
+                    'regular': row['regular_hours'],
+                    'overtime': row['overtime_hours']
+                }
+            }
+            results.append(result)
+            pending.append((row, result, employee))
+
+        # Déductions de tout le lot en une passe
+        deductions = deduction_calculator.compute_batch([{
+            'gross_salary': row['gross_salary'],
+            'birth_date': employee.birth_date,
+            'canton': employee.canton,
+            'other_deductions': row['other_deductions']
+        } for row, _, employee in pending], period_start)
+
+        for (row, result, _), values in zip(pending, deductions):
+            row.update(values)
+            result['net_salary'] = float(values['net_salary'])
+
+        if not dry_run:
+            self._write(month, year, inserts, updates, results)
+
+        return results
+
+    def recalculate_deductions(self, month, year, dry_run=False):
+        """Recalculer les déductions des fiches non payées d'un mois (changement de barème)
+
+        Une requête pour les fiches et les attributs des employés, un calcul
+        par lot et un UPDATE en masse. Retourne le nombre de fiches recalculées.
+        """
+        rows = db.session.query(
+            Payroll.id,
+            Payroll.gross_salary,
+            Payroll.other_deductions,
+            Employee.birth_date,
+            Employee.canton
+        ).join(
+            Employee, Payroll.employee_id == Employee.id
+        ).filter(
+            Payroll.month == month,
+            Payroll.year == year,
+            Payroll.status != 'paid',
+            Payroll.gross_salary != None
+        ).all()
+
+        deductions = deduction_calculator.compute_batch(
+            [row._asdict() for row in rows], date(year, month, 1)
+        )
+
+        updates = [dict(values, id=row.id) for row, values in zip(rows, deductions)]
+        if updates and not dry_run:
+            db.session.execute(update(Payroll), updates)
+
+        return len(updates)
+
+    def _load_hours(self, employee_ids, period_start, period_end):
+        """{employee_id: (heures totales, heures supplémentaires)} en une requête"""
+        if not employee_ids:
+            return {}
+
+        rows = db.session.query(
+            Attendance.employee_id,
+            func.coalesce(func.sum(Attendance.total_hours), 0),
+            func.coalesce(func.sum(Attendance.overtime_hours), 0)
+        ).filter(
+            Attendance.employee_id.in_(employee_ids),
+            Attendance.date >= period_start,
+            Attendance.date <= period_end
+        ).group_by(Attendance.employee_id)
+
+        return {employee_id: (total or 0, overtime or 0) for employee_id, total, overtime in rows}
+
+    def _load_existing(self, employee_ids, month, year):
+        """Fiches du mois déjà enregistrées, par employé, en une requête"""
+        if not employee_ids:
+            return {}
+
+        payrolls = Payroll.query.filter(
+            Payroll.employee_id.in_(employee_ids),
+            Payroll.month == month,
+            Payroll.year == year
+        ).all()
+        return {payroll.employee_id: payroll for payroll in payrolls}
+
+    def _write(self, month, year, inserts, updates, results):
+        """Écrire les fiches en masse et compléter les identifiants des nouvelles"""
+        if inserts:
+            db.session.execute(insert(Payroll), inserts)
+        if updates:
+            db.session.execute(update(Payroll), updates)
+
+        if inserts:
+            created = dict(
+                db.session.query(Payroll.employee_id, Payroll.id).filter(
+                    Payroll.employee_id.in_([row['employee_id'] for row in inserts]),
+                    Payroll.month == month,
+                    Payroll.year == year
+                )
+            )
+            for result in results:
+                if result['status'] == 'calculated' and result['payroll_id'] is None:
+                    result['payroll_id'] = created.get(result['employee_id'])
+
+
+# Instance globale
+payroll_engine = PayrollEngine()
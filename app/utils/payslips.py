@@ -0,0 +1,270 @@
+"""
+Génération des fiches de paie PDF en arrière-plan
+
+Chaque fiche est stockée sous un nom dérivé du contenu affiché
+(sha256 des valeurs de payslip_data et de la version du modèle):
+<PAYSLIP_FOLDER>/<2 premiers caractères>/<empreinte>.pdf. Une fiche dont les
+valeurs n'ont pas changé n'est jamais régénérée; une fiche modifiée obtient
+un nouveau fichier et l'ancien n'est plus référencé.
+
+Un lot est un PayslipJob: la requête HTTP crée le job et rend la main, un
+thread lit les fiches en une requête, écarte celles déjà en cache et répartit
+le rendu ReportLab sur un pool de processus. La progression est enregistrée
+sur le job au fil de l'eau (heartbeat_at), puis payslip_path est mis à jour
+en masse et les employés sont notifiés en un seul commit.
+
+Le thread vit dans le worker web: si le worker est recyclé ou tué, le job ne
+se termine jamais. status() marque donc en échec un job en cours dont la
+progression n'a pas été enregistrée depuis PAYSLIP_JOB_STALE_AFTER secondes.
+
+Le pool est propre à chaque processus: chaque worker gunicorn qui lance un
+job crée jusqu'à PAYSLIP_WORKERS processus de rendu. Le nombre total de
+processus ReportLab est donc borné par PAYSLIP_WORKERS x nombre de workers
+gunicorn (4 workers dans les déploiements fournis).
+"""
+
+from flask import current_app
+from app import db
+from app.models import Employee, Payroll, PayslipJob, Notification
+from app.utils.pdf import payslip_data, build_payslip
+from sqlalchemy import update
+from sqlalchemy.orm import joinedload
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+import atexit
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# À incrémenter à chaque modification de la mise en page (invalide le cache)
+PAYSLIP_TEMPLATE_VERSION = '1'
+
+PROGRESS_INTERVAL = 20  # fiches entre deux enregistrements de la progression
+
+PAYSLIP_JOB_STALE_AFTER = 600  # secondes sans progression avant abandon du job
+
+
+def payslip_digest(data):
+    """Empreinte du contenu d'une fiche de paie"""
+    payload = json.dumps([PAYSLIP_TEMPLATE_VERSION, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _render_to_file(data, path):
+    """Rendu d'une fiche dans un processus du pool (écriture atomique)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        build_payslip(temp_path, data)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return path
+
+
+class PayslipRenderer:
+    """Cache adressé par contenu + pool de processus pour les fiches de paie"""
+
+    def __init__(self):
+        self._pool = None
+        self._lock = threading.Lock()
+        self._exit_hook = False
+
+    def cache_path(self, app, data):
+        """Chemin du PDF correspondant à ces valeurs"""
+        digest = payslip_digest(data)
+        folder = app.config.get('PAYSLIP_FOLDER') or os.path.join(app.config['UPLOAD_FOLDER'], 'payslips')
+        return os.path.join(folder, digest[:2], f"{digest}.pdf")
+
+    def render(self, app, payroll):
+        """Chemin du PDF d'une fiche, rendu dans la requête seulement s'il manque"""
+        data = payslip_data(payroll)
+        path = self.cache_path(app, data)
+        if not os.path.exists(path):
+            _render_to_file(data, path)
+        return path
+
+    def submit(self, app, payroll_ids, notify=True):
+        """Créer un job pour ces fiches et le lancer en arrière-plan, retourner son id"""
+        job = PayslipJob(id=uuid.uuid4().hex, status='pending', total=len(payroll_ids),
+                         done=0, cached=0, failed=0)
+        db.session.add(job)
+        db.session.commit()
+
+        thread = threading.Thread(
+            target=self._run,
+            args=(app, job.id, list(payroll_ids), notify),
+            name=f'payslip-job-{job.id[:8]}',
+            daemon=True
+        )
+        thread.start()
+        return job.id
+
+    def status(self, job_id):
+        """État d'un job (dict) ou None s'il n'existe pas
+
+        Un job en attente ou en cours sans progression enregistrée depuis
+        PAYSLIP_JOB_STALE_AFTER secondes est marqué en échec (worker arrêté).
+        """
+        job = db.session.get(PayslipJob, job_id)
+        if job is None:
+            return None
+
+        if job.status in ('pending', 'running'):
+            stale_after = current_app.config.get('PAYSLIP_JOB_STALE_AFTER', PAYSLIP_JOB_STALE_AFTER)
+            last_seen = job.heartbeat_at or job.created_at
+            if last_seen and (datetime.utcnow() - last_seen).total_seconds() > stale_after:
+                logger.warning(f"Job fiches de paie {job_id} sans progression depuis {last_seen}: abandonné")
+                job.status = 'failed'
+                job.errors = (job.errors or []) + [{
+                    'payroll_id': None,
+                    'message': 'Job interrompu (processus arrêté avant la fin)'
+                }]
+                job.finished_at = datetime.utcnow()
+                db.session.commit()
+
+        return job.to_dict()
+
+    def shutdown(self):
+        """Arrêter le pool de processus (appelé à l'arrêt du processus)"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+    def _get_pool(self, app):
+        """Pool créé à la première utilisation dans le processus courant"""
+        with self._lock:
+            if self._pool is None:
+                # spawn: pas de fork d'un processus qui a des threads et des connexions ouvertes
+                self._pool = ProcessPoolExecutor(
+                    max_workers=app.config.get('PAYSLIP_WORKERS', 4),
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                if not self._exit_hook:
+                    atexit.register(self.shutdown)
+                    self._exit_hook = True
+            return self._pool
+
+    def _run(self, app, job_id, payroll_ids, notify):
+        with app.app_context():
+            try:
+                self._process(app, job_id, payroll_ids, notify)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Erreur job fiches de paie {job_id}: {e}")
+                job = db.session.get(PayslipJob, job_id)
+                if job:
+                    job.status = 'failed'
+                    job.errors = (job.errors or []) + [{'payroll_id': None, 'message': str(e)}]
+                    job.finished_at = datetime.utcnow()
+                    db.session.commit()
+
+    def _process(self, app, job_id, payroll_ids, notify):
+        job = db.session.get(PayslipJob, job_id)
+        job.status = 'running'
+        job.heartbeat_at = datetime.utcnow()
+
+        payrolls = Payroll.query.options(
+            joinedload(Payroll.employee).joinedload(Employee.user)
+        ).filter(
+            Payroll.id.in_(payroll_ids),
+            Payroll.status.in_(['validated', 'paid'])
+        ).all()
+
+        # Valeurs extraites avant les commits de progression (qui expirent les objets)
+        targets = []
+        for payroll in payrolls:
+            data = payslip_data(payroll)
+            user = payroll.employee.user
+            targets.append({
+                'payroll_id': payroll.id,
+                'user_id': user.id if user else None,
+                'month': payroll.month,
+                'year': payroll.year,
+                'current_path': payroll.payslip_path,
+                'path': self.cache_path(app, data),
+                'data': data
+            })
+
+        job.total = len(targets)
+        job.done = 0
+        job.cached = 0
+        job.failed = 0
+        errors = []
+
+        rendered = []
+        futures = {}
+        for target in targets:
+            if os.path.exists(target['path']):
+                job.cached += 1
+                job.done += 1
+                rendered.append(target)
+            else:
+                futures[target['path']] = target
+        db.session.commit()
+
+        if futures:
+            pool = self._get_pool(app)
+            pending = {pool.submit(_render_to_file, target['data'], path): target
+                       for path, target in futures.items()}
+            broken = False
+
+            for index, future in enumerate(as_completed(pending), 1):
+                target = pending[future]
+                try:
+                    future.result()
+                    rendered.append(target)
+                except Exception as e:
+                    logger.error(f"Erreur rendu fiche de paie {target['payroll_id']}: {e}")
+                    broken = broken or isinstance(e, BrokenProcessPool)
+                    job.failed += 1
+                    errors.append({'payroll_id': target['payroll_id'], 'message': str(e)})
+                job.done += 1
+
+                if index % PROGRESS_INTERVAL == 0:
+                    job.errors = list(errors)
+                    job.heartbeat_at = datetime.utcnow()
+                    db.session.commit()
+
+            if broken:
+                # Un processus du pool est mort: nouveau pool au prochain job
+                self.shutdown()
+
+        changed = [{'id': target['payroll_id'], 'payslip_path': target['path']}
+                   for target in rendered if target['current_path'] != target['path']]
+        if changed:
+            db.session.execute(update(Payroll), changed)
+
+        if notify:
+            db.session.add_all([
+                Notification(
+                    user_id=target['user_id'],
+                    title=f"Fiche de paie disponible - {target['month']}/{target['year']}",
+                    message="Votre fiche de paie est disponible dans votre espace personnel",
+                    type='info',
+                    category='payroll',
+                    link_url=f"/employee/payslips/{target['payroll_id']}"
+                )
+                for target in rendered if target['user_id']
+            ])
+
+        logger.info(f"Job fiches de paie {job_id}: {len(rendered)} disponibles "
+                    f"({job.cached} en cache), {job.failed} en erreur")
+
+        job.errors = errors
+        job.status = 'completed'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+
+# Instance globale
+payslip_renderer = PayslipRenderer()
@@ -4,8 +4,8 @@ Génération de documents PDF (factures, devis, fiches de paie)
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import mm
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
+from reportlab.lib.units import mm, inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, Frame
 from reportlab.pdfgen import canvas
 from io import BytesIO
 import qrcode
@@ -260,19 +260,63 @@ def generate_timesheet_pdf(employee, attendances, start_date, end_date):
     buffer.seek(0)
     return buffer
 
+def payslip_data(payroll):
+    """Valeurs affichées sur une fiche de paie (types simples, transmissibles à un autre processus)"""
+    employee = payroll.employee
+    
+    def amount(value):
+        return f'{(value or 0):.2f}'
+    
+    def rate(value):
+        return f'{(value or 0) / payroll.gross_salary * 100:.2f}%' if payroll.gross_salary else '-'
+    
+    return {
+        'payroll_id': payroll.id,
+        'month': payroll.month,
+        'year': payroll.year,
+        'employee': {
+            'full_name': employee.full_name,
+            'employee_code': employee.employee_code,
+            'department': employee.department or '-',
+            'position': employee.position or '-',
+            'hire_date': employee.hire_date.strftime('%d.%m.%Y') if employee.hire_date else '-',
+            'hourly_rate': f'{employee.hourly_rate:.2f}' if employee.hourly_rate else '-'
+        },
+        'regular_hours': f'{(payroll.regular_hours or 0):.2f}',
+        'overtime_hours': f'{(payroll.overtime_hours or 0):.2f}' if (payroll.overtime_hours or 0) > 0 else None,
+        'base_amount': amount(payroll.base_amount),
+        'overtime_amount': amount(payroll.overtime_amount),
+        'bonuses': amount(payroll.bonuses) if (payroll.bonuses or 0) > 0 else None,
+        'gross_salary': amount(payroll.gross_salary),
+        'deductions': [
+            ['AVS/AI/APG', rate(payroll.social_security), amount(payroll.social_security)],
+            ['AC', rate(payroll.unemployment), amount(payroll.unemployment)],
+            ['LPP', rate(payroll.pension), amount(payroll.pension)],
+            ['LAA', rate(payroll.accident_insurance), amount(payroll.accident_insurance)],
+            ['Impôt à la source', rate(payroll.tax_deduction), amount(payroll.tax_deduction)],
+        ],
+        'total_deductions': amount((payroll.gross_salary or 0) - (payroll.net_salary or 0)),
+        'net_salary': amount(payroll.net_salary)
+    }
+
 def generate_payslip_pdf(payroll):
     """Générer une fiche de paie PDF"""
     buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    build_payslip(buffer, payslip_data(payroll))
+    buffer.seek(0)
+    return buffer
+
+def payslip_story(data):
+    """Éléments ReportLab d'une fiche de paie (voir payslip_data)"""
     story = []
     styles = getSampleStyleSheet()
     
-    employee = payroll.employee
+    employee = data['employee']
     
     # En-tête entreprise
     header_data = [
         ['GLOBIBAT SA', '', 'BULLETIN DE SALAIRE'],
-        ['Rie des Tattes d\'Oie 93', '', f'{payroll.month:02d}/{payroll.year}'],
+        ['Rie des Tattes d\'Oie 93', '', f"{data['month']:02d}/{data['year']}"],
         ['1260 Nyon', '', ''],
         ['Vaud, Suisse', '', '']
     ]
@@ -291,11 +335,11 @@ def generate_payslip_pdf(payroll):
     
     # Informations employé
     employee_data = [
-        ['EMPLOYÉ:', employee.full_name],
-        ['Matricule:', employee.employee_code],
-        ['Département:', employee.department or '-'],
-        ['Fonction:', employee.position or '-'],
-        ['Date d\'entrée:', employee.hire_date.strftime('%d.%m.%Y')]
+        ['EMPLOYÉ:', employee['full_name']],
+        ['Matricule:', employee['employee_code']],
+        ['Département:', employee['department']],
+        ['Fonction:', employee['position']],
+        ['Date d\'entrée:', employee['hire_date']]
     ]
     
     employee_table = Table(employee_data, colWidths=[40*mm, 80*mm])
@@ -313,29 +357,27 @@ def generate_payslip_pdf(payroll):
         ['DESCRIPTION', 'BASE', 'TAUX/NOMBRE', 'MONTANT CHF'],
         ['', '', '', ''],
         ['REVENUS', '', '', ''],
-        ['Salaire de base', f'{payroll.regular_hours:.2f} h', f'{employee.hourly_rate:.2f}' if employee.hourly_rate else '-', f'{payroll.base_amount:.2f}'],
+        ['Salaire de base', f"{data['regular_hours']} h", employee['hourly_rate'], data['base_amount']],
     ]
     
-    if payroll.overtime_hours > 0:
-        salary_data.append(['Heures supplémentaires', f'{payroll.overtime_hours:.2f} h', '125%', f'{payroll.overtime_amount:.2f}'])
+    if data['overtime_hours']:
+        salary_data.append(['Heures supplémentaires', f"{data['overtime_hours']} h", '125%', data['overtime_amount']])
     
-    if payroll.bonuses > 0:
-        salary_data.append(['Primes', '', '', f'{payroll.bonuses:.2f}'])
+    if data['bonuses']:
+        salary_data.append(['Primes', '', '', data['bonuses']])
     
     salary_data.extend([
         ['', '', '', ''],
-        ['SALAIRE BRUT', '', '', f'{payroll.gross_salary:.2f}'],
+        ['SALAIRE BRUT', '', '', data['gross_salary']],
         ['', '', '', ''],
         ['DÉDUCTIONS', '', '', ''],
-        ['AVS/AI/APG', '', '5.25%', f'-{payroll.social_security:.2f}'],
-        ['AC', '', '1.1%', f'-{payroll.unemployment:.2f}'],
-        ['LPP', '', '7.5%', f'-{payroll.pension:.2f}'],
-        ['LAA', '', '0.81%', f'-{payroll.accident_insurance:.2f}'],
-        ['Impôt à la source', '', f'{(payroll.tax_deduction/payroll.gross_salary*100):.1f}%', f'-{payroll.tax_deduction:.2f}'],
+    ])
+    salary_data.extend([label, '', rate, f'-{amount}'] for label, rate, amount in data['deductions'])
+    salary_data.extend([
         ['', '', '', ''],
-        ['TOTAL DÉDUCTIONS', '', '', f'-{payroll.gross_salary - payroll.net_salary:.2f}'],
+        ['TOTAL DÉDUCTIONS', '', '', f"-{data['total_deductions']}"],
         ['', '', '', ''],
-        ['SALAIRE NET', '', '', f'{payroll.net_salary:.2f}']
+        ['SALAIRE NET', '', '', data['net_salary']]
     ])
     
     salary_table = Table(salary_data, colWidths=[70*mm, 35*mm, 35*mm, 40*mm])
@@ -366,7 +408,37 @@ def generate_payslip_pdf(payroll):
     story.append(Spacer(1, 20*mm))
     story.append(Paragraph(footer_text, styles['Normal']))
     
-    # Générer le PDF
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
\ No newline at end of file
+    return story
+
+def build_payslip(output, data):
+    """Écrire une fiche de paie PDF dans `output` (chemin ou fichier)"""
+    doc = SimpleDocTemplate(output, pagesize=A4)
+    doc.build(payslip_story(data))
+
+def build_payslip_bundle(output, payslips, title=None):
+    """Écrire plusieurs fiches de paie dans un seul PDF, retourner le nombre de fiches
+    
+    `payslips` est un itérable de payslip_data consommé une seule fois. Chaque
+    fiche est dessinée page par page sur le canvas (mêmes marges que
+    SimpleDocTemplate) puis libérée: seul le contenu des pages déjà dessinées
+    reste en mémoire jusqu'à l'écriture du fichier.
+    """
+    pdf = canvas.Canvas(output, pagesize=A4, pageCompression=1)
+    if title:
+        pdf.setTitle(title)
+    
+    width, height = A4
+    count = 0
+    for data in payslips:
+        story = payslip_story(data)
+        while story:
+            frame = Frame(inch, inch, width - 2 * inch, height - 2 * inch)
+            remaining = len(story)
+            frame.addFromList(story, pdf)
+            if len(story) == remaining:
+                raise ValueError(f"Fiche de paie {data['payroll_id']}: élément trop grand pour une page")
+            pdf.showPage()
+        count += 1
+    
+    pdf.save()
+    return count
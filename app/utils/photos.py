@@ -0,0 +1,190 @@
+"""
+Traitement asynchrone des photos de pointage
+
+Le pointage enregistre une référence provisoire ("pending:...") dans
+check_in_photo/check_out_photo puis confie la photo base64 à un pool de
+workers qui la décode, la recompresse avec Pillow (JPEG ou WebP), génère une
+miniature, l'écrit sur disque et remplace la référence provisoire par le
+chemin définitif.
+"""
+
+from app import db
+from app.models import Attendance
+from PIL import Image, ImageOps
+import atexit
+import base64
+import io
+import logging
+import os
+import queue
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+PENDING_PREFIX = 'pending:'
+PHOTO_FIELDS = ('check_in_photo', 'check_out_photo')
+
+_STOP = object()
+
+
+class PhotoPipeline:
+    """File bornée + pool de workers pour les photos de pointage
+
+    La mémoire est bornée en nombre de photos (PHOTO_QUEUE_SIZE) et en octets
+    (PHOTO_QUEUE_MAX_BYTES). Quand la file est pleine, la photo est traitée
+    dans la requête: le pointage est plus lent mais aucune photo n'est perdue.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._workers = []
+        self._app = None
+        self._pending_bytes = 0
+        self._lock = threading.Lock()
+        self._exit_hook = False
+
+    def placeholder(self, name):
+        """Référence provisoire à enregistrer sur le pointage avant le commit"""
+        return f"{PENDING_PREFIX}{name}-{uuid.uuid4().hex[:8]}"
+
+    def enqueue(self, app, attendance_id, field, placeholder, photo_data, name):
+        """Mettre en file une photo dont la référence provisoire est commitée
+
+        `photo_data` est la chaîne base64 reçue (préfixe data: URL accepté),
+        décodée uniquement par le worker.
+        """
+        if field not in PHOTO_FIELDS:
+            raise ValueError(f"Champ photo inconnu: {field}")
+
+        self._ensure_started(app)
+        size = len(photo_data)
+        job = (attendance_id, field, placeholder, photo_data, name)
+
+        with self._lock:
+            accepted = self._pending_bytes + size <= app.config.get('PHOTO_QUEUE_MAX_BYTES', 64 * 1024 * 1024)
+            if accepted:
+                try:
+                    self._queue.put_nowait(job)
+                    self._pending_bytes += size
+                except queue.Full:
+                    accepted = False
+
+        if not accepted:
+            logger.warning(f"File des photos pleine, traitement synchrone ({name})")
+            self._process(*job)
+
+    def flush(self):
+        """Attendre que toutes les photos en file soient écrites"""
+        if self._queue is not None:
+            self._queue.join()
+
+    def shutdown(self):
+        """Vider la file puis arrêter les workers (appelé à l'arrêt du processus)"""
+        if self._queue is None:
+            return
+
+        self.flush()
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join(timeout=10)
+
+        self._workers = []
+        self._queue = None
+
+    def _ensure_started(self, app):
+        """Démarrer les workers dans le processus courant (après fork gunicorn)"""
+        if self._workers and all(worker.is_alive() for worker in self._workers):
+            return
+
+        with self._lock:
+            if self._workers and all(worker.is_alive() for worker in self._workers):
+                return
+
+            self._app = app
+            self._queue = queue.Queue(maxsize=app.config.get('PHOTO_QUEUE_SIZE', 200))
+            self._pending_bytes = 0
+            self._workers = []
+
+            for index in range(app.config.get('PHOTO_WORKERS', 2)):
+                worker = threading.Thread(
+                    target=self._run,
+                    name=f'photo-worker-{index}',
+                    daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+
+            if not self._exit_hook:
+                atexit.register(self.shutdown)
+                self._exit_hook = True
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is _STOP:
+                    return
+
+                with self._lock:
+                    self._pending_bytes -= len(job[3])
+
+                with self._app.app_context():
+                    self._process(*job)
+            except Exception as e:
+                logger.error(f"Erreur traitement photo: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _process(self, attendance_id, field, placeholder, photo_data, name):
+        """Décoder, recompresser, écrire la photo et mettre à jour le pointage"""
+        app = self._app
+        path = None
+
+        try:
+            path = self._write(app, photo_data, name)
+        except Exception as e:
+            logger.error(f"Erreur sauvegarde photo {name}: {e}")
+
+        # Ne remplacer que la référence provisoire (un nouveau pointage a pu la modifier)
+        try:
+            db.session.query(Attendance).filter(
+                Attendance.id == attendance_id,
+                getattr(Attendance, field) == placeholder
+            ).update({field: path}, synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _write(self, app, photo_data, name):
+        """Écrire la photo recompressée et sa miniature, retourner le chemin relatif"""
+        if ',' in photo_data:
+            photo_data = photo_data.split(',', 1)[1]
+
+        image = Image.open(io.BytesIO(base64.b64decode(photo_data)))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+
+        photo_format = app.config.get('PHOTO_FORMAT', 'JPEG').upper()
+        extension = 'webp' if photo_format == 'WEBP' else 'jpg'
+        quality = app.config.get('PHOTO_QUALITY', 80)
+
+        folder = os.path.join(app.static_folder, 'uploads', 'attendance')
+        os.makedirs(folder, exist_ok=True)
+
+        max_size = app.config.get('PHOTO_MAX_SIZE', 1280)
+        image.thumbnail((max_size, max_size))
+        image.save(os.path.join(folder, f"{name}.{extension}"), photo_format,
+                   quality=quality, optimize=True)
+
+        thumb_size = app.config.get('PHOTO_THUMBNAIL_SIZE', 240)
+        image.thumbnail((thumb_size, thumb_size))
+        image.save(os.path.join(folder, f"{name}_thumb.{extension}"), photo_format,
+                   quality=quality, optimize=True)
+
+        return f"uploads/attendance/{name}.{extension}"
+
+
+# Instance globale
+photo_pipeline = PhotoPipeline()
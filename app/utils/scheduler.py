@@ -3,13 +3,39 @@ Planificateur de tâches automatiques
 """
 
 from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime, date
+from app import db
+from app.utils.leader import LeaderElection
+from datetime import datetime, date, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
 def start_scheduler(app):
-    """Démarrer le planificateur de tâches"""
+    """Démarrer l'élection du processus qui exécute les tâches planifiées
+    
+    Tous les processus participent à l'élection, mais seul le détenteur du
+    bail 'scheduler' démarre le BackgroundScheduler; s'il s'arrête ou perd
+    le bail, un autre processus prend le relais.
+    """
+    state = {'scheduler': None}
+    
+    def on_elected():
+        state['scheduler'] = build_scheduler(app)
+        state['scheduler'].start()
+        logger.info("Planificateur de tâches démarré")
+    
+    def on_demoted():
+        if state['scheduler'] is not None:
+            state['scheduler'].shutdown(wait=False)
+            state['scheduler'] = None
+            logger.info("Planificateur de tâches arrêté")
+    
+    election = LeaderElection(app, 'scheduler', on_elected, on_demoted)
+    election.start()
+    return election
+
+def build_scheduler(app):
+    """Construire le planificateur et ses tâches (non démarré)"""
     scheduler = BackgroundScheduler()
     
     # Tâche 1: Vérifier la conformité quotidienne (tous les jours à 22h)
@@ -50,59 +76,15 @@ def start_scheduler(app):
     def calculate_statistics():
         with app.app_context():
             try:
-                from app.models import Employee, EmployeeStatistics, Attendance, Expense
-                from sqlalchemy import func
+                from app.utils.statistics import attendance_rollup
                 
-                # Calculer les stats de la veille
+                # Statistiques de la veille, en deux requêtes groupées
                 yesterday = date.today() - timedelta(days=1)
-                
-                # Pour chaque employé actif
-                employees = Employee.query.filter_by(is_active=True).all()
-                
-                for emp in employees:
-                    # Vérifier si les stats existent déjà
-                    existing = EmployeeStatistics.query.filter_by(
-                        employee_id=emp.id,
-                        period_type='daily',
-                        period_start=yesterday
-                    ).first()
-                    
-                    if not existing:
-                        # Calculer les heures
-                        attendance = Attendance.query.filter_by(
-                            employee_id=emp.id,
-                            date=yesterday
-                        ).first()
-                        
-                        # Calculer les dépenses
-                        expenses = db.session.query(
-                            func.sum(Expense.total_amount)
-                        ).filter(
-                            Expense.employee_id == emp.id,
-                            Expense.expense_date == yesterday
-                        ).scalar() or 0
-                        
-                        # Créer les stats
-                        stats = EmployeeStatistics(
-                            employee_id=emp.id,
-                            period_type='daily',
-                            period_start=yesterday,
-                            period_end=yesterday,
-                            total_hours=attendance.total_hours if attendance else 0,
-                            regular_hours=(attendance.total_hours - attendance.overtime_hours) if attendance else 0,
-                            overtime_hours=attendance.overtime_hours if attendance else 0,
-                            days_present=1 if attendance else 0,
-                            days_absent=0 if attendance else 1,
-                            late_arrivals=1 if attendance and (attendance.is_late_morning or attendance.is_late_afternoon) else 0,
-                            total_expenses=expenses
-                        )
-                        
-                        db.session.add(stats)
-                
-                db.session.commit()
+                attendance_rollup.build_daily(yesterday, yesterday)
                 logger.info("Statistiques quotidiennes calculées")
                 
             except Exception as e:
+                db.session.rollback()
                 logger.error(f"Erreur calcul statistiques: {e}")
     
     # Tâche 4: Nettoyer les anciennes notifications (tous les dimanches à 3h)
@@ -153,88 +135,48 @@ def start_scheduler(app):
                 report_path = generate_weekly_management_report()
                 
                 # Envoyer aux managers et RH
-                from app.models import User
                 from app.utils.notifications import notification_service
                 
-                recipients = User.query.filter(
-                    User.role.in_(['admin', 'hr', 'manager'])
-                ).all()
-                
-                for user in recipients:
-                    notification_service.send_notification(
-                        user_id=user.id,
-                        title="Rapport hebdomadaire disponible",
-                        message="Le rapport de gestion hebdomadaire est prêt.",
-                        type='info',
-                        category='report',
-                        link_url=f"/reports/download/{report_path}"
-                    )
+                notification_service.send_bulk(
+                    roles=['admin', 'hr', 'manager'],
+                    title="Rapport hebdomadaire disponible",
+                    message="Le rapport de gestion hebdomadaire est prêt.",
+                    type='info',
+                    category='report',
+                    link_url=f"/reports/download/{report_path}"
+                )
                 
                 logger.info("Rapport hebdomadaire généré et distribué")
                 
             except Exception as e:
                 logger.error(f"Erreur génération rapport: {e}")
     
-    # Tâche 7: Mise à jour du dashboard (toutes les 5 minutes)
+    # Tâche 7: Réconciliation du dashboard (toutes les 5 minutes)
+    # Les variations sont appliquées en continu par les pointages, frais et
+    # congés; le recalcul complet corrige les écarts et prépare le lendemain.
     @scheduler.scheduled_job('interval', minutes=5)
     def update_dashboard():
         with app.app_context():
             try:
-                from app.views.dashboard import calculate_daily_labor_cost
-                from app.models import CompanyDashboard, Employee, Attendance, Expense, Leave, Project
+                from app.utils.dashboard_updater import dashboard_updater
                 
                 today = date.today()
-                dashboard = CompanyDashboard.query.filter_by(date=today).first()
-                
-                if not dashboard:
-                    dashboard = CompanyDashboard(date=today)
-                    db.session.add(dashboard)
-                
-                # Mettre à jour les métriques
-                dashboard.total_employees = Employee.query.filter_by(is_active=True).count()
-                
-                present_query = Attendance.query.filter(
-                    Attendance.date == today,
-                    Attendance.check_in_morning != None
-                )
-                dashboard.present_today = present_query.count()
-                
-                dashboard.total_hours_today = db.session.query(
-                    func.sum(Attendance.total_hours)
-                ).filter(Attendance.date == today).scalar() or 0
-                
-                dashboard.overtime_hours_today = db.session.query(
-                    func.sum(Attendance.overtime_hours)
-                ).filter(Attendance.date == today).scalar() or 0
-                
-                dashboard.labor_cost_today = calculate_daily_labor_cost(today)
-                
-                dashboard.expense_cost_today = db.session.query(
-                    func.sum(Expense.total_amount)
-                ).filter(
-                    Expense.expense_date == today,
-                    Expense.payment_status == 'approved'
-                ).scalar() or 0
-                
-                dashboard.active_projects = Project.query.filter_by(status='active').count()
-                
-                pending_expenses = Expense.query.filter_by(payment_status='pending').count()
-                pending_leaves = Leave.query.filter_by(status='pending').count()
-                dashboard.pending_approvals = pending_expenses + pending_leaves
-                
-                dashboard.last_updated = datetime.utcnow()
-                
-                db.session.commit()
+                dashboard_updater.reconcile(today)
+                dashboard_updater.prepare(today + timedelta(days=1))
                 
             except Exception as e:
+                db.session.rollback()
                 logger.error(f"Erreur mise à jour dashboard: {e}")
     
-    # Démarrer le planificateur
-    scheduler.start()
-    logger.info("Planificateur de tâches démarré")
-    
-    # S'assurer que le planificateur s'arrête proprement
-    import atexit
-    atexit.register(lambda: scheduler.shutdown())
+    # Tâche 8: Réconciliation des compteurs de notifications non lues (toutes les 10 minutes)
+    @scheduler.scheduled_job('interval', minutes=10)
+    def reconcile_unread_counters():
+        with app.app_context():
+            try:
+                from app.utils.unread_counter import unread_counter
+                unread_counter.reconcile()
+                
+            except Exception as e:
+                logger.error(f"Erreur réconciliation compteurs de notifications: {e}")
     
     return scheduler
\ No newline at end of file
@@ -0,0 +1,400 @@
+"""
+Agrégats de présence matérialisés par employé (journaliers, hebdomadaires, mensuels)
+
+Les lignes EmployeeStatistics de type daily/weekly/monthly sont maintenues
+au fil des pointages (voir Attendance.calculate_hours) et peuvent être
+reconstruites par la commande `flask backfill-statistics`.
+"""
+
+from app import db
+from app.models import Attendance, Employee, EmployeeStatistics, Expense
+from app.utils.business_calendar import business_calendar
+from datetime import datetime, date, timedelta
+from dateutil.relativedelta import relativedelta
+from decimal import Decimal
+from sqlalchemy import and_, or_, false, case, func, insert, update
+import logging
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_PERIODS = ('daily', 'weekly', 'monthly')
+
+# Colonnes de présence gérées par les agrégats
+ROLLUP_FIELDS = ('total_hours', 'regular_hours', 'overtime_hours', 'billable_hours',
+                 'days_present', 'late_arrivals', 'late_days', 'projects_worked')
+
+
+def period_bounds(period_type, day):
+    """Retourner (début, fin) de la période de type `period_type` contenant `day`"""
+    if period_type == 'daily':
+        return day, day
+    if period_type == 'weekly':
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=6)
+    start = day.replace(day=1)
+    return start, (start + relativedelta(months=1)) - timedelta(days=1)
+
+
+class AttendanceRollup:
+    """Maintien et lecture des agrégats de présence"""
+
+    def refresh_attendance(self, attendance):
+        """Mettre à jour les agrégats des périodes contenant un pointage"""
+        if not attendance.employee_id or not attendance.date:
+            return
+
+        periods = {p: period_bounds(p, attendance.date) for p in ROLLUP_PERIODS}
+        span_start = min(start for start, _ in periods.values())
+        span_end = max(end for _, end in periods.values())
+
+        rows = self._load_rows(span_start, span_end, employee_id=attendance.employee_id)
+        buckets = self._aggregate(rows)
+
+        keys = [(attendance.employee_id, p, start) for p, (start, _) in periods.items()]
+        self._upsert({key: buckets.get(key) for key in keys})
+
+    def backfill(self, start_date, end_date):
+        """Reconstruire les agrégats mois par mois sur une période"""
+        current = start_date.replace(day=1)
+        months = 0
+
+        while current <= end_date:
+            month_end = period_bounds('monthly', current)[1]
+            week_start = period_bounds('weekly', current)[0]
+            load_end = max(month_end, period_bounds('weekly', month_end)[1])
+
+            # Les semaines à cheval sur deux mois sont chargées en entier
+            rows = self._load_rows(week_start, load_end)
+            buckets = self._aggregate(rows)
+
+            def in_chunk(key):
+                _, period_type, period_start = key
+                if period_type == 'monthly':
+                    return period_start == current
+                if period_type == 'weekly':
+                    return week_start <= period_start <= month_end
+                return current <= period_start <= month_end
+
+            chunk = {key: values for key, values in buckets.items() if in_chunk(key)}
+
+            # Remettre à zéro les agrégats dont les pointages ont disparu
+            stale = EmployeeStatistics.query.filter(
+                and_(
+                    EmployeeStatistics.period_type.in_(ROLLUP_PERIODS),
+                    EmployeeStatistics.period_start >= week_start,
+                    EmployeeStatistics.period_start <= month_end
+                )
+            ).all()
+            for stats in stale:
+                key = (stats.employee_id, stats.period_type, stats.period_start)
+                if in_chunk(key) and key not in chunk:
+                    chunk[key] = None
+
+            self._upsert(chunk)
+            db.session.commit()
+            months += 1
+
+            current = month_end + timedelta(days=1)
+
+        logger.info(f"Agrégats de présence reconstruits sur {months} mois")
+        return months
+
+    def build_daily(self, start_date, end_date, chunk_days=31):
+        """Calculer les statistiques journalières complètes de tous les employés
+
+        Pour chaque tranche de `chunk_days` jours: une requête groupée sur les
+        pointages, une sur les dépenses, puis une écriture en masse des lignes
+        (heures, présences/absences sur les jours ouvrés, dépenses par
+        catégorie). Rejouable sur n'importe quelle période.
+        """
+        current = start_date
+        days = 0
+
+        while current <= end_date:
+            chunk_end = min(end_date, current + timedelta(days=chunk_days - 1))
+            values = self._daily_values(current, chunk_end)
+            self._bulk_upsert_daily(current, chunk_end, values)
+            db.session.commit()
+
+            days += (chunk_end - current).days + 1
+            current = chunk_end + timedelta(days=1)
+
+        logger.info(f"Statistiques journalières calculées sur {days} jours")
+        return days
+
+    def period_filter(self, start_date, end_date):
+        """Filtre couvrant [start_date, end_date] avec le moins de lignes possible
+
+        Les mois entiers sont lus dans les agrégats mensuels, les bords de la
+        période dans les agrégats journaliers.
+        """
+        month_starts = []
+        day_ranges = []
+        current = start_date
+
+        while current <= end_date:
+            month_end = period_bounds('monthly', current)[1]
+            if current.day == 1 and month_end <= end_date:
+                month_starts.append(current)
+            else:
+                day_ranges.append((current, min(month_end, end_date)))
+            current = month_end + timedelta(days=1)
+
+        clauses = []
+        if month_starts:
+            clauses.append(and_(
+                EmployeeStatistics.period_type == 'monthly',
+                EmployeeStatistics.period_start.in_(month_starts)
+            ))
+        for range_start, range_end in day_ranges:
+            clauses.append(and_(
+                EmployeeStatistics.period_type == 'daily',
+                EmployeeStatistics.period_start >= range_start,
+                EmployeeStatistics.period_start <= range_end
+            ))
+
+        return or_(*clauses) if clauses else false()
+
+    def _daily_values(self, start_date, end_date):
+        """Valeurs journalières par (employé, jour) depuis deux requêtes groupées"""
+        values = {}
+
+        attendance_rows = db.session.query(
+            Attendance.employee_id,
+            Attendance.date,
+            func.sum(Attendance.total_hours).label('total_hours'),
+            func.sum(Attendance.overtime_hours).label('overtime_hours'),
+            func.sum(case((Attendance.project_id != None, Attendance.total_hours), else_=0)).label('billable_hours'),
+            func.sum(
+                case((Attendance.is_late_morning == True, 1), else_=0) +
+                case((Attendance.is_late_afternoon == True, 1), else_=0)
+            ).label('late_arrivals'),
+            func.max(case(
+                (or_(Attendance.is_late_morning == True, Attendance.is_late_afternoon == True), 1),
+                else_=0
+            )).label('late_days'),
+            func.count(func.distinct(Attendance.project_id)).label('projects_worked')
+        ).filter(
+            Attendance.date >= start_date,
+            Attendance.date <= end_date
+        ).group_by(Attendance.employee_id, Attendance.date)
+
+        for row in attendance_rows:
+            total = row.total_hours or 0
+            overtime = row.overtime_hours or 0
+            values[(row.employee_id, row.date)] = {
+                'total_hours': round(total, 2),
+                'regular_hours': round(total - overtime, 2),
+                'overtime_hours': round(overtime, 2),
+                'billable_hours': round(row.billable_hours or 0, 2),
+                'days_present': 1,
+                'days_absent': 0,
+                'late_arrivals': int(row.late_arrivals or 0),
+                'late_days': int(row.late_days or 0),
+                'projects_worked': row.projects_worked or 0,
+                'total_expenses': Decimal('0'),
+                'expenses_by_category': None
+            }
+
+        expense_rows = db.session.query(
+            Expense.employee_id,
+            Expense.expense_date,
+            Expense.category,
+            func.sum(Expense.total_amount).label('amount')
+        ).filter(
+            Expense.expense_date >= start_date,
+            Expense.expense_date <= end_date
+        ).group_by(Expense.employee_id, Expense.expense_date, Expense.category)
+
+        for row in expense_rows:
+            entry = values.get((row.employee_id, row.expense_date))
+            if entry is None:
+                entry = values[(row.employee_id, row.expense_date)] = self._empty_day()
+            amount = Decimal(str(row.amount or 0))
+            entry['total_expenses'] += amount
+            categories = entry['expenses_by_category'] or {}
+            category = row.category or 'Autre'
+            categories[category] = round(categories.get(category, 0) + float(amount), 2)
+            entry['expenses_by_category'] = categories
+
+        # Absences: employés actifs sans pointage un jour ouvré
+        employees = db.session.query(Employee.id, Employee.hire_date, Employee.end_date).filter(
+            Employee.is_active == True
+        ).all()
+
+        day = start_date
+        while day <= end_date:
+            if business_calendar.is_working_day(day):
+                for employee in employees:
+                    if employee.hire_date and employee.hire_date > day:
+                        continue
+                    if employee.end_date and employee.end_date < day:
+                        continue
+                    entry = values.get((employee.id, day))
+                    if entry is None:
+                        entry = values[(employee.id, day)] = self._empty_day()
+                    if not entry['days_present']:
+                        entry['days_absent'] = 1
+            day += timedelta(days=1)
+
+        return values
+
+    def _empty_day(self):
+        entry = {field: 0 for field in ROLLUP_FIELDS}
+        entry.update(days_absent=0, total_expenses=Decimal('0'), expenses_by_category=None)
+        return entry
+
+    def _bulk_upsert_daily(self, start_date, end_date, values):
+        """Écrire en masse les lignes journalières d'une période"""
+        existing = {
+            (row.employee_id, row.period_start): row.id
+            for row in db.session.query(
+                EmployeeStatistics.id,
+                EmployeeStatistics.employee_id,
+                EmployeeStatistics.period_start
+            ).filter(
+                EmployeeStatistics.period_type == 'daily',
+                EmployeeStatistics.period_start >= start_date,
+                EmployeeStatistics.period_start <= end_date
+            )
+        }
+
+        now = datetime.utcnow()
+        inserts = []
+        updates = []
+
+        for (employee_id, day), entry in values.items():
+            row = dict(entry, calculated_at=now)
+            stats_id = existing.pop((employee_id, day), None)
+            if stats_id is None:
+                row.update(employee_id=employee_id, period_type='daily',
+                           period_start=day, period_end=day)
+                inserts.append(row)
+            else:
+                row['id'] = stats_id
+                updates.append(row)
+
+        # Lignes sans activité ni absence (pointage supprimé): remises à zéro
+        for stats_id in existing.values():
+            row = self._empty_day()
+            row.update(id=stats_id, calculated_at=now)
+            updates.append(row)
+
+        if inserts:
+            db.session.execute(insert(EmployeeStatistics), inserts)
+        if updates:
+            db.session.execute(update(EmployeeStatistics), updates)
+
+    def _load_rows(self, start_date, end_date, employee_id=None):
+        """Charger les colonnes utiles des pointages d'une période"""
+        query = db.session.query(
+            Attendance.employee_id,
+            Attendance.date,
+            Attendance.total_hours,
+            Attendance.overtime_hours,
+            Attendance.is_late_morning,
+            Attendance.is_late_afternoon,
+            Attendance.project_id
+        ).filter(
+            and_(
+                Attendance.date >= start_date,
+                Attendance.date <= end_date
+            )
+        )
+
+        if employee_id:
+            query = query.filter(Attendance.employee_id == employee_id)
+
+        return query.order_by(Attendance.employee_id, Attendance.date).yield_per(1000)
+
+    def _aggregate(self, rows):
+        """Regrouper les pointages par (employé, type de période, début)"""
+        buckets = {}
+
+        for row in rows:
+            total = row.total_hours or 0
+            overtime = row.overtime_hours or 0
+            late = int(bool(row.is_late_morning)) + int(bool(row.is_late_afternoon))
+
+            for period_type in ROLLUP_PERIODS:
+                period_start, period_end = period_bounds(period_type, row.date)
+                key = (row.employee_id, period_type, period_start)
+
+                bucket = buckets.get(key)
+                if bucket is None:
+                    bucket = buckets[key] = {
+                        'period_end': period_end,
+                        'total_hours': 0,
+                        'overtime_hours': 0,
+                        'billable_hours': 0,
+                        'days_present': 0,
+                        'late_arrivals': 0,
+                        'late_days': 0,
+                        'projects': set()
+                    }
+
+                bucket['total_hours'] += total
+                bucket['overtime_hours'] += overtime
+                bucket['days_present'] += 1
+                bucket['late_arrivals'] += late
+                bucket['late_days'] += int(late > 0)
+                if row.project_id:
+                    bucket['billable_hours'] += total
+                    bucket['projects'].add(row.project_id)
+
+        return buckets
+
+    def _upsert(self, buckets):
+        """Écrire les agrégats (None = remettre la période à zéro)"""
+        if not buckets:
+            return
+
+        employee_ids = {key[0] for key in buckets}
+        period_starts = {key[2] for key in buckets}
+
+        existing = {
+            (stats.employee_id, stats.period_type, stats.period_start): stats
+            for stats in EmployeeStatistics.query.filter(
+                and_(
+                    EmployeeStatistics.employee_id.in_(employee_ids),
+                    EmployeeStatistics.period_type.in_(ROLLUP_PERIODS),
+                    EmployeeStatistics.period_start.in_(period_starts)
+                )
+            ).all()
+        }
+
+        now = datetime.utcnow()
+
+        for key, values in buckets.items():
+            employee_id, period_type, period_start = key
+            stats = existing.get(key)
+
+            if stats is None:
+                if values is None:
+                    continue
+                stats = EmployeeStatistics(
+                    employee_id=employee_id,
+                    period_type=period_type,
+                    period_start=period_start,
+                    period_end=values['period_end']
+                )
+                db.session.add(stats)
+
+            if values is None:
+                for field in ROLLUP_FIELDS:
+                    setattr(stats, field, 0)
+            else:
+                stats.total_hours = round(values['total_hours'], 2)
+                stats.overtime_hours = round(values['overtime_hours'], 2)
+                stats.regular_hours = round(values['total_hours'] - values['overtime_hours'], 2)
+                stats.billable_hours = round(values['billable_hours'], 2)
+                stats.days_present = values['days_present']
+                stats.late_arrivals = values['late_arrivals']
+                stats.late_days = values['late_days']
+                stats.projects_worked = len(values['projects'])
+
+            stats.calculated_at = now
+
+
+# Instance globale
+attendance_rollup = AttendanceRollup()
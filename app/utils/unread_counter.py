@@ -0,0 +1,223 @@
+"""
+Compteur de notifications non lues par utilisateur
+
+Évite un COUNT sur la table des notifications à chaque page rendue
+(inject_globals). Les valeurs sont gardées en mémoire, ou dans Redis quand
+la configuration le prévoit (CACHE_TYPE='redis' et CACHE_REDIS_URL), puis:
+- incrémentées après chaque commit créant une notification non lue
+  (NotificationService.send_notification et créations directes dans les vues);
+- décrémentées par NotificationService.mark_notifications_as_read;
+- réconciliées périodiquement avec la base (tâche planifiée) et expirées après
+  UNREAD_COUNTER_TTL secondes, ce qui borne l'écart entre workers gunicorn.
+"""
+
+from app import db
+from app.models import Notification
+from flask import current_app
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+from collections import defaultdict
+import logging
+import threading
+import time
+
+try:
+    import redis
+except ImportError:  # Redis optionnel
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+UNREAD_COUNTER_TTL = 300  # secondes
+
+# Ajustement atomique: INCRBY seulement si la clé existe (son TTL est conservé),
+# suppression si le compteur devient négatif
+ADD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+local value = redis.call('INCRBY', KEYS[1], ARGV[1])
+if value < 0 then
+    redis.call('DEL', KEYS[1])
+end
+return value
+"""
+
+
+class UnreadNotificationCounter:
+    """Cache des compteurs de notifications non lues"""
+
+    KEY = 'unread_notifications:{}'
+
+    def __init__(self):
+        self._local = {}
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._scripts = {}
+
+    def get(self, user_id):
+        """Nombre de notifications non lues (COUNT seulement si absent du cache)"""
+        client = self._redis()
+
+        if client is not None:
+            try:
+                value = client.get(self.KEY.format(user_id))
+                if value is not None:
+                    return int(value)
+            except redis.RedisError as e:
+                logger.warning(f"Redis indisponible pour le compteur de notifications: {e}")
+                client = None
+        else:
+            entry = self._local.get(user_id)
+            if entry and entry[1] > time.monotonic():
+                return entry[0]
+
+        count = Notification.query.filter_by(user_id=user_id, is_read=False).count()
+        self._store({user_id: count}, client)
+        return count
+
+    def add(self, user_id, delta):
+        """Ajuster un compteur déjà en cache (sinon il sera calculé à la lecture)"""
+        if not delta:
+            return
+
+        client = self._redis()
+
+        if client is not None:
+            try:
+                self._scripts[client](keys=[self.KEY.format(user_id)], args=[delta])
+            except redis.RedisError as e:
+                logger.warning(f"Redis indisponible pour le compteur de notifications: {e}")
+            return
+
+        with self._lock:
+            entry = self._local.get(user_id)
+            if entry:
+                self._local[user_id] = (max(0, entry[0] + delta), entry[1])
+
+    def invalidate(self, user_id=None):
+        """Oublier un compteur (ou tous) pour forcer un recalcul"""
+        client = self._redis()
+
+        if client is not None:
+            try:
+                if user_id is not None:
+                    client.delete(self.KEY.format(user_id))
+                else:
+                    for key in client.scan_iter(self.KEY.format('*')):
+                        client.delete(key)
+            except redis.RedisError as e:
+                logger.warning(f"Redis indisponible pour le compteur de notifications: {e}")
+
+        with self._lock:
+            if user_id is not None:
+                self._local.pop(user_id, None)
+            else:
+                self._local.clear()
+
+    def reconcile(self):
+        """Recaler tous les compteurs sur la base en une requête GROUP BY"""
+        counts = dict(
+            db.session.query(Notification.user_id, func.count(Notification.id))
+            .filter(Notification.is_read == False)
+            .group_by(Notification.user_id)
+            .all()
+        )
+
+        client = self._redis()
+
+        if client is not None:
+            try:
+                # Utilisateurs en cache sans notification non lue
+                for key in client.scan_iter(self.KEY.format('*')):
+                    counts.setdefault(int(key.rsplit(':', 1)[1]), 0)
+            except redis.RedisError as e:
+                logger.warning(f"Redis indisponible pour le compteur de notifications: {e}")
+                client = None
+        else:
+            for user_id in list(self._local):
+                counts.setdefault(user_id, 0)
+
+        self._store(counts, client)
+        logger.info(f"Compteurs de notifications réconciliés ({len(counts)} utilisateurs)")
+        return len(counts)
+
+    def _store(self, counts, client):
+        ttl = current_app.config.get('UNREAD_COUNTER_TTL', UNREAD_COUNTER_TTL)
+
+        if client is not None:
+            try:
+                pipe = client.pipeline()
+                for user_id, count in counts.items():
+                    pipe.set(self.KEY.format(user_id), count, ex=ttl)
+                pipe.execute()
+                return
+            except redis.RedisError as e:
+                logger.warning(f"Redis indisponible pour le compteur de notifications: {e}")
+
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            for user_id, count in counts.items():
+                self._local[user_id] = (count, expires_at)
+
+    def _redis(self):
+        """Client Redis si configuré et disponible, sinon None (cache local)"""
+        if redis is None or current_app.config.get('CACHE_TYPE') != 'redis':
+            return None
+
+        url = current_app.config.get('CACHE_REDIS_URL')
+        if not url:
+            return None
+
+        client = self._clients.get(url)
+        if client is None:
+            client = self._clients[url] = redis.Redis.from_url(url, decode_responses=True)
+            self._scripts[client] = client.register_script(ADD_SCRIPT)
+        return client
+
+
+# Instance globale
+unread_counter = UnreadNotificationCounter()
+
+
+# Variations en attente de commit, par session: {user_id: delta}
+def _pending_deltas(target):
+    session = Session.object_session(target)
+    if session is None:
+        return None
+    return session.info.setdefault('unread_deltas', defaultdict(int))
+
+
+@event.listens_for(Notification, 'after_insert')
+def _notification_created(mapper, connection, target):
+    deltas = _pending_deltas(target)
+    if deltas is not None and not target.is_read:
+        deltas[target.user_id] += 1
+
+
+@event.listens_for(Notification, 'after_update')
+def _notification_updated(mapper, connection, target):
+    history = inspect(target).attrs.is_read.history
+    deltas = _pending_deltas(target)
+    if deltas is not None and history.has_changes():
+        deltas[target.user_id] += -1 if target.is_read else 1
+
+
+@event.listens_for(Notification, 'after_delete')
+def _notification_deleted(mapper, connection, target):
+    deltas = _pending_deltas(target)
+    if deltas is not None and not target.is_read:
+        deltas[target.user_id] -= 1
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_unread_deltas(session):
+    deltas = session.info.pop('unread_deltas', None)
+    if deltas:
+        for user_id, delta in deltas.items():
+            unread_counter.add(user_id, delta)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_unread_deltas(session):
+    session.info.pop('unread_deltas', None)
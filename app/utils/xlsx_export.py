@@ -0,0 +1,100 @@
+"""
+Export XLSX en mémoire constante
+
+Les feuilles sont remplies ligne par ligne depuis un générateur avec openpyxl
+en mode write-only: les lignes sont écrites au fil de l'eau dans des fichiers
+temporaires puis compressées dans un fichier temporaire envoyé au client.
+Aucun DataFrame ni classeur complet n'est gardé en mémoire, ce qui permet des
+exports de plusieurs mois pour toute l'entreprise. Les largeurs de colonnes
+viennent de la définition des colonnes (pas de parcours des cellules).
+
+Exemple:
+    export = XlsxExport()
+    export.add_sheet('Pointages', [('Date', 12), ('Heures', 10)], rows)
+    return export.response('pointages.xlsx')
+"""
+
+from flask import send_file
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment
+from openpyxl.utils import get_column_letter
+import tempfile
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class StyledRow:
+    """Ligne mise en forme (total, titre de section) dans un générateur de lignes"""
+
+    __slots__ = ('values', 'style')
+
+    def __init__(self, values, style='bold'):
+        self.values = values
+        self.style = style
+
+
+class XlsxExport:
+    """Classeur write-only construit feuille par feuille"""
+
+    def __init__(self, header_color='4CAF50'):
+        self.workbook = Workbook(write_only=True)
+        self.styles = {
+            'header': {
+                'font': Font(bold=True, color='FFFFFF'),
+                'fill': PatternFill('solid', fgColor=header_color),
+                'alignment': Alignment(horizontal='center', vertical='center')
+            },
+            'bold': {
+                'font': Font(bold=True)
+            },
+            'section': {
+                'font': Font(bold=True, size=12),
+                'fill': PatternFill('solid', fgColor='E0E0E0')
+            }
+        }
+
+    def add_sheet(self, title, columns, rows):
+        """Ajouter une feuille et retourner le nombre de lignes écrites
+
+        `columns` est la liste des (en-tête, largeur), `rows` un itérable de
+        listes de valeurs ou de StyledRow, consommé une seule fois.
+        """
+        sheet = self.workbook.create_sheet(title=title[:31])
+
+        for index, (_, width) in enumerate(columns, 1):
+            sheet.column_dimensions[get_column_letter(index)].width = width
+
+        sheet.append([self._cell(sheet, header, 'header') for header, _ in columns])
+
+        count = 0
+        for row in rows:
+            if isinstance(row, StyledRow):
+                sheet.append([self._cell(sheet, value, row.style) for value in row.values])
+            else:
+                sheet.append(row)
+            count += 1
+
+        return count
+
+    def save(self):
+        """Écrire le classeur dans un fichier temporaire positionné au début"""
+        output = tempfile.TemporaryFile(suffix='.xlsx')
+        self.workbook.save(output)
+        output.seek(0)
+        return output
+
+    def response(self, filename):
+        """Réponse Flask envoyant le classeur depuis le fichier temporaire"""
+        return send_file(
+            self.save(),
+            mimetype=XLSX_MIMETYPE,
+            as_attachment=True,
+            download_name=filename
+        )
+
+    def _cell(self, sheet, value, style):
+        cell = WriteOnlyCell(sheet, value=value)
+        for attribute, setting in self.styles[style].items():
+            setattr(cell, attribute, setting)
+        return cell
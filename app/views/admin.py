@@ -6,6 +6,7 @@ from flask_login import login_required, current_user
 from app import db
 from app.models import User, Role, Employee, Attendance, Leave, Payroll
 from app.utils.decorators import admin_required
+from app.utils.payroll_engine import payroll_engine
 from datetime import datetime, date
 from werkzeug.security import generate_password_hash
 
@@ -371,58 +372,10 @@ def payroll_generate():
     year = request.form.get('year', type=int)
     employee_ids = request.form.getlist('employee_ids[]', type=int)
     
-    generated_count = 0
-    
-    for employee_id in employee_ids:
-        employee = Employee.query.get(employee_id)
-        if not employee:
-            continue
-        
-        # Vérifier si la fiche existe déjà
-        existing = Payroll.query.filter_by(
-            employee_id=employee_id,
-            month=month,
-            year=year
-        ).first()
-        
-        if existing:
-            continue
-        
-        # Calculer les heures travaillées ce mois
-        attendances = Attendance.query.filter_by(
-            employee_id=employee_id
-        ).filter(
-            db.extract('month', Attendance.date) == month,
-            db.extract('year', Attendance.date) == year
-        ).all()
-        
-        regular_hours = sum(min(a.total_hours, 8) for a in attendances)
-        overtime_hours = sum(max(a.total_hours - 8, 0) for a in attendances)
-        
-        # Créer la fiche de paie
-        payroll = Payroll(
-            employee_id=employee_id,
-            month=month,
-            year=year,
-            regular_hours=regular_hours,
-            overtime_hours=overtime_hours
-        )
-        
-        # Calculer les montants
-        if employee.hourly_rate:
-            payroll.base_amount = regular_hours * employee.hourly_rate
-            payroll.overtime_amount = overtime_hours * employee.hourly_rate * 1.25
-        elif employee.base_salary:
-            payroll.base_amount = employee.base_salary
-            payroll.overtime_amount = (employee.base_salary / 173) * overtime_hours * 1.25
-        
-        payroll.gross_salary = payroll.base_amount + payroll.overtime_amount
-        
-        # Calculer les déductions
-        payroll.calculate_deductions()
-        
-        db.session.add(payroll)
-        generated_count += 1
+    # Même calcul que l'API de paie (base 160h, barème de déductions en vigueur);
+    # les fiches existantes sont conservées
+    results = payroll_engine.run(month, year, employee_ids, skip_existing=True) if employee_ids else []
+    generated_count = sum(1 for result in results if result['status'] == 'calculated')
     
     db.session.commit()
     
@@ -7,9 +7,12 @@ from app import db
 from app.models import (Employee, Attendance, Leave, Payroll, Expense, 
                        Project, Invoice, EmployeeStatistics, CompanyDashboard,
                        WorkTimeRegulation)
+from app.utils.statistics import attendance_rollup
+from app.utils.business_calendar import business_calendar
 from datetime import datetime, date, timedelta
 from dateutil.relativedelta import relativedelta
-from sqlalchemy import and_, or_, func, extract, distinct
+from sqlalchemy import and_, or_, func, extract, distinct, case
+from sqlalchemy.orm import joinedload
 from decimal import Decimal
 import calendar
 import json
@@ -76,15 +79,17 @@ def hr_metrics():
         # Absentéisme
         absenteeism_data = calculate_absenteeism_metrics(year)
         
-        # Heures supplémentaires
+        # Heures supplémentaires (agrégats mensuels)
         overtime_metrics = db.session.query(
-            extract('month', Attendance.date).label('month'),
-            func.sum(Attendance.overtime_hours).label('total_overtime'),
-            func.count(distinct(Attendance.employee_id)).label('employees_with_overtime')
+            extract('month', EmployeeStatistics.period_start).label('month'),
+            func.sum(EmployeeStatistics.overtime_hours).label('total_overtime'),
+            func.count(distinct(EmployeeStatistics.employee_id)).label('employees_with_overtime')
         ).filter(
             and_(
-                extract('year', Attendance.date) == year,
-                Attendance.overtime_hours > 0
+                EmployeeStatistics.period_type == 'monthly',
+                EmployeeStatistics.period_start >= date(year, 1, 1),
+                EmployeeStatistics.period_start <= date(year, 12, 31),
+                EmployeeStatistics.overtime_hours > 0
             )
         ).group_by('month').all()
         
@@ -254,17 +259,16 @@ def productivity_analysis():
         else:
             end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
         
-        # Heures travaillées vs heures facturées
+        # Heures travaillées vs heures facturées (agrégats de présence)
         productivity_data = db.session.query(
             Employee,
-            func.sum(Attendance.total_hours).label('worked_hours'),
-            func.sum(case([(Attendance.project_id != None, Attendance.total_hours)], else_=0)).label('billable_hours')
+            func.sum(EmployeeStatistics.total_hours).label('worked_hours'),
+            func.sum(EmployeeStatistics.billable_hours).label('billable_hours')
         ).join(
-            Attendance, Employee.id == Attendance.employee_id
+            EmployeeStatistics, Employee.id == EmployeeStatistics.employee_id
         ).filter(
             and_(
-                Attendance.date >= start_date,
-                Attendance.date <= end_date,
+                attendance_rollup.period_filter(start_date, end_date),
                 Employee.is_active == True
             )
         )
@@ -301,24 +305,28 @@ def productivity_analysis():
         
         # Productivité par jour de la semaine
         daily_productivity = db.session.query(
-            func.extract('dow', Attendance.date).label('day_of_week'),
-            func.avg(Attendance.total_hours).label('avg_hours')
+            func.extract('dow', EmployeeStatistics.period_start).label('day_of_week'),
+            func.avg(EmployeeStatistics.total_hours).label('avg_hours')
         ).filter(
             and_(
-                Attendance.date >= start_date,
-                Attendance.date <= end_date
+                EmployeeStatistics.period_type == 'daily',
+                EmployeeStatistics.period_start >= start_date,
+                EmployeeStatistics.period_start <= end_date,
+                EmployeeStatistics.days_present > 0
             )
         ).group_by('day_of_week').all()
         
-        # Tendances de productivité
+        # Tendances de productivité (agrégats hebdomadaires)
         weekly_trends = db.session.query(
-            func.date_trunc('week', Attendance.date).label('week'),
-            func.sum(Attendance.total_hours).label('total_hours'),
-            func.count(distinct(Attendance.employee_id)).label('active_employees')
+            EmployeeStatistics.period_start.label('week'),
+            func.sum(EmployeeStatistics.total_hours).label('total_hours'),
+            func.count(distinct(EmployeeStatistics.employee_id)).label('active_employees')
         ).filter(
             and_(
-                Attendance.date >= start_date,
-                Attendance.date <= end_date
+                EmployeeStatistics.period_type == 'weekly',
+                EmployeeStatistics.period_start >= start_date - timedelta(days=start_date.weekday()),
+                EmployeeStatistics.period_start <= end_date,
+                EmployeeStatistics.days_present > 0
             )
         ).group_by('week').order_by('week').all()
         
@@ -470,43 +478,70 @@ def calculate_company_kpis(start_date, end_date):
     }
 
 def get_monthly_trends(start_date, end_date):
-    """Obtenir les tendances mensuelles"""
+    """Obtenir les tendances mensuelles
+    
+    Une seule requête groupée par (année, mois) pour chaque source
+    (factures, paies, présences), fusionnée ensuite en mémoire.
+    """
+    first_month = start_date.replace(day=1)
+    last_month = end_date.replace(day=1)
+    window_end = (last_month + relativedelta(months=1)) - timedelta(days=1)
+    
+    # Chiffre d'affaires facturé par mois
+    revenue_rows = db.session.query(
+        extract('year', Invoice.issue_date).label('year'),
+        extract('month', Invoice.issue_date).label('month'),
+        func.sum(Invoice.total_amount).label('total')
+    ).filter(
+        and_(
+            Invoice.issue_date >= first_month,
+            Invoice.issue_date <= window_end,
+            Invoice.status != 'cancelled'
+        )
+    ).group_by('year', 'month').all()
+    
+    # Masse salariale versée par mois (clé année * 12 + mois)
+    period_key = Payroll.year * 12 + Payroll.month
+    cost_rows = db.session.query(
+        Payroll.year,
+        Payroll.month,
+        func.sum(Payroll.gross_salary).label('total')
+    ).filter(
+        and_(
+            period_key >= first_month.year * 12 + first_month.month,
+            period_key <= last_month.year * 12 + last_month.month,
+            Payroll.status == 'paid'
+        )
+    ).group_by(Payroll.year, Payroll.month).all()
+    
+    # Heures travaillées par mois
+    hours_rows = db.session.query(
+        extract('year', Attendance.date).label('year'),
+        extract('month', Attendance.date).label('month'),
+        func.sum(Attendance.total_hours).label('total')
+    ).filter(
+        and_(
+            Attendance.date >= first_month,
+            Attendance.date <= window_end
+        )
+    ).group_by('year', 'month').all()
+    
+    revenue = {(int(y), int(m)): total for y, m, total in revenue_rows}
+    costs = {(int(y), int(m)): total for y, m, total in cost_rows}
+    hours = {(int(y), int(m)): total for y, m, total in hours_rows}
+    
     trends = []
-    current = start_date.replace(day=1)
+    current = first_month
     
     while current <= end_date:
-        month_end = (current + relativedelta(months=1)) - timedelta(days=1)
-        
-        # Métriques du mois
-        revenue = db.session.query(func.sum(Invoice.total_amount)).filter(
-            and_(
-                Invoice.issue_date >= current,
-                Invoice.issue_date <= month_end,
-                Invoice.status != 'cancelled'
-            )
-        ).scalar() or 0
-        
-        costs = db.session.query(func.sum(Payroll.gross_salary)).filter(
-            and_(
-                Payroll.month == current.month,
-                Payroll.year == current.year,
-                Payroll.status == 'paid'
-            )
-        ).scalar() or 0
-        
-        hours = db.session.query(func.sum(Attendance.total_hours)).filter(
-            and_(
-                Attendance.date >= current,
-                Attendance.date <= month_end
-            )
-        ).scalar() or 0
+        key = (current.year, current.month)
         
         trends.append({
             'month': current.strftime('%Y-%m'),
             'month_name': f"{calendar.month_name[current.month]} {current.year}",
-            'revenue': float(revenue),
-            'costs': float(costs),
-            'hours': float(hours or 0)
+            'revenue': float(revenue.get(key) or 0),
+            'costs': float(costs.get(key) or 0),
+            'hours': float(hours.get(key) or 0)
         })
         
         current += relativedelta(months=1)
@@ -558,7 +593,7 @@ def calculate_absenteeism_metrics(year):
     ).scalar() or 0
     
     # Jours ouvrés théoriques
-    working_days = calculate_working_days(date(year, 1, 1), date(year, 12, 31))
+    working_days = business_calendar.working_days(date(year, 1, 1), date(year, 12, 31))
     active_employees = Employee.query.filter_by(is_active=True).count()
     theoretical_days = working_days * active_employees
     
@@ -571,68 +606,82 @@ def calculate_absenteeism_metrics(year):
         'avg_days_per_employee': round(float(absences) / active_employees, 1) if active_employees > 0 else 0
     }
 
-def identify_top_performers(year):
-    """Identifier les top performers"""
-    # Basé sur plusieurs critères
-    employees = Employee.query.filter_by(is_active=True).all()
+def identify_top_performers(year, limit=10):
+    """Identifier les top performers
+    
+    Le score composite est calculé en SQL pour tous les employés en une
+    seule agrégation groupée par employé; seuls les `limit` premiers
+    employés sont ensuite chargés.
+    """
+    year_start = date(year, 1, 1)
+    year_end = date(year, 12, 31)
+    
+    # Critères: taux de présence, heures supp. (modérées), projets
+    worked_days = func.count(Attendance.id)
+    overtime = func.coalesce(func.sum(Attendance.overtime_hours), 0)
+    projects = func.count(distinct(Attendance.project_id))
+    capped_overtime = case((overtime > 100, 100), else_=overtime)
+    score = (worked_days * 0.4) + (capped_overtime * 0.3) + (projects * 10)
+    
+    ranking = db.session.query(
+        Attendance.employee_id,
+        worked_days.label('attendance_days'),
+        overtime.label('overtime_hours'),
+        projects.label('projects'),
+        score.label('score')
+    ).join(
+        Employee, Employee.id == Attendance.employee_id
+    ).filter(
+        and_(
+            Employee.is_active == True,
+            Attendance.date >= year_start,
+            Attendance.date <= year_end
+        )
+    ).group_by(
+        Attendance.employee_id
+    ).order_by(
+        score.desc(), Attendance.employee_id
+    ).limit(limit).all()
+    
+    metrics = {
+        row.employee_id: (row.attendance_days, float(row.overtime_hours or 0), row.projects)
+        for row in ranking
+    }
+    ranked_ids = [row.employee_id for row in ranking]
+    
+    # Compléter avec des employés sans pointage si le classement est incomplet
+    if len(ranked_ids) < limit:
+        filler = Employee.query.with_entities(Employee.id).filter(
+            Employee.is_active == True
+        )
+        if ranked_ids:
+            filler = filler.filter(~Employee.id.in_(ranked_ids))
+        ranked_ids += [emp_id for (emp_id,) in filler.order_by(Employee.id).limit(limit - len(ranked_ids))]
+    
+    if not ranked_ids:
+        return []
+    
+    employees = {
+        emp.id: emp for emp in Employee.query.options(
+            joinedload(Employee.user)
+        ).filter(Employee.id.in_(ranked_ids)).all()
+    }
     
     performers = []
-    for emp in employees:
-        # Taux de présence
-        worked_days = Attendance.query.filter(
-            and_(
-                Attendance.employee_id == emp.id,
-                extract('year', Attendance.date) == year
-            )
-        ).count()
-        
-        # Heures supplémentaires (modérées)
-        overtime = db.session.query(
-            func.sum(Attendance.overtime_hours)
-        ).filter(
-            and_(
-                Attendance.employee_id == emp.id,
-                extract('year', Attendance.date) == year
-            )
-        ).scalar() or 0
-        
-        # Projets
-        projects = db.session.query(
-            func.count(distinct(Attendance.project_id))
-        ).filter(
-            and_(
-                Attendance.employee_id == emp.id,
-                Attendance.project_id != None,
-                extract('year', Attendance.date) == year
-            )
-        ).scalar() or 0
-        
-        # Score composite
-        score = (worked_days * 0.4) + (min(float(overtime), 100) * 0.3) + (projects * 10)
+    for emp_id in ranked_ids:
+        emp = employees[emp_id]
+        worked, overtime_hours, project_count = metrics.get(emp_id, (0, 0.0, 0))
         
         performers.append({
             'employee_id': emp.id,
             'name': emp.full_name,
             'department': emp.department,
-            'score': round(score, 1),
+            'score': round((worked * 0.4) + (min(overtime_hours, 100) * 0.3) + (project_count * 10), 1),
             'metrics': {
-                'attendance_days': worked_days,
-                'overtime_hours': float(overtime),
-                'projects': projects
+                'attendance_days': worked,
+                'overtime_hours': overtime_hours,
+                'projects': project_count
             }
         })
     
-    # Trier par score
-    performers.sort(key=lambda x: x['score'], reverse=True)
-    
-    return performers[:10]  # Top 10
-
-def calculate_working_days(start_date, end_date):
-    """Calculer le nombre de jours ouvrés"""
-    days = 0
-    current = start_date
-    while current <= end_date:
-        if current.weekday() < 5:
-            days += 1
-        current += timedelta(days=1)
-    return days
\ No newline at end of file
+    return performers
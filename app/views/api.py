@@ -1,7 +1,7 @@
 """
 Blueprint API - Endpoints REST
 """
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, Response, current_app
 from flask_login import login_required, current_user
 from app import db
 from app.models import (
@@ -450,6 +450,54 @@ def calendar_events():
 # NOTIFICATIONS
 # =======================
 
+@bp.route('/events')
+@login_required
+def event_stream():
+    """Flux SSE: nouvelles notifications et évolutions du tableau de bord
+    
+    Remplace l'interrogation périodique de /notifications/unread et de
+    /api/dashboard/overview. La connexion est fermée après SSE_MAX_DURATION
+    secondes; EventSource se reconnecte automatiquement.
+    """
+    from app.utils.events import event_broker, format_sse
+    from app.utils.unread_counter import unread_counter
+    import queue
+    import time
+    
+    app = current_app._get_current_object()
+    user_id = current_user.id
+    unread = unread_counter.get(user_id)
+    snapshot = event_broker.dashboard_snapshot()
+    subscriber = event_broker.subscribe(app, user_id)
+    
+    keepalive = app.config.get('SSE_KEEPALIVE', 15)
+    deadline = time.monotonic() + app.config.get('SSE_MAX_DURATION', 300)
+    
+    # Tout est lu: rendre la connexion au pool avant d'ouvrir le flux, qui
+    # s'exécute hors contexte de requête et n'utilise pas la base
+    db.session.remove()
+    
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            yield format_sse('unread', {'count': unread})
+            
+            if snapshot:
+                yield format_sse('dashboard', snapshot)
+            
+            while time.monotonic() < deadline:
+                try:
+                    yield subscriber['queue'].get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            event_broker.unsubscribe(subscriber)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Pas de mise en tampon nginx
+    })
+
 @bp.route('/notifications/unread')
 @login_required
 def unread_notifications():
@@ -6,6 +6,7 @@ Séparé du site public
 from flask import Blueprint, render_template, request, jsonify
 from app import db
 from app.models import Employee, Attendance
+from app.utils.badge_credentials import credential_index
 from datetime import datetime, date
 from sqlalchemy import and_
 
@@ -30,7 +31,7 @@ def check():
             }), 400
         
         # Trouver l'employé
-        employee = Employee.query.filter_by(badge_number=badge_number, is_active=True).first()
+        employee = credential_index.resolve('badge', badge_number)
         
         if not employee:
             return jsonify({
@@ -79,24 +80,8 @@ def check():
             attendance.check_out_evening = current_time
             action_type = "check_out"
             
-            # Calculer les heures totales
-            morning_hours = 0
-            afternoon_hours = 0
-            
-            if attendance.check_in_morning and attendance.check_out_lunch:
-                morning_delta = attendance.check_out_lunch - attendance.check_in_morning
-                morning_hours = morning_delta.total_seconds() / 3600
-            
-            if attendance.check_in_afternoon and attendance.check_out_evening:
-                afternoon_delta = attendance.check_out_evening - attendance.check_in_afternoon
-                afternoon_hours = afternoon_delta.total_seconds() / 3600
-            
-            total_hours = round(morning_hours + afternoon_hours, 2)
-            attendance.total_hours = total_hours
-            
-            # Calculer les heures supplémentaires (> 8h)
-            if total_hours > 8:
-                attendance.overtime_hours = round(total_hours - 8, 2)
+            # Calculer les heures totales (met aussi à jour les agrégats de présence)
+            total_hours = attendance.calculate_hours()
             
             message = f"Bonne soirée {employee.user.first_name}! Départ enregistré à {current_time.strftime('%H:%M')}. Total: {total_hours}h"
         else:
@@ -5,8 +5,9 @@ Système de badgage avancé avec QR codes, PIN, photos et géolocalisation
 from flask import Blueprint, render_template, request, jsonify, current_app
 from werkzeug.utils import secure_filename
 from app import db
-from app.models import Employee, Attendance, AuditLog
-from app.utils.decorators import log_action
+from app.models import Employee, Attendance, AuditLog, BadgeSyncEvent
+from app.utils.badge_credentials import credential_index, hash_pin
+from app.utils.photos import photo_pipeline
 from datetime import datetime, date, timedelta
 from sqlalchemy import and_, or_, func
 import os
@@ -72,8 +73,85 @@ def generate_employee_qr(employee_id):
         }
     })
 
+def apply_check_event(employee, attendance, current_time, auth_method, device_info=None,
+                      latitude=None, longitude=None, location_name=None, photo_path=None):
+    """Appliquer un pointage à la journée d'un employé
+
+    Machine d'états commune au pointage en direct et à la synchronisation
+    des terminaux hors ligne: arrivée, pause de midi, reprise puis départ.
+    Retourne (attendance, action_type, message, photo_field); action_type
+    vaut None si tous les pointages du jour sont déjà enregistrés.
+    """
+    photo_field = None
+    
+    if not attendance:
+        # Premier pointage - Arrivée
+        attendance = Attendance(
+            employee_id=employee.id,
+            date=current_time.date(),
+            check_in_morning=current_time,
+            check_method=auth_method,
+            device_info=device_info,
+            latitude=latitude,
+            longitude=longitude,
+            location_name=location_name,
+            check_in_photo=photo_path
+        )
+        photo_field = 'check_in_photo'
+        
+        # Vérifier si en retard (après 8h30)
+        if current_time.time() > datetime.strptime("08:30", "%H:%M").time():
+            attendance.is_late_morning = True
+        
+        db.session.add(attendance)
+        action_type = "check_in"
+        message = f"Bonjour {employee.full_name}! Arrivée enregistrée à {current_time.strftime('%H:%M')}"
+        
+    elif not attendance.check_out_lunch and current_time.hour < 14:
+        # Départ midi
+        attendance.check_out_lunch = current_time
+        action_type = "check_out"
+        message = f"Bon appétit {employee.full_name}! Pause déjeuner à {current_time.strftime('%H:%M')}"
+        
+    elif not attendance.check_in_afternoon and current_time.hour >= 12:
+        # Retour après-midi
+        attendance.check_in_afternoon = current_time
+        
+        # Vérifier si en retard (après 14h00)
+        if current_time.time() > datetime.strptime("14:00", "%H:%M").time():
+            attendance.is_late_afternoon = True
+            
+        action_type = "check_in"
+        message = f"Bon retour {employee.full_name}! Reprise à {current_time.strftime('%H:%M')}"
+        
+    elif not attendance.check_out_evening:
+        # Départ final
+        attendance.check_out_evening = current_time
+        attendance.check_out_photo = photo_path
+        photo_field = 'check_out_photo'
+        
+        # Calculer les heures totales
+        attendance.calculate_hours()
+        
+        action_type = "check_out"
+        message = f"Bonne soirée {employee.full_name}! Journée terminée à {current_time.strftime('%H:%M')}. Total: {attendance.total_hours}h"
+        
+        # Vérifier la conformité
+        if attendance.total_hours > 10:
+            message += " ⚠️ Attention: dépassement des heures maximales journalières!"
+            
+    else:
+        return attendance, None, 'Tous les pointages du jour sont déjà enregistrés.', None
+    
+    # Mettre à jour les infos de localisation
+    attendance.latitude = latitude
+    attendance.longitude = longitude
+    attendance.location_name = location_name
+    attendance.device_info = device_info
+    
+    return attendance, action_type, message, photo_field
+
 @badge_advanced_bp.route('/check-in', methods=['POST'])
-@log_action('badge_checkin')
 def check_in_advanced():
     """Pointage avancé avec multiple méthodes d'authentification"""
     try:
@@ -94,17 +172,8 @@ def check_in_advanced():
         # Info appareil
         device_info = data.get('device_info', request.headers.get('User-Agent'))
         
-        # Trouver l'employé selon la méthode
-        employee = None
-        
-        if auth_method == 'badge':
-            employee = Employee.query.filter_by(badge_number=auth_value, is_active=True).first()
-        elif auth_method == 'qr_code':
-            employee = Employee.query.filter_by(qr_code=auth_value, is_active=True).first()
-        elif auth_method == 'pin':
-            # Vérifier le PIN (haché pour la sécurité)
-            pin_hash = hashlib.sha256(auth_value.encode()).hexdigest()
-            employee = Employee.query.filter_by(pin_code=pin_hash, is_active=True).first()
+        # Trouver l'employé selon la méthode (index en mémoire, PIN haché)
+        employee = credential_index.resolve(auth_method, auth_value)
         
         if not employee:
             return jsonify({
@@ -137,101 +206,28 @@ def check_in_advanced():
         message = ""
         photo_path = None
         
-        # Sauvegarder la photo si fournie
+        # La photo est traitée en arrière-plan: le pointage ne garde
+        # qu'une référence provisoire jusqu'à l'écriture du fichier
         if photo_data:
-            try:
-                # Décoder la photo base64
-                photo_binary = base64.b64decode(photo_data.split(',')[1])
-                
-                # Créer le nom de fichier
-                timestamp = current_time.strftime('%Y%m%d_%H%M%S')
-                filename = f"{employee.employee_code}_{timestamp}.jpg"
-                
-                # Créer le dossier si nécessaire
-                os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-                
-                # Sauvegarder la photo
-                photo_path = os.path.join(UPLOAD_FOLDER, filename)
-                with open(photo_path, 'wb') as f:
-                    f.write(photo_binary)
-                    
-                # Chemin relatif pour la DB
-                photo_path = f"uploads/attendance/{filename}"
-                
-            except Exception as e:
-                current_app.logger.error(f"Erreur sauvegarde photo: {e}")
+            photo_name = f"{employee.employee_code}_{current_time.strftime('%Y%m%d_%H%M%S')}"
+            photo_path = photo_pipeline.placeholder(photo_name)
         
         # Déterminer l'action et mettre à jour
-        if not attendance:
-            # Premier pointage - Arrivée
-            attendance = Attendance(
-                employee_id=employee.id,
-                date=today,
-                check_in_morning=current_time,
-                check_method=auth_method,
-                device_info=device_info,
-                latitude=latitude,
-                longitude=longitude,
-                location_name=location_name,
-                check_in_photo=photo_path
-            )
-            
-            # Vérifier si en retard (après 8h30)
-            if current_time.time() > datetime.strptime("08:30", "%H:%M").time():
-                attendance.is_late_morning = True
-            
-            db.session.add(attendance)
-            action_type = "check_in"
-            message = f"Bonjour {employee.full_name}! Arrivée enregistrée à {current_time.strftime('%H:%M')}"
-            
-        elif not attendance.check_out_lunch and current_time.hour < 14:
-            # Départ midi
-            attendance.check_out_lunch = current_time
-            action_type = "check_out"
-            message = f"Bon appétit {employee.full_name}! Pause déjeuner à {current_time.strftime('%H:%M')}"
-            
-        elif not attendance.check_in_afternoon and current_time.hour >= 12:
-            # Retour après-midi
-            attendance.check_in_afternoon = current_time
-            
-            # Vérifier si en retard (après 14h00)
-            if current_time.time() > datetime.strptime("14:00", "%H:%M").time():
-                attendance.is_late_afternoon = True
-                
-            action_type = "check_in"
-            message = f"Bon retour {employee.full_name}! Reprise à {current_time.strftime('%H:%M')}"
-            
-        elif not attendance.check_out_evening:
-            # Départ final
-            attendance.check_out_evening = current_time
-            attendance.check_out_photo = photo_path
-            
-            # Calculer les heures totales
-            attendance.calculate_hours()
-            
-            action_type = "check_out"
-            message = f"Bonne soirée {employee.full_name}! Journée terminée à {current_time.strftime('%H:%M')}. Total: {attendance.total_hours}h"
-            
-            # Vérifier la conformité
-            if attendance.total_hours > 10:
-                message += " ⚠️ Attention: dépassement des heures maximales journalières!"
-                
-        else:
+        attendance, action_type, message, photo_field = apply_check_event(
+            employee, attendance, current_time, auth_method,
+            device_info=device_info, latitude=latitude, longitude=longitude,
+            location_name=location_name, photo_path=photo_path
+        )
+        
+        if not action_type:
             return jsonify({
                 'success': False,
-                'message': 'Tous les pointages du jour sont déjà enregistrés.'
+                'message': message
             }), 400
         
-        # Mettre à jour les infos de localisation
-        attendance.latitude = latitude
-        attendance.longitude = longitude
-        attendance.location_name = location_name
-        attendance.device_info = device_info
-        
-        db.session.commit()
-        
-        # Log d'audit
-        AuditLog(
+        # Log d'audit, dans la transaction du pointage (pas de second commit)
+        db.session.flush()
+        db.session.add(AuditLog(
             user_id=employee.user_id if employee.user else None,
             action='attendance_check',
             model='Attendance',
@@ -239,7 +235,15 @@ def check_in_advanced():
             description=f"{action_type} via {auth_method}",
             category='hr',
             user_ip=request.remote_addr
-        )
+        ))
+        
+        db.session.commit()
+        
+        if photo_path and photo_field:
+            photo_pipeline.enqueue(
+                current_app._get_current_object(), attendance.id, photo_field,
+                photo_path, photo_data, photo_name
+            )
         
         return jsonify({
             'success': True,
@@ -267,6 +271,197 @@ def check_in_advanced():
             'message': 'Erreur lors du pointage. Veuillez réessayer.'
         }), 500
 
+@badge_advanced_bp.route('/sync', methods=['POST'])
+def sync_offline_events():
+    """Synchroniser en un aller-retour les pointages mis en file par un terminal
+    
+    Chaque événement porte une clé d'idempotence: un événement déjà reçu
+    n'est pas rejoué et son résultat d'origine est renvoyé. Les événements
+    sont appliqués par employé dans l'ordre chronologique avec la même
+    machine d'états que le pointage en direct, puis commités en une seule
+    transaction.
+    
+    Seuls les terminaux de BADGE_TERMINALS sont acceptés. Un événement daté
+    de plus de BADGE_SYNC_MAX_SKEW secondes dans le futur ou de plus de
+    BADGE_SYNC_MAX_AGE secondes dans le passé est refusé (statut 'invalid').
+    """
+    try:
+        data = request.get_json() or {}
+        terminal_id = data.get('terminal_id')
+        events = data.get('events') or []
+        
+        if not terminal_id or terminal_id not in current_app.config.get('BADGE_TERMINALS', []):
+            return jsonify({
+                'success': False,
+                'message': 'Terminal non enregistré.'
+            }), 403
+        
+        max_events = current_app.config.get('BADGE_SYNC_MAX_EVENTS', 1000)
+        if len(events) > max_events:
+            return jsonify({
+                'success': False,
+                'message': f'Lot trop volumineux (maximum {max_events} événements).'
+            }), 413
+        
+        keys = [event.get('idempotency_key') for event in events if event.get('idempotency_key')]
+        known = {
+            sync_event.idempotency_key: sync_event
+            for sync_event in BadgeSyncEvent.query.filter(
+                BadgeSyncEvent.idempotency_key.in_(keys)
+            ).all()
+        } if keys else {}
+        
+        now = datetime.now()
+        latest = now + timedelta(seconds=current_app.config.get('BADGE_SYNC_MAX_SKEW', 300))
+        earliest = now - timedelta(seconds=current_app.config.get('BADGE_SYNC_MAX_AGE', 7 * 24 * 3600))
+        
+        results = {}
+        records = {}
+        pending = []
+        seen = set()
+        
+        for position, event in enumerate(events):
+            key = event.get('idempotency_key')
+            
+            if not key:
+                results[position] = {
+                    'idempotency_key': None,
+                    'success': False,
+                    'status': 'invalid',
+                    'message': "Clé d'idempotence manquante."
+                }
+                continue
+            
+            if key in known:
+                results[position] = known[key].to_result(duplicate=True)
+                continue
+            
+            if key in seen:
+                results[position] = {
+                    'idempotency_key': key,
+                    'success': False,
+                    'status': 'invalid',
+                    'message': 'Clé en double dans le lot.'
+                }
+                continue
+            seen.add(key)
+            
+            try:
+                event_time = datetime.fromisoformat(event.get('timestamp'))
+            except (TypeError, ValueError):
+                results[position] = {
+                    'idempotency_key': key,
+                    'success': False,
+                    'status': 'invalid',
+                    'message': 'Horodatage invalide (format ISO 8601 attendu).'
+                }
+                continue
+            
+            if event_time.tzinfo:
+                # Heure locale du serveur, comme les pointages en direct
+                event_time = event_time.astimezone().replace(tzinfo=None)
+            
+            if not earliest <= event_time <= latest:
+                results[position] = {
+                    'idempotency_key': key,
+                    'success': False,
+                    'status': 'invalid',
+                    'message': 'Horodatage hors de la fenêtre de synchronisation acceptée.'
+                }
+                continue
+            
+            auth_method = event.get('method')
+            employee = credential_index.resolve(auth_method, event.get('value'))
+            
+            record = BadgeSyncEvent(
+                idempotency_key=key,
+                terminal_id=terminal_id,
+                employee_id=employee.id if employee else None,
+                event_time=event_time,
+                check_method=auth_method,
+                status='pending'  # Colonne non nulle: la ligne peut être autoflushée avant son résultat
+            )
+            db.session.add(record)
+            records[position] = record
+            
+            if not employee:
+                record.status = 'rejected'
+                record.message = 'Authentification échouée. Vérifiez vos identifiants.'
+                continue
+            
+            pending.append((employee.id, event_time, position, employee, event))
+        
+        # Pointages existants des employés et jours concernés, en une requête
+        attendances = {}
+        if pending:
+            employee_ids = {item[0] for item in pending}
+            days = [item[1].date() for item in pending]
+            for attendance in Attendance.query.filter(
+                and_(
+                    Attendance.employee_id.in_(employee_ids),
+                    Attendance.date >= min(days),
+                    Attendance.date <= max(days)
+                )
+            ).all():
+                attendances[(attendance.employee_id, attendance.date)] = attendance
+        
+        photo_jobs = []
+        
+        for employee_id, event_time, position, employee, event in sorted(pending, key=lambda item: item[:3]):
+            record = records[position]
+            day_key = (employee_id, event_time.date())
+            
+            photo_path = None
+            photo_name = None
+            if event.get('photo'):
+                photo_name = f"{employee.employee_code}_{event_time.strftime('%Y%m%d_%H%M%S')}"
+                photo_path = photo_pipeline.placeholder(photo_name)
+            
+            attendance, action_type, message, photo_field = apply_check_event(
+                employee, attendances.get(day_key), event_time, record.check_method,
+                device_info=event.get('device_info', terminal_id),
+                latitude=event.get('latitude'),
+                longitude=event.get('longitude'),
+                location_name=event.get('location_name'),
+                photo_path=photo_path
+            )
+            attendances[day_key] = attendance
+            
+            record.status = 'applied' if action_type else 'rejected'
+            record.action_type = action_type
+            record.message = message[:255]
+            record.attendance = attendance
+            
+            if action_type and photo_path and photo_field:
+                photo_jobs.append((attendance, photo_field, photo_path, event['photo'], photo_name))
+        
+        db.session.commit()
+        
+        app = current_app._get_current_object()
+        for attendance, photo_field, photo_path, photo_data, photo_name in photo_jobs:
+            photo_pipeline.enqueue(app, attendance.id, photo_field, photo_path, photo_data, photo_name)
+        
+        for position, record in records.items():
+            results[position] = record.to_result()
+        
+        ordered = [results[position] for position in range(len(events))]
+        
+        return jsonify({
+            'success': True,
+            'terminal_id': terminal_id,
+            'received': len(events),
+            'applied': sum(1 for result in ordered if result['status'] == 'applied' and not result.get('duplicate')),
+            'results': ordered
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Erreur synchronisation terminal: {e}")
+        return jsonify({
+            'success': False,
+            'message': 'Erreur lors de la synchronisation. Le lot peut être renvoyé.'
+        }), 500
+
 @badge_advanced_bp.route('/attendance/today')
 def get_today_attendance():
     """Obtenir la liste des présences du jour"""
@@ -372,7 +567,7 @@ def set_employee_pin():
         employee = Employee.query.get_or_404(employee_id)
         
         # Hasher le PIN pour la sécurité
-        employee.pin_code = hashlib.sha256(new_pin.encode()).hexdigest()
+        employee.pin_code = hash_pin(new_pin)
         
         db.session.commit()
         
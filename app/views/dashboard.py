@@ -2,137 +2,109 @@
 Tableaux de bord et rapports avancés
 """
 
-from flask import Blueprint, render_template, request, jsonify, send_file, current_app
+from flask import (Blueprint, render_template, request, jsonify, send_file, current_app,
+                   Response, stream_with_context)
 from app import db
 from app.models import (Employee, Attendance, Leave, Payroll, Expense, 
                        EmployeeStatistics, CompanyDashboard, WorkTimeRegulation,
-                       Project, Invoice)
+                       Project, Invoice, User)
 from app.utils.pdf import generate_timesheet_pdf, generate_payslip_pdf
+from app.utils.statistics import attendance_rollup
+from app.utils.business_calendar import business_calendar
+from app.utils.dashboard_updater import dashboard_updater, serialize_dashboard
+from app.utils.labor_cost import labor_cost_service
+from app.utils.xlsx_export import XlsxExport, StyledRow
 from datetime import datetime, date, timedelta
 from sqlalchemy import and_, or_, func, extract
 from decimal import Decimal
-import pandas as pd
-import io
+import json
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/api/dashboard')
 
+def report_period(period, start_date=None, end_date=None):
+    """Bornes (début, fin) d'une période de rapport: day, week, biweek, month, custom"""
+    today = date.today()
+    
+    if period == 'day':
+        return today, today
+    if period == 'week':
+        start = today - timedelta(days=today.weekday())
+        return start, start + timedelta(days=6)
+    if period == 'biweek':
+        start = today - timedelta(days=today.weekday() + 7)
+        return start, start + timedelta(days=13)
+    if period == 'month':
+        start = today.replace(day=1)
+        next_month = start.replace(day=28) + timedelta(days=4)
+        return start, next_month - timedelta(days=next_month.day)
+    if period == 'custom' and start_date and end_date:
+        return (datetime.strptime(start_date, '%Y-%m-%d').date(),
+                datetime.strptime(end_date, '%Y-%m-%d').date())
+    
+    return today - timedelta(days=7), today
+
 @dashboard_bp.route('/overview')
 def company_overview():
     """Vue d'ensemble de l'entreprise"""
     try:
         today = date.today()
         
-        # Récupérer ou créer le dashboard du jour
-        dashboard = CompanyDashboard.query.filter_by(date=today).first()
-        
-        if not dashboard or (datetime.now() - dashboard.last_updated).seconds > 300:  # Refresh toutes les 5 min
-            # Calculer les stats
-            total_employees = Employee.query.filter_by(is_active=True).count()
-            
-            # Présences du jour
-            present_query = Attendance.query.filter(
-                and_(
-                    Attendance.date == today,
-                    Attendance.check_in_morning != None
-                )
-            )
-            present_count = present_query.count()
-            
-            # Absents
-            all_employee_ids = [e.id for e in Employee.query.filter_by(is_active=True).all()]
-            present_ids = [a.employee_id for a in present_query.all()]
-            absent_ids = set(all_employee_ids) - set(present_ids)
-            
-            # En congé
-            on_leave = Leave.query.filter(
-                and_(
-                    Leave.start_date <= today,
-                    Leave.end_date >= today,
-                    Leave.status == 'approved'
-                )
-            ).count()
-            
-            # Heures totales aujourd'hui
-            total_hours = db.session.query(func.sum(Attendance.total_hours)).filter(
-                Attendance.date == today
-            ).scalar() or 0
-            
-            overtime_hours = db.session.query(func.sum(Attendance.overtime_hours)).filter(
-                Attendance.date == today
-            ).scalar() or 0
-            
-            # Coûts estimés
-            labor_cost = calculate_daily_labor_cost(today)
-            
-            # Dépenses du jour
-            expense_cost = db.session.query(func.sum(Expense.total_amount)).filter(
-                Expense.expense_date == today,
-                Expense.payment_status == 'approved'
-            ).scalar() or 0
-            
-            # Projets actifs
-            active_projects = Project.query.filter_by(status='active').count()
-            
-            # Approbations en attente
-            pending_expenses = Expense.query.filter_by(payment_status='pending').count()
-            pending_leaves = Leave.query.filter_by(status='pending').count()
-            
-            # Vérifier la conformité
-            compliance_alerts = check_compliance_issues()
-            
-            # Mettre à jour ou créer
-            if not dashboard:
-                dashboard = CompanyDashboard(date=today)
-                db.session.add(dashboard)
-            
-            dashboard.total_employees = total_employees
-            dashboard.present_today = present_count
-            dashboard.absent_today = len(absent_ids) - on_leave
-            dashboard.on_leave = on_leave
-            dashboard.total_hours_today = float(total_hours)
-            dashboard.overtime_hours_today = float(overtime_hours)
-            dashboard.labor_cost_today = Decimal(str(labor_cost))
-            dashboard.expense_cost_today = Decimal(str(expense_cost))
-            dashboard.active_projects = active_projects
-            dashboard.pending_approvals = pending_expenses + pending_leaves
-            dashboard.compliance_alerts = compliance_alerts
-            dashboard.last_updated = datetime.now()
-            
-            db.session.commit()
+        # Ligne du jour tenue à jour par les pointages, frais et congés
+        dashboard = dashboard_updater.get(today)
         
         return jsonify({
             'success': True,
-            'dashboard': {
-                'date': dashboard.date.strftime('%d/%m/%Y'),
-                'employees': {
-                    'total': dashboard.total_employees,
-                    'present': dashboard.present_today,
-                    'absent': dashboard.absent_today,
-                    'on_leave': dashboard.on_leave
-                },
-                'hours': {
-                    'total': dashboard.total_hours_today,
-                    'overtime': dashboard.overtime_hours_today
-                },
-                'costs': {
-                    'labor': float(dashboard.labor_cost_today),
-                    'expenses': float(dashboard.expense_cost_today),
-                    'total': float(dashboard.labor_cost_today + dashboard.expense_cost_today)
-                },
-                'projects': {
-                    'active': dashboard.active_projects
-                },
-                'alerts': {
-                    'pending_approvals': dashboard.pending_approvals,
-                    'compliance': dashboard.compliance_alerts
-                }
-            }
+            'dashboard': serialize_dashboard(dashboard)
         })
         
     except Exception as e:
         current_app.logger.error(f"Erreur dashboard: {e}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@dashboard_bp.route('/labor-costs')
+def labor_costs():
+    """Coût de main d'œuvre par jour, projet ou département sur une période"""
+    try:
+        group = request.args.get('group', 'day')  # day, project, department
+        today = date.today()
+        start = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date() \
+            if request.args.get('start_date') else today.replace(day=1)
+        end = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date() \
+            if request.args.get('end_date') else today
+        
+        filters = {
+            'project_id': request.args.get('project_id', type=int),
+            'department': request.args.get('department'),
+            'employee_id': request.args.get('employee_id', type=int)
+        }
+        
+        aggregates = {
+            'day': labor_cost_service.by_day,
+            'project': labor_cost_service.by_project,
+            'department': labor_cost_service.by_department
+        }
+        if group not in aggregates:
+            return jsonify({'success': False, 'message': 'Regroupement invalide'}), 400
+        
+        rows = aggregates[group](start, end, **filters)
+        for row in rows:
+            if 'date' in row:
+                row['date'] = row['date'].strftime('%Y-%m-%d')
+        
+        return jsonify({
+            'success': True,
+            'period': {
+                'start': start.strftime('%d/%m/%Y'),
+                'end': end.strftime('%d/%m/%Y')
+            },
+            'data': rows,
+            'total': labor_cost_service.total(start, end, **filters)
+        })
+        
+    except Exception as e:
+        current_app.logger.error(f"Erreur coûts de main d'œuvre: {e}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @dashboard_bp.route('/attendance/report')
 def attendance_report():
     """Rapport de présence avec filtres"""
@@ -143,98 +115,119 @@ def attendance_report():
         end_date = request.args.get('end_date')
         department = request.args.get('department')
         employee_id = request.args.get('employee_id')
+        include_details = request.args.get('details', '1') != '0'  # 0 = résumés seuls
         
         # Déterminer la période
-        if period == 'day':
-            start = end = date.today()
-        elif period == 'week':
-            start = date.today() - timedelta(days=date.today().weekday())
-            end = start + timedelta(days=6)
-        elif period == 'biweek':
-            start = date.today() - timedelta(days=date.today().weekday() + 7)
-            end = start + timedelta(days=13)
-        elif period == 'month':
-            start = date.today().replace(day=1)
-            next_month = start.replace(day=28) + timedelta(days=4)
-            end = next_month - timedelta(days=next_month.day)
-        elif period == 'custom' and start_date and end_date:
-            start = datetime.strptime(start_date, '%Y-%m-%d').date()
-            end = datetime.strptime(end_date, '%Y-%m-%d').date()
-        else:
-            start = date.today() - timedelta(days=7)
-            end = date.today()
-        
-        # Construire la requête
-        query = db.session.query(
-            Attendance,
-            Employee,
-            User
-        ).join(
-            Employee, Attendance.employee_id == Employee.id
-        ).join(
-            User, Employee.user_id == User.id
-        ).filter(
-            and_(
-                Attendance.date >= start,
-                Attendance.date <= end
-            )
-        )
-        
-        # Filtres additionnels
-        if department:
-            query = query.filter(Employee.department == department)
+        start, end = report_period(period, start_date, end_date)
         
-        if employee_id:
-            query = query.filter(Employee.id == int(employee_id))
-        
-        attendances = query.all()
-        
-        # Organiser les données par employé
         employee_data = {}
         
-        for att, emp, user in attendances:
-            if emp.id not in employee_data:
-                employee_data[emp.id] = {
-                    'employee': {
-                        'id': emp.id,
-                        'name': user.full_name,
-                        'department': emp.department,
-                        'position': emp.position
-                    },
-                    'attendance': [],
-                    'summary': {
-                        'total_days': 0,
-                        'present_days': 0,
-                        'absent_days': 0,
-                        'late_days': 0,
-                        'total_hours': 0,
-                        'regular_hours': 0,
-                        'overtime_hours': 0
-                    }
+        def employee_entry(emp, user):
+            return {
+                'employee': {
+                    'id': emp.id,
+                    'name': user.full_name,
+                    'department': emp.department,
+                    'position': emp.position
+                },
+                'attendance': [],
+                'summary': {
+                    'total_days': 0,
+                    'present_days': 0,
+                    'absent_days': 0,
+                    'late_days': 0,
+                    'total_hours': 0,
+                    'regular_hours': 0,
+                    'overtime_hours': 0
                 }
+            }
+        
+        if include_details:
+            # Construire la requête
+            query = db.session.query(
+                Attendance,
+                Employee,
+                User
+            ).join(
+                Employee, Attendance.employee_id == Employee.id
+            ).join(
+                User, Employee.user_id == User.id
+            ).filter(
+                and_(
+                    Attendance.date >= start,
+                    Attendance.date <= end
+                )
+            )
             
-            # Ajouter les détails de présence
-            employee_data[emp.id]['attendance'].append({
-                'date': att.date.strftime('%Y-%m-%d'),
-                'check_in': att.check_in_morning.strftime('%H:%M') if att.check_in_morning else None,
-                'check_out': att.check_out_evening.strftime('%H:%M') if att.check_out_evening else None,
-                'total_hours': att.total_hours,
-                'overtime_hours': att.overtime_hours,
-                'is_late': att.is_late_morning or att.is_late_afternoon,
-                'location': att.location_name
-            })
+            # Filtres additionnels
+            if department:
+                query = query.filter(Employee.department == department)
             
-            # Mettre à jour le résumé
-            summary = employee_data[emp.id]['summary']
-            summary['present_days'] += 1
-            summary['total_hours'] += att.total_hours or 0
-            summary['overtime_hours'] += att.overtime_hours or 0
+            if employee_id:
+                query = query.filter(Employee.id == int(employee_id))
             
-            if att.is_late_morning or att.is_late_afternoon:
-                summary['late_days'] += 1
+            attendances = query.all()
+            
+            # Organiser les données par employé
+            for att, emp, user in attendances:
+                if emp.id not in employee_data:
+                    employee_data[emp.id] = employee_entry(emp, user)
+                
+                # Ajouter les détails de présence
+                employee_data[emp.id]['attendance'].append({
+                    'date': att.date.strftime('%Y-%m-%d'),
+                    'check_in': att.check_in_morning.strftime('%H:%M') if att.check_in_morning else None,
+                    'check_out': att.check_out_evening.strftime('%H:%M') if att.check_out_evening else None,
+                    'total_hours': att.total_hours,
+                    'overtime_hours': att.overtime_hours,
+                    'is_late': att.is_late_morning or att.is_late_afternoon,
+                    'location': att.location_name
+                })
+                
+                # Mettre à jour le résumé
+                summary = employee_data[emp.id]['summary']
+                summary['present_days'] += 1
+                summary['total_hours'] += att.total_hours or 0
+                summary['overtime_hours'] += att.overtime_hours or 0
+                
+                if att.is_late_morning or att.is_late_afternoon:
+                    summary['late_days'] += 1
+        else:
+            # Résumés lus dans les agrégats de présence
+            query = db.session.query(
+                Employee,
+                User,
+                func.sum(EmployeeStatistics.days_present).label('present_days'),
+                func.sum(EmployeeStatistics.total_hours).label('total_hours'),
+                func.sum(EmployeeStatistics.overtime_hours).label('overtime_hours'),
+                func.sum(EmployeeStatistics.late_days).label('late_days')
+            ).join(
+                EmployeeStatistics, EmployeeStatistics.employee_id == Employee.id
+            ).join(
+                User, Employee.user_id == User.id
+            ).filter(
+                and_(
+                    attendance_rollup.period_filter(start, end),
+                    EmployeeStatistics.days_present > 0
+                )
+            )
+            
+            if department:
+                query = query.filter(Employee.department == department)
+            
+            if employee_id:
+                query = query.filter(Employee.id == int(employee_id))
+            
+            for emp, user, present_days, total_hours, overtime_hours, late_days in query.group_by(Employee.id, User.id).all():
+                employee_data[emp.id] = employee_entry(emp, user)
+                summary = employee_data[emp.id]['summary']
+                summary['present_days'] = int(present_days or 0)
+                summary['total_hours'] = float(total_hours or 0)
+                summary['overtime_hours'] = float(overtime_hours or 0)
+                summary['late_days'] = int(late_days or 0)
         
         # Calculer les jours travaillés dans la période
-        working_days = calculate_working_days(start, end)
+        working_days = business_calendar.working_days(start, end)
         
         # Finaliser les résumés
         for emp_id, data in employee_data.items():
@@ -242,7 +235,7 @@ def attendance_report():
             summary['total_days'] = working_days
             summary['absent_days'] = working_days - summary['present_days']
             summary['regular_hours'] = summary['total_hours'] - summary['overtime_hours']
-            summary['attendance_rate'] = round(summary['present_days'] / working_days * 100, 1)
+            summary['attendance_rate'] = round(summary['present_days'] / working_days * 100, 1) if working_days > 0 else 0
         
         return jsonify({
             'success': True,
@@ -268,6 +261,289 @@ def attendance_report():
         current_app.logger.error(f"Erreur rapport présence: {e}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def attendance_rows(start, end, department=None, employee_id=None):
+    """Requête des lignes de présence (colonnes seules) triées par (employé, date)"""
+    query = db.session.query(
+        Attendance.employee_id,
+        Attendance.date,
+        Attendance.check_in_morning,
+        Attendance.check_out_evening,
+        Attendance.total_hours,
+        Attendance.overtime_hours,
+        Attendance.is_late_morning,
+        Attendance.is_late_afternoon,
+        Attendance.location_name,
+        User.first_name,
+        User.last_name,
+        User.username,
+        Employee.department,
+        Employee.position
+    ).join(
+        Employee, Attendance.employee_id == Employee.id
+    ).join(
+        User, Employee.user_id == User.id
+    ).filter(
+        Attendance.date >= start,
+        Attendance.date <= end
+    )
+    
+    if department:
+        query = query.filter(Employee.department == department)
+    
+    if employee_id:
+        query = query.filter(Attendance.employee_id == employee_id)
+    
+    return query.order_by(Attendance.employee_id, Attendance.date)
+
+def report_employee_id():
+    """Filtre employee_id des rapports (None si absent, ValueError si non numérique)"""
+    employee_id = request.args.get('employee_id')
+    return int(employee_id) if employee_id else None
+
+def attendance_row_entry(row):
+    """Détail JSON d'une ligne de attendance_rows"""
+    return {
+        'employee_id': row.employee_id,
+        'date': row.date.strftime('%Y-%m-%d'),
+        'check_in': row.check_in_morning.strftime('%H:%M') if row.check_in_morning else None,
+        'check_out': row.check_out_evening.strftime('%H:%M') if row.check_out_evening else None,
+        'total_hours': row.total_hours,
+        'overtime_hours': row.overtime_hours,
+        'is_late': bool(row.is_late_morning or row.is_late_afternoon),
+        'location': row.location_name
+    }
+
+def _row_employee(row):
+    return {
+        'id': row.employee_id,
+        'name': f"{row.first_name} {row.last_name}" if row.first_name and row.last_name else row.username,
+        'department': row.department,
+        'position': row.position
+    }
+
+@dashboard_bp.route('/attendance/report/stream')
+def attendance_report_stream():
+    """Rapport de présence en flux NDJSON (une ligne JSON par enregistrement)
+    
+    Les lignes sont lues par lots depuis un curseur serveur (yield_per) et
+    écrites au fur et à mesure: la mémoire reste constante quelle que soit
+    la période. Ordre des lignes: 'period', puis pour chaque employé ses
+    lignes 'attendance' suivies de son 'summary', et enfin 'totals'.
+    """
+    period = request.args.get('period', 'week')
+    try:
+        start, end = report_period(period, request.args.get('start_date'), request.args.get('end_date'))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Date invalide (format AAAA-MM-JJ)'}), 400
+    
+    try:
+        employee_id = report_employee_id()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Identifiant employé invalide'}), 400
+    
+    include_details = request.args.get('details', '1') != '0'
+    query = attendance_rows(start, end, request.args.get('department'), employee_id)
+    batch_size = current_app.config.get('REPORT_STREAM_BATCH_SIZE', 1000)
+    working_days = business_calendar.working_days(start, end)
+    
+    def line(data):
+        return json.dumps(data, default=str) + "\n"
+    
+    def summary_line(employee, summary):
+        summary['total_days'] = working_days
+        summary['absent_days'] = working_days - summary['present_days']
+        summary['regular_hours'] = summary['total_hours'] - summary['overtime_hours']
+        summary['attendance_rate'] = round(summary['present_days'] / working_days * 100, 1) if working_days > 0 else 0
+        return line({'type': 'summary', 'employee': employee, 'summary': summary})
+    
+    def generate():
+        yield line({
+            'type': 'period',
+            'period': period,
+            'start': start.strftime('%d/%m/%Y'),
+            'end': end.strftime('%d/%m/%Y'),
+            'working_days': working_days
+        })
+        
+        totals = {'total_employees': 0, 'total_hours': 0, 'total_overtime': 0, 'attendance_rate_sum': 0}
+        employee = summary = None
+        
+        for row in query.execution_options(yield_per=batch_size):
+            if employee is None or employee['id'] != row.employee_id:
+                if employee is not None:
+                    yield summary_line(employee, summary)
+                    totals['attendance_rate_sum'] += summary['attendance_rate']
+                
+                employee = _row_employee(row)
+                summary = {'present_days': 0, 'late_days': 0, 'total_hours': 0, 'overtime_hours': 0}
+                totals['total_employees'] += 1
+            
+            summary['present_days'] += 1
+            summary['total_hours'] += row.total_hours or 0
+            summary['overtime_hours'] += row.overtime_hours or 0
+            if row.is_late_morning or row.is_late_afternoon:
+                summary['late_days'] += 1
+            
+            totals['total_hours'] += row.total_hours or 0
+            totals['total_overtime'] += row.overtime_hours or 0
+            
+            if include_details:
+                yield line(dict(attendance_row_entry(row), type='attendance'))
+        
+        if employee is not None:
+            yield summary_line(employee, summary)
+            totals['attendance_rate_sum'] += summary['attendance_rate']
+        
+        rate_sum = totals.pop('attendance_rate_sum')
+        yield line(dict(
+            totals,
+            type='totals',
+            average_attendance_rate=round(rate_sum / totals['total_employees'], 1) if totals['total_employees'] else 0
+        ))
+    
+    filename = f"presences_{start.strftime('%Y%m%d')}_{end.strftime('%Y%m%d')}.ndjson"
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers={
+        'Content-Disposition': f'inline; filename={filename}',
+        'X-Accel-Buffering': 'no'
+    })
+
+@dashboard_bp.route('/attendance/report/page')
+def attendance_report_page():
+    """Page de lignes de présence par pagination par clé (employee_id, date)
+    
+    `after` est le curseur 'employee_id:AAAA-MM-JJ' renvoyé par la page
+    précédente (next_cursor); la requête reprend sur l'index unique
+    (employee_id, date) sans OFFSET.
+    """
+    try:
+        period = request.args.get('period', 'week')
+        start, end = report_period(period, request.args.get('start_date'), request.args.get('end_date'))
+        limit = request.args.get('limit', 200, type=int)
+        if limit < 1:
+            raise ValueError('limit doit être au moins 1')
+        limit = min(limit, current_app.config.get('REPORT_PAGE_MAX_SIZE', 1000))
+        
+        query = attendance_rows(start, end, request.args.get('department'), report_employee_id())
+        
+        after = request.args.get('after')
+        if after:
+            after_employee, after_date = after.split(':', 1)
+            after_employee = int(after_employee)
+            after_date = datetime.strptime(after_date, '%Y-%m-%d').date()
+            query = query.filter(or_(
+                Attendance.employee_id > after_employee,
+                and_(Attendance.employee_id == after_employee, Attendance.date > after_date)
+            ))
+        
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        employees = {}
+        for row in rows:
+            employees.setdefault(row.employee_id, _row_employee(row))
+        
+        last = rows[-1] if rows else None
+        return jsonify({
+            'success': True,
+            'period': {
+                'type': period,
+                'start': start.strftime('%d/%m/%Y'),
+                'end': end.strftime('%d/%m/%Y')
+            },
+            'employees': list(employees.values()),
+            'data': [attendance_row_entry(row) for row in rows],
+            'next_cursor': f"{last.employee_id}:{last.date.strftime('%Y-%m-%d')}" if has_more else None
+        })
+        
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Paramètres de pagination invalides'}), 400
+    except Exception as e:
+        current_app.logger.error(f"Erreur pagination rapport présence: {e}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+JOURS = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
+
+TIMESHEET_COLUMNS = [
+    ('Date', 12), ('Jour', 10),
+    ('Arrivée Matin', 15), ('Départ Midi', 15), ('Arrivée Après-midi', 15), ('Départ Soir', 15),
+    ('Heures Totales', 12), ('Heures Supp.', 12),
+    ('Projet', 20), ('Lieu', 20)
+]
+
+def _time(value):
+    return value.strftime('%H:%M') if value else ''
+
+def timesheet_rows(rows):
+    """Lignes de la feuille de temps suivies du total, depuis des (Attendance, nom du projet)"""
+    total_hours = overtime_hours = 0
+    
+    for att, project_name in rows:
+        total_hours += att.total_hours or 0
+        overtime_hours += att.overtime_hours or 0
+        yield [
+            att.date.strftime('%d/%m/%Y'),
+            JOURS[att.date.weekday()],
+            _time(att.check_in_morning),
+            _time(att.check_out_lunch),
+            _time(att.check_in_afternoon),
+            _time(att.check_out_evening),
+            att.total_hours or 0,
+            att.overtime_hours or 0,
+            project_name or '',
+            att.location_name or ''
+        ]
+    
+    yield StyledRow(['TOTAL', '', '', '', '', '', total_hours, overtime_hours, '', ''])
+
+ATTENDANCE_EXPORT_COLUMNS = [
+    ('Employé', 25), ('Département', 18), ('Poste', 18), ('Date', 12),
+    ('Arrivée', 10), ('Départ', 10), ('Heures Totales', 12), ('Heures Supp.', 12),
+    ('Retard', 8), ('Lieu', 25)
+]
+
+@dashboard_bp.route('/attendance/report/export')
+def attendance_report_export():
+    """Export XLSX des présences de toute l'entreprise sur une période
+    
+    Même filtres que /attendance/report; les lignes sont lues par lots
+    (yield_per) et écrites directement dans le classeur write-only.
+    """
+    period = request.args.get('period', 'month')
+    try:
+        start, end = report_period(period, request.args.get('start_date'), request.args.get('end_date'))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Date invalide (format AAAA-MM-JJ)'}), 400
+    
+    try:
+        employee_id = report_employee_id()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Identifiant employé invalide'}), 400
+    
+    query = attendance_rows(start, end, request.args.get('department'), employee_id)
+    query = query.execution_options(yield_per=current_app.config.get('REPORT_STREAM_BATCH_SIZE', 1000))
+    
+    def rows():
+        for row in query:
+            entry = attendance_row_entry(row)
+            yield [
+                _row_employee(row)['name'],
+                row.department or '',
+                row.position or '',
+                row.date.strftime('%d/%m/%Y'),
+                entry['check_in'] or '',
+                entry['check_out'] or '',
+                row.total_hours or 0,
+                row.overtime_hours or 0,
+                'Oui' if entry['is_late'] else 'Non',
+                row.location_name or ''
+            ]
+    
+    export = XlsxExport()
+    export.add_sheet('Présences', ATTENDANCE_EXPORT_COLUMNS, rows())
+    
+    return export.response(f"presences_{start.strftime('%Y%m%d')}_{end.strftime('%Y%m%d')}.xlsx")
+
 @dashboard_bp.route('/timesheet/generate', methods=['POST'])
 def generate_timesheet():
     """Générer une feuille de temps PDF"""
@@ -280,90 +556,35 @@ def generate_timesheet():
         
         employee = Employee.query.get_or_404(employee_id)
         
-        # Récupérer les données de présence
-        attendances = Attendance.query.filter(
-            and_(
+        if format_type == 'excel':
+            # Excel écrit en flux depuis la requête (mode write-only)
+            rows = db.session.query(Attendance, Project.name).outerjoin(
+                Project, Attendance.project_id == Project.id
+            ).filter(
                 Attendance.employee_id == employee_id,
                 Attendance.date >= start_date,
                 Attendance.date <= end_date
+            ).order_by(Attendance.date).execution_options(
+                yield_per=current_app.config.get('REPORT_STREAM_BATCH_SIZE', 1000)
             )
-        ).order_by(Attendance.date).all()
-        
-        if format_type == 'excel':
-            # Générer Excel
-            df_data = []
-            for att in attendances:
-                df_data.append({
-                    'Date': att.date.strftime('%d/%m/%Y'),
-                    'Jour': ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche'][att.date.weekday()],
-                    'Arrivée Matin': att.check_in_morning.strftime('%H:%M') if att.check_in_morning else '',
-                    'Départ Midi': att.check_out_lunch.strftime('%H:%M') if att.check_out_lunch else '',
-                    'Arrivée Après-midi': att.check_in_afternoon.strftime('%H:%M') if att.check_in_afternoon else '',
-                    'Départ Soir': att.check_out_evening.strftime('%H:%M') if att.check_out_evening else '',
-                    'Heures Totales': att.total_hours or 0,
-                    'Heures Supp.': att.overtime_hours or 0,
-                    'Projet': att.project.name if att.project else '',
-                    'Lieu': att.location_name or ''
-                })
-            
-            df = pd.DataFrame(df_data)
             
-            # Ajouter les totaux
-            totals = pd.DataFrame([{
-                'Date': 'TOTAL',
-                'Jour': '',
-                'Arrivée Matin': '',
-                'Départ Midi': '',
-                'Arrivée Après-midi': '',
-                'Départ Soir': '',
-                'Heures Totales': df['Heures Totales'].sum(),
-                'Heures Supp.': df['Heures Supp.'].sum(),
-                'Projet': '',
-                'Lieu': ''
-            }])
+            export = XlsxExport()
+            export.add_sheet('Feuille de temps', TIMESHEET_COLUMNS, timesheet_rows(rows))
             
-            df = pd.concat([df, totals], ignore_index=True)
-            
-            # Créer le fichier Excel
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, sheet_name='Feuille de temps', index=False)
-                
-                # Formater
-                workbook = writer.book
-                worksheet = writer.sheets['Feuille de temps']
-                
-                # Format pour les headers
-                header_format = workbook.add_format({
-                    'bold': True,
-                    'bg_color': '#4CAF50',
-                    'font_color': 'white',
-                    'align': 'center',
-                    'valign': 'vcenter'
-                })
-                
-                # Appliquer le format aux headers
-                for col_num, value in enumerate(df.columns.values):
-                    worksheet.write(0, col_num, value, header_format)
-                
-                # Ajuster la largeur des colonnes
-                worksheet.set_column('A:A', 12)
-                worksheet.set_column('B:B', 10)
-                worksheet.set_column('C:F', 15)
-                worksheet.set_column('G:H', 12)
-                worksheet.set_column('I:J', 20)
-            
-            output.seek(0)
-            
-            return send_file(
-                output,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                as_attachment=True,
-                download_name=f'feuille_temps_{employee.employee_code}_{start_date.strftime("%Y%m%d")}_{end_date.strftime("%Y%m%d")}.xlsx'
+            return export.response(
+                f'feuille_temps_{employee.employee_code}_{start_date.strftime("%Y%m%d")}_{end_date.strftime("%Y%m%d")}.xlsx'
             )
             
         else:
             # Générer PDF
+            attendances = Attendance.query.filter(
+                and_(
+                    Attendance.employee_id == employee_id,
+                    Attendance.date >= start_date,
+                    Attendance.date <= end_date
+                )
+            ).order_by(Attendance.date).all()
+            
             pdf_buffer = generate_timesheet_pdf(employee, attendances, start_date, end_date)
             
             return send_file(
@@ -400,18 +621,16 @@ def employee_statistics(employee_id):
             start_date = date.today() - timedelta(days=30)
             end_date = date.today()
         
-        # Statistiques de présence
+        # Statistiques de présence (agrégats de présence)
         attendance_stats = db.session.query(
-            func.count(Attendance.id).label('days_worked'),
-            func.sum(Attendance.total_hours).label('total_hours'),
-            func.sum(Attendance.overtime_hours).label('overtime_hours'),
-            func.sum(func.cast(Attendance.is_late_morning, db.Integer)).label('late_mornings'),
-            func.sum(func.cast(Attendance.is_late_afternoon, db.Integer)).label('late_afternoons')
+            func.coalesce(func.sum(EmployeeStatistics.days_present), 0).label('days_worked'),
+            func.sum(EmployeeStatistics.total_hours).label('total_hours'),
+            func.sum(EmployeeStatistics.overtime_hours).label('overtime_hours'),
+            func.coalesce(func.sum(EmployeeStatistics.late_arrivals), 0).label('late_arrivals')
         ).filter(
             and_(
-                Attendance.employee_id == employee_id,
-                Attendance.date >= start_date,
-                Attendance.date <= end_date
+                EmployeeStatistics.employee_id == employee_id,
+                attendance_rollup.period_filter(start_date, end_date)
             )
         ).first()
         
@@ -479,13 +698,13 @@ def employee_statistics(employee_id):
         } for proj, days in projects]
         
         # Calculer le taux de productivité
-        working_days = calculate_working_days(start_date, end_date)
+        working_days = business_calendar.working_days(start_date, end_date, canton=employee.canton)
         attendance_rate = (attendance_stats.days_worked / working_days * 100) if working_days > 0 else 0
         
         # Score de productivité (basé sur plusieurs facteurs)
         productivity_score = calculate_productivity_score(
             attendance_rate,
-            attendance_stats.late_mornings + attendance_stats.late_afternoons,
+            attendance_stats.late_arrivals,
             attendance_stats.overtime_hours or 0,
             len(project_data)
         )
@@ -508,7 +727,7 @@ def employee_statistics(employee_id):
                 'total_hours': float(attendance_stats.total_hours or 0),
                 'regular_hours': float((attendance_stats.total_hours or 0) - (attendance_stats.overtime_hours or 0)),
                 'overtime_hours': float(attendance_stats.overtime_hours or 0),
-                'late_arrivals': (attendance_stats.late_mornings or 0) + (attendance_stats.late_afternoons or 0),
+                'late_arrivals': attendance_stats.late_arrivals,
                 'attendance_rate': round(attendance_rate, 1)
             },
             'leaves': {
@@ -532,28 +751,9 @@ def employee_statistics(employee_id):
         return jsonify({'success': False, 'message': str(e)}), 500
 
 # Fonctions utilitaires
-def calculate_working_days(start_date, end_date):
-    """Calculer le nombre de jours ouvrés dans une période"""
-    days = 0
-    current = start_date
-    while current <= end_date:
-        if current.weekday() < 5:  # Lundi à Vendredi
-            days += 1
-        current += timedelta(days=1)
-    return days
-
 def calculate_daily_labor_cost(date):
     """Calculer le coût de main d'œuvre pour une journée"""
-    attendances = Attendance.query.filter_by(date=date).all()
-    total_cost = 0
-    
-    for att in attendances:
-        if att.employee and att.employee.hourly_rate and att.total_hours:
-            regular_cost = min(att.total_hours, 8) * float(att.employee.hourly_rate)
-            overtime_cost = max(0, att.total_hours - 8) * float(att.employee.hourly_rate) * 1.25
-            total_cost += regular_cost + overtime_cost
-    
-    return total_cost
+    return float(labor_cost_service.total(date, date)['total_cost'])
 
 def check_compliance_issues():
     """Vérifier les problèmes de conformité"""
@@ -8,6 +8,8 @@ from app import db
 from app.models import (Employee, Expense, ExpensePolicy, AuditLog, 
                        Notification, User, Project)
 from app.utils.decorators import log_action
+from app.utils.expense_policy import expense_policy_engine, policy_outcome
+from app.utils.dashboard_updater import dashboard_updater
 from datetime import datetime, date, timedelta
 from dateutil.relativedelta import relativedelta
 from sqlalchemy import and_, or_, func, extract
@@ -39,71 +41,10 @@ EXPENSE_CATEGORIES = {
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def check_expense_policy(expense):
+def check_expense_policy(expense, department=None):
     """Vérifier si une dépense respecte les politiques"""
-    violations = []
-    
-    # Récupérer les politiques applicables
-    policies = ExpensePolicy.query.filter(
-        and_(
-            ExpensePolicy.is_active == True,
-            or_(
-                ExpensePolicy.category == expense.category,
-                ExpensePolicy.category == 'all'
-            )
-        )
-    ).all()
-    
-    for policy in policies:
-        # Vérifier la limite par dépense
-        if policy.per_expense_limit and expense.total_amount > policy.per_expense_limit:
-            violations.append({
-                'policy': policy.name,
-                'violation': f"Montant dépasse la limite ({policy.per_expense_limit} CHF)",
-                'severity': 'warning'
-            })
-        
-        # Vérifier la limite journalière
-        if policy.daily_limit:
-            daily_total = db.session.query(func.sum(Expense.total_amount)).filter(
-                and_(
-                    Expense.employee_id == expense.employee_id,
-                    Expense.category == expense.category,
-                    Expense.expense_date == expense.expense_date,
-                    Expense.payment_status != 'rejected'
-                )
-            ).scalar() or 0
-            
-            if daily_total + expense.total_amount > policy.daily_limit:
-                violations.append({
-                    'policy': policy.name,
-                    'violation': f"Limite journalière dépassée ({policy.daily_limit} CHF)",
-                    'severity': 'error'
-                })
-        
-        # Vérifier la limite mensuelle
-        if policy.monthly_limit:
-            month_start = expense.expense_date.replace(day=1)
-            month_end = (month_start + relativedelta(months=1)) - timedelta(days=1)
-            
-            monthly_total = db.session.query(func.sum(Expense.total_amount)).filter(
-                and_(
-                    Expense.employee_id == expense.employee_id,
-                    Expense.category == expense.category,
-                    Expense.expense_date >= month_start,
-                    Expense.expense_date <= month_end,
-                    Expense.payment_status != 'rejected'
-                )
-            ).scalar() or 0
-            
-            if monthly_total + expense.total_amount > policy.monthly_limit:
-                violations.append({
-                    'policy': policy.name,
-                    'violation': f"Limite mensuelle dépassée ({policy.monthly_limit} CHF)",
-                    'severity': 'error'
-                })
-    
-    return violations
+    # Politiques en cache, totaux du jour et du mois en une requête
+    return expense_policy_engine.check(expense, department)
 
 @expense_bp.route('/submit', methods=['POST'])
 @log_action('expense_submit')
@@ -187,15 +128,11 @@ def submit_expense():
         db.session.add(expense)
         db.session.flush()  # Pour obtenir l'ID
         
-        violations = check_expense_policy(expense)
+        violations = check_expense_policy(expense, employee.department)
         
-        if violations:
-            expense.policy_violation = True
-            expense.policy_violation_reason = ', '.join([v['violation'] for v in violations])
-            
-            # Si violation critique, nécessite approbation spéciale
-            if any(v['severity'] == 'error' for v in violations):
-                expense.payment_status = 'policy_review'
+        # Si violation critique, nécessite approbation spéciale
+        for field, value in policy_outcome(violations, expense.payment_status).items():
+            setattr(expense, field, value)
         
         # Générer le numéro de dépense
         year = datetime.now().year
@@ -670,4 +607,33 @@ def list_policies():
         
     except Exception as e:
         current_app.logger.error(f"Erreur liste politiques: {e}")
-        return jsonify({'success': False, 'message': str(e)}), 500
\ No newline at end of file
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@expense_bp.route('/policies/revalidate', methods=['POST'])
+@log_action('expense_policy_revalidate', category='finance')
+def revalidate_policies():
+    """Réévaluer les dépenses d'un mois après un changement de politique"""
+    try:
+        data = request.get_json() or {}
+        month = data.get('month', date.today().month)
+        year = data.get('year', date.today().year)
+        dry_run = bool(data.get('dry_run', False))  # Simulation: rien n'est enregistré
+        
+        summary = expense_policy_engine.revalidate_month(month, year, dry_run=dry_run)
+        if not dry_run:
+            db.session.commit()
+            if summary['updated']:
+                # UPDATE en masse sans événement ORM: approbations en attente recalculées
+                dashboard_updater.reconcile()
+        
+        return jsonify({
+            'success': True,
+            'message': f"{summary['checked']} dépenses vérifiées, {summary['updated']} mises à jour",
+            'dry_run': dry_run,
+            'summary': summary
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Erreur revalidation politiques: {e}")
+        return jsonify({'success': False, 'message': str(e)}), 500
@@ -7,6 +7,7 @@ from app import db
 from app.models import (Employee, Leave, Attendance, AuditLog, 
                        Notification, User, Payroll)
 from app.utils.decorators import log_action
+from app.utils.business_calendar import business_calendar
 from datetime import datetime, date, timedelta
 from dateutil.relativedelta import relativedelta
 from sqlalchemy import and_, or_, func, extract
@@ -174,8 +175,8 @@ def approve_leave():
         if leave.employee.user:
             notification = Notification(
                 user_id=leave.employee.user_id,
-                title=f"Demande de congé {leave.status == 'approved' ? 'approuvée' : 'rejetée'}",
-                message=f"Votre demande du {leave.start_date.strftime('%d/%m/%Y')} au {leave.end_date.strftime('%d/%m/%Y')} a été {leave.status == 'approved' ? 'approuvée' : 'rejetée'}",
+                title=f"Demande de congé {'approuvée' if leave.status == 'approved' else 'rejetée'}",
+                message=f"Votre demande du {leave.start_date.strftime('%d/%m/%Y')} au {leave.end_date.strftime('%d/%m/%Y')} a été {'approuvée' if leave.status == 'approved' else 'rejetée'}",
                 type=notification_type,
                 category='leave'
             )
@@ -508,7 +509,7 @@ def leave_report():
             total_employees = total_employees.filter_by(department=department)
         total_employees = total_employees.count()
         
-        working_days_year = calculate_working_days(date(year, 1, 1), date(year, 12, 31))
+        working_days_year = business_calendar.working_days(date(year, 1, 1), date(year, 12, 31))
         potential_days = total_employees * working_days_year
         
         absenteeism_rate = (total_leave_days / potential_days * 100) if potential_days > 0 else 0
@@ -587,13 +588,3 @@ def create_absence_records(leave):
                 db.session.add(attendance)
         
         current += timedelta(days=1)
-
-def calculate_working_days(start_date, end_date):
-    """Calculer le nombre de jours ouvrés dans une période"""
-    days = 0
-    current = start_date
-    while current <= end_date:
-        if current.weekday() < 5:  # Lundi à Vendredi
-            days += 1
-        current += timedelta(days=1)
-    return days
\ No newline at end of file
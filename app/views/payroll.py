@@ -6,12 +6,16 @@ from flask import Blueprint, render_template, request, jsonify, send_file, curre
 from app import db
 from app.models import (Employee, Payroll, Attendance, Leave, Expense, 
                        AuditLog, Notification)
-from app.utils.pdf import generate_payslip_pdf
+from app.utils.pdf import payslip_data, build_payslip_bundle
+from app.utils.payslips import payslip_renderer
+from app.utils.payroll_engine import payroll_engine
 from datetime import datetime, date, timedelta
 from dateutil.relativedelta import relativedelta
 from sqlalchemy import and_, or_, func, extract
+from sqlalchemy.orm import contains_eager
 from decimal import Decimal
 import calendar
+import tempfile
 
 payroll_bp = Blueprint('payroll', __name__, url_prefix='/api/payroll')
 
@@ -23,127 +27,25 @@ def calculate_payroll():
         month = data.get('month', date.today().month)
         year = data.get('year', date.today().year)
         employee_ids = data.get('employee_ids', [])  # Liste vide = tous les employés
+        dry_run = bool(data.get('dry_run', False))  # Simulation: rien n'est enregistré
         
-        # Si pas d'employés spécifiés, prendre tous les actifs
-        if not employee_ids:
-            employees = Employee.query.filter_by(is_active=True).all()
-        else:
-            employees = Employee.query.filter(
-                and_(
-                    Employee.id.in_(employee_ids),
-                    Employee.is_active == True
-                )
-            ).all()
-        
-        # Dates de la période
-        period_start = date(year, month, 1)
-        period_end = date(year, month, calendar.monthrange(year, month)[1])
-        
-        results = []
+        # Toutes les fiches du lot sont calculées puis écrites en une transaction
+        results = payroll_engine.run(month, year, employee_ids or None, dry_run=dry_run)
+        calculated = sum(1 for result in results if result['status'] == 'calculated')
         
-        for employee in employees:
-            # Vérifier si la paie existe déjà
-            existing_payroll = Payroll.query.filter_by(
-                employee_id=employee.id,
-                month=month,
-                year=year
-            ).first()
-            
-            if existing_payroll and existing_payroll.status == 'paid':
-                results.append({
-                    'employee_id': employee.id,
-                    'status': 'already_paid',
-                    'message': f"Paie déjà versée pour {employee.full_name}"
-                })
-                continue
-            
-            # Calculer les heures travaillées
-            attendance_data = db.session.query(
-                func.sum(Attendance.total_hours).label('total_hours'),
-                func.sum(Attendance.overtime_hours).label('overtime_hours')
-            ).filter(
-                and_(
-                    Attendance.employee_id == employee.id,
-                    Attendance.date >= period_start,
-                    Attendance.date <= period_end
-                )
-            ).first()
-            
-            total_hours = attendance_data.total_hours or 0
-            overtime_hours = attendance_data.overtime_hours or 0
-            regular_hours = total_hours - overtime_hours
-            
-            # Calculer le salaire de base
-            if employee.base_salary:
-                # Salaire mensuel fixe
-                base_amount = employee.base_salary
-                overtime_rate = (employee.base_salary / 160) * Decimal('1.25')  # Base sur 160h/mois
-                overtime_amount = overtime_rate * Decimal(str(overtime_hours))
-            elif employee.hourly_rate:
-                # Salaire horaire
-                base_amount = employee.hourly_rate * Decimal(str(regular_hours))
-                overtime_amount = employee.hourly_rate * Decimal('1.25') * Decimal(str(overtime_hours))
-            else:
-                results.append({
-                    'employee_id': employee.id,
-                    'status': 'error',
-                    'message': f"Pas de salaire défini pour {employee.full_name}"
-                })
-                continue
-            
-            # Ajouter les bonus éventuels
-            bonuses = Decimal('0')  # TODO: Implémenter la logique des bonus
-            
-            # Salaire brut
-            gross_salary = base_amount + overtime_amount + bonuses
-            
-            # Créer ou mettre à jour la paie
-            if existing_payroll:
-                payroll = existing_payroll
-            else:
-                payroll = Payroll(
-                    employee_id=employee.id,
-                    month=month,
-                    year=year,
-                    period_start=period_start,
-                    period_end=period_end
-                )
-                db.session.add(payroll)
-            
-            # Mettre à jour les valeurs
-            payroll.regular_hours = float(regular_hours)
-            payroll.overtime_hours = float(overtime_hours)
-            payroll.base_amount = base_amount
-            payroll.overtime_amount = overtime_amount
-            payroll.bonuses = bonuses
-            payroll.gross_salary = gross_salary
-            
-            # Calculer les déductions
-            payroll.calculate_deductions()
-            
-            # Statut
-            payroll.status = 'draft'
-            
-            db.session.commit()
-            
-            results.append({
-                'employee_id': employee.id,
-                'employee_name': employee.full_name,
-                'status': 'calculated',
-                'payroll_id': payroll.id,
-                'gross_salary': float(payroll.gross_salary),
-                'net_salary': float(payroll.net_salary),
-                'hours': {
-                    'regular': payroll.regular_hours,
-                    'overtime': payroll.overtime_hours
-                }
+        if dry_run:
+            return jsonify({
+                'success': True,
+                'dry_run': True,
+                'message': f"{calculated} fiches de paie simulées",
+                'results': results
             })
         
         # Créer une notification pour les RH
         notification = Notification(
             user_id=1,  # TODO: Obtenir l'ID du responsable RH
             title=f"Calcul de paie terminé - {month}/{year}",
-            message=f"{len(results)} fiches de paie calculées pour validation",
+            message=f"{calculated} fiches de paie calculées pour validation",
             type='info',
             category='payroll',
             link_url=f"/payroll/validation?month={month}&year={year}"
@@ -217,62 +119,94 @@ def validate_payroll():
 
 @payroll_bp.route('/generate-payslips', methods=['POST'])
 def generate_payslips():
-    """Générer les fiches de paie PDF"""
+    """Générer les fiches de paie PDF en arrière-plan
+    
+    Retourne immédiatement l'identifiant du job; la progression se lit sur
+    /payslips/jobs/<job_id>. Les fiches inchangées ne sont pas régénérées.
+    """
     try:
         data = request.get_json()
         payroll_ids = data.get('payroll_ids', [])
         send_email = data.get('send_email', False)
         
-        payrolls = Payroll.query.filter(
-            and_(
-                Payroll.id.in_(payroll_ids),
-                Payroll.status.in_(['validated', 'paid'])
-            )
-        ).all()
-        
-        generated = []
+        if not payroll_ids:
+            return jsonify({'success': False, 'message': 'Aucune fiche de paie sélectionnée'}), 400
         
-        for payroll in payrolls:
-            # Générer le PDF
-            pdf_path = generate_payslip_pdf(payroll)
-            payroll.payslip_path = pdf_path
-            
-            # Envoyer par email si demandé
-            if send_email and payroll.employee.user and payroll.employee.user.email:
-                # TODO: Implémenter l'envoi d'email
-                pass
-            
-            generated.append({
-                'payroll_id': payroll.id,
-                'employee_name': payroll.employee.full_name,
-                'pdf_path': pdf_path
-            })
-            
-            # Notification à l'employé
-            if payroll.employee.user:
-                notification = Notification(
-                    user_id=payroll.employee.user.id,
-                    title=f"Fiche de paie disponible - {payroll.month}/{payroll.year}",
-                    message="Votre fiche de paie est disponible dans votre espace personnel",
-                    type='info',
-                    category='payroll',
-                    link_url=f"/employee/payslips/{payroll.id}"
-                )
-                db.session.add(notification)
+        # Envoyer par email si demandé
+        if send_email:
+            # TODO: Implémenter l'envoi d'email
+            pass
         
-        db.session.commit()
+        job_id = payslip_renderer.submit(current_app._get_current_object(), payroll_ids)
         
         return jsonify({
             'success': True,
-            'message': f"{len(generated)} fiches de paie générées",
-            'payslips': generated
-        })
+            'message': f"Génération de {len(payroll_ids)} fiches de paie lancée",
+            'job_id': job_id,
+            'status_url': f"/api/payroll/payslips/jobs/{job_id}"
+        }), 202
         
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Erreur génération fiches de paie: {e}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@payroll_bp.route('/payslips/jobs/<job_id>')
+def payslip_job_status(job_id):
+    """Progression d'un job de génération de fiches de paie"""
+    try:
+        job = payslip_renderer.status(job_id)
+        if job is None:
+            return jsonify({'success': False, 'message': 'Job introuvable'}), 404
+        
+        return jsonify({'success': True, 'job': job})
+        
+    except Exception as e:
+        current_app.logger.error(f"Erreur état job fiches de paie: {e}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@payroll_bp.route('/payslips/bundle')
+def payslip_bundle():
+    """Toutes les fiches de paie validées d'un mois dans un seul PDF imprimable"""
+    try:
+        month = request.args.get('month', date.today().month, type=int)
+        year = request.args.get('year', date.today().year, type=int)
+        
+        query = Payroll.query.join(Payroll.employee).options(
+            contains_eager(Payroll.employee).joinedload(Employee.user)
+        ).filter(
+            Payroll.month == month,
+            Payroll.year == year,
+            Payroll.status.in_(['validated', 'paid'])
+        )
+        
+        department = request.args.get('department')
+        if department:
+            query = query.filter(Employee.department == department)
+        
+        if not query.count():
+            return jsonify({'success': False, 'message': 'Aucune fiche de paie validée pour cette période'}), 404
+        
+        # Fiches lues et dessinées par lots, PDF écrit dans un fichier temporaire
+        output = tempfile.TemporaryFile(suffix='.pdf')
+        build_payslip_bundle(
+            output,
+            (payslip_data(payroll) for payroll in query.order_by(Employee.employee_code).yield_per(200)),
+            title=f"Fiches de paie {month:02d}/{year}"
+        )
+        output.seek(0)
+        
+        return send_file(
+            output,
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name=f"fiches_paie_{year}_{month:02d}.pdf"
+        )
+        
+    except Exception as e:
+        current_app.logger.error(f"Erreur lot de fiches de paie: {e}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @payroll_bp.route('/list')
 def list_payrolls():
     """Lister les fiches de paie avec filtres"""
@@ -373,18 +307,16 @@ def download_payslip(payroll_id):
         # Vérifier les permissions
         # TODO: Implémenter la vérification des permissions
         
-        if not payroll.payslip_path:
-            # Générer la fiche si elle n'existe pas
-            pdf_buffer = generate_payslip_pdf(payroll)
-        else:
-            # Lire le fichier existant
-            with open(payroll.payslip_path, 'rb') as f:
-                pdf_buffer = io.BytesIO(f.read())
+        # Fichier du cache pour les valeurs actuelles, rendu ici seulement s'il manque
+        pdf_path = payslip_renderer.render(current_app, payroll)
+        if payroll.payslip_path != pdf_path:
+            payroll.payslip_path = pdf_path
+            db.session.commit()
         
         filename = f"fiche_paie_{payroll.employee.employee_code}_{payroll.year}_{payroll.month:02d}.pdf"
         
         return send_file(
-            pdf_buffer,
+            pdf_path,
             mimetype='application/pdf',
             as_attachment=True,
             download_name=filename
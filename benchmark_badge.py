@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark de latence du pointage (p50 / p99)
+
+Simule une prise de poste: N employés badgent chacun une fois sur
+/api/badge/check-in (badge, QR code ou PIN) contre une base SQLite
+temporaire, puis compare la résolution des PIN via l'index en mémoire et
+via une requête directe (badge et QR code sont lus directement sur leur
+colonne unique: il n'y a rien à comparer).
+
+Usage:
+    python benchmark_badge.py [--employees 250] [--method badge|qr_code|pin]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+# config importe ProductionConfig, qui exige SECRET_KEY dès l'import
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+from config import BaseConfig
+
+
+def percentile(samples, pct):
+    """Percentile par rang le plus proche (samples triés)"""
+    if not samples:
+        return 0.0
+    rank = max(0, min(len(samples) - 1, int(round(pct / 100 * len(samples))) - 1))
+    return samples[rank]
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    print(f"{label:<28} n={len(samples):<5} "
+          f"p50={percentile(samples, 50):7.2f} ms  "
+          f"p99={percentile(samples, 99):7.2f} ms  "
+          f"moy={statistics.mean(samples):7.2f} ms")
+
+
+def seed_employees(db, Employee, count):
+    """Créer `count` employés actifs avec badge, QR code et PIN"""
+    from app.utils.badge_credentials import hash_pin
+
+    credentials = []
+    for i in range(count):
+        pin = f"{i:06d}"
+        employee = Employee(
+            employee_code=f"BENCH{i:04d}",
+            hire_date=date.today(),
+            badge_number=f"B{i:06d}",
+            qr_code=f"GB-BENCH{i:04d}",
+            pin_code=hash_pin(pin),
+            is_active=True
+        )
+        db.session.add(employee)
+        credentials.append({
+            'badge': employee.badge_number,
+            'qr_code': employee.qr_code,
+            'pin': pin
+        })
+
+    # Quelques employés inactifs: ils ne doivent jamais être résolus
+    for i in range(count // 10):
+        db.session.add(Employee(
+            employee_code=f"OLD{i:04d}",
+            hire_date=date.today(),
+            badge_number=f"X{i:06d}",
+            is_active=False
+        ))
+
+    db.session.commit()
+    return credentials
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du pointage par badge")
+    parser.add_argument('--employees', type=int, default=250)
+    parser.add_argument('--method', choices=['badge', 'qr_code', 'pin'], default='badge')
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'benchmark_badge.db')
+
+    class BenchmarkConfig(BaseConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{db_path}"
+        TESTING = True
+        SCHEDULER_ENABLED = False
+
+    from app import create_app, db
+    from app.models import Employee
+    from app.utils.badge_credentials import credential_index, hash_pin
+
+    app = create_app(BenchmarkConfig)
+
+    with app.app_context():
+        db.create_all()
+        credentials = seed_employees(db, Employee, args.employees)
+        random.shuffle(credentials)
+
+        client = app.test_client()
+
+        # 1. Endpoint complet: un pointage d'arrivée par employé
+        endpoint_samples = []
+        failures = 0
+        for cred in credentials:
+            started = time.perf_counter()
+            response = client.post('/api/badge/check-in', json={
+                'method': args.method,
+                'value': cred[args.method]
+            })
+            endpoint_samples.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                failures += 1
+
+        # 2. Résolution d'un PIN seule: index en mémoire vs requête directe
+        index_samples = []
+        query_samples = []
+        credential_index.invalidate()
+
+        for cred in credentials:
+            pin = cred['pin']
+
+            started = time.perf_counter()
+            credential_index.resolve('pin', pin)
+            index_samples.append((time.perf_counter() - started) * 1000)
+            db.session.expire_all()
+
+            started = time.perf_counter()
+            Employee.query.filter(
+                Employee.pin_code == hash_pin(pin),
+                Employee.is_active == True
+            ).first()
+            query_samples.append((time.perf_counter() - started) * 1000)
+            db.session.expire_all()
+
+    print(f"\nPointage de {args.employees} employés via '{args.method}'")
+    print('=' * 72)
+    report("POST /api/badge/check-in", endpoint_samples)
+    report("Résolution PIN (index)", index_samples)
+    report("Résolution PIN (requête SQL)", query_samples)
+    if failures:
+        print(f"\n⚠ {failures} pointage(s) en échec")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
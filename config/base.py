@@ -28,6 +28,26 @@ class BaseConfig:
     UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
     ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'doc', 'docx', 'xls', 'xlsx'}
     
+    # Photos de pointage (traitement en arrière-plan)
+    PHOTO_WORKERS = 2
+    PHOTO_QUEUE_SIZE = 200
+    PHOTO_QUEUE_MAX_BYTES = 64 * 1024 * 1024
+    PHOTO_FORMAT = 'JPEG'  # ou 'WEBP'
+    PHOTO_QUALITY = 80
+    PHOTO_MAX_SIZE = 1280
+    PHOTO_THUMBNAIL_SIZE = 240
+    
+    # Fiches de paie PDF (cache adressé par contenu, rendu multi-processus)
+    PAYSLIP_FOLDER = os.path.join(UPLOAD_FOLDER, 'payslips')
+    PAYSLIP_WORKERS = int(os.environ.get('PAYSLIP_WORKERS', 2))  # par worker gunicorn
+    PAYSLIP_JOB_STALE_AFTER = 600  # secondes sans progression avant abandon du job
+    
+    # Synchronisation des terminaux de badgage hors ligne
+    BADGE_SYNC_MAX_EVENTS = 1000
+    BADGE_TERMINALS = [t.strip() for t in os.environ.get('BADGE_TERMINALS', '').split(',') if t.strip()]
+    BADGE_SYNC_MAX_AGE = 7 * 24 * 3600  # secondes, ancienneté maximale d'un pointage hors ligne
+    BADGE_SYNC_MAX_SKEW = 300  # secondes, avance tolérée de l'horloge du terminal
+    
     # Email
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
     MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
@@ -36,6 +56,14 @@ class BaseConfig:
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER', 'noreply@globibat.ch')
     
+    # File d'envoi des emails (connexion SMTP persistante)
+    MAIL_QUEUE_SIZE = 5000
+    MAIL_BATCH_SIZE = 50
+    MAIL_MAX_ATTEMPTS = 5
+    MAIL_RETRY_BACKOFF = 30  # secondes, doublé à chaque essai
+    MAIL_SMTP_TIMEOUT = 30
+    MAIL_SMTP_IDLE_TIMEOUT = 60  # fermeture de la connexion inactive
+    
     # Entreprise
     COMPANY_NAME = 'Globibat SA'
     COMPANY_ADDRESS = 'Route de Chancy 123'
@@ -68,13 +96,31 @@ class BaseConfig:
     # Pagination
     ITEMS_PER_PAGE = 20
     
+    # Rapports de présence volumineux (flux NDJSON et pagination par clé)
+    REPORT_STREAM_BATCH_SIZE = 1000  # lignes lues par lot du curseur serveur
+    REPORT_PAGE_MAX_SIZE = 1000
+    
     # Cache
     CACHE_TYPE = 'simple'
     CACHE_DEFAULT_TIMEOUT = 300
+    UNREAD_COUNTER_TTL = 300  # Compteur de notifications non lues (secondes)
     
     # API
     API_RATE_LIMIT = '100 per hour'
     
+    # Planificateur: exécuté par un seul processus (bail en base)
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() in ['true', 'on', '1']
+    SCHEDULER_LEASE_TTL = 60  # secondes avant reprise par un autre processus
+    
+    # Flux temps réel (Server-Sent Events)
+    SSE_POLL_INTERVAL = 2  # secondes, une requête par worker
+    SSE_KEEPALIVE = 15
+    SSE_MAX_DURATION = 300  # inférieur au --timeout gunicorn (360) des déploiements
+    SSE_QUEUE_SIZE = 100
+    
+    # Tableau de bord incrémental
+    DASHBOARD_FLUSH_INTERVAL = 5  # secondes entre deux applications des variations
+    
     # Langues supportées
     LANGUAGES = {
         'fr': 'Français',
@@ -159,7 +159,7 @@ User=www-data
 Group=www-data
 WorkingDirectory=${APP_DIR}
 Environment="PATH=${APP_DIR}/venv/bin"
-ExecStart=${APP_DIR}/venv/bin/gunicorn -w 4 -b 127.0.0.1:5000 wsgi:app
+ExecStart=${APP_DIR}/venv/bin/gunicorn -w 4 --worker-class gthread --threads 16 --timeout 360 -b 127.0.0.1:5000 wsgi:app
 Restart=always
 
 [Install]
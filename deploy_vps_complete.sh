@@ -102,7 +102,7 @@ User=www-data
 Group=www-data
 WorkingDirectory=$PROJECT_DIR
 Environment="PATH=$PROJECT_DIR/venv/bin"
-ExecStart=$PROJECT_DIR/venv/bin/gunicorn --workers 4 --bind unix:$PROJECT_DIR/$SERVICE_NAME.sock --log-level info --access-logfile $PROJECT_DIR/instance/logs/access.log --error-logfile $PROJECT_DIR/instance/logs/error.log run:app
+ExecStart=$PROJECT_DIR/venv/bin/gunicorn --workers 4 --worker-class gthread --threads 16 --timeout 360 --bind unix:$PROJECT_DIR/$SERVICE_NAME.sock --log-level info --access-logfile $PROJECT_DIR/instance/logs/access.log --error-logfile $PROJECT_DIR/instance/logs/error.log run:app
 
 [Install]
 WantedBy=multi-user.target
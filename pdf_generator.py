@@ -7,12 +7,16 @@ from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import mm
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, PageBreak
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, PageBreak, Frame
 from reportlab.platypus.flowables import HRFlowable
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
+from reportlab.pdfgen import canvas
 from datetime import datetime, date, timedelta
 import os
 import io
+import tempfile
+
+PAGE_MARGIN = 20*mm
 
 def generate_payslip(employe, mois, annee, heures_travaillees, salaire_horaire=15.0):
     """
@@ -36,12 +40,21 @@ def generate_payslip(employe, mois, annee, heures_travaillees, salaire_horaire=1
     doc = SimpleDocTemplate(
         buffer,
         pagesize=A4,
-        rightMargin=20*mm,
-        leftMargin=20*mm,
-        topMargin=20*mm,
-        bottomMargin=20*mm
+        rightMargin=PAGE_MARGIN,
+        leftMargin=PAGE_MARGIN,
+        topMargin=PAGE_MARGIN,
+        bottomMargin=PAGE_MARGIN
     )
     
+    # Générer le PDF
+    doc.build(payslip_elements(employe, mois, annee, heures_travaillees, salaire_horaire))
+    buffer.seek(0)
+    
+    return buffer
+
+def payslip_elements(employe, mois, annee, heures_travaillees, salaire_horaire=15.0):
+    """Éléments ReportLab d'une fiche de paie (voir generate_payslip)"""
+    
     # Conteneur pour les éléments
     elements = []
     
@@ -230,11 +243,7 @@ def generate_payslip(employe, mois, annee, heures_travaillees, salaire_horaire=1
     
     elements.append(Paragraph(footer_text, styles['Normal']))
     
-    # Générer le PDF
-    doc.build(elements)
-    buffer.seek(0)
-    
-    return buffer
+    return elements
 
 def get_month_name(month):
     """Retourne le nom du mois en français"""
@@ -249,29 +258,46 @@ def get_last_day_of_month(month, year):
     else:
         return date(year, month + 1, 1) - timedelta(days=1)
 
-def generate_all_payslips(employes_data, mois, annee, salaire_horaire=15.0):
+def generate_all_payslips(employes_data, mois, annee, salaire_horaire=15.0, output=None):
     """
-    Génère les fiches de paie pour tous les employés
+    Génère les fiches de paie de tous les employés dans un seul PDF
+    
+    Chaque fiche est dessinée sur le canvas puis libérée avant de construire
+    la suivante: ni story complète ni PDF intermédiaire par employé. Seul le
+    contenu des pages déjà dessinées (~20 Ko par page) reste en mémoire
+    jusqu'à l'écriture du fichier.
     
     Args:
-        employes_data: Liste de tuples (employe, heures_travaillees)
+        employes_data: Itérable (liste ou générateur) de tuples (employe, heures_travaillees)
         mois: Numéro du mois
         annee: Année
         salaire_horaire: Taux horaire
+        output: Chemin ou fichier de destination (défaut: fichier temporaire)
     
     Returns:
-        BytesIO object contenant toutes les fiches de paie
+        Le fichier contenant toutes les fiches de paie, positionné au début
     """
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    elements = []
+    if output is None:
+        output = tempfile.TemporaryFile(suffix='.pdf')
     
-    for i, (employe, heures) in enumerate(employes_data):
-        if i > 0:
-            elements.append(PageBreak())
-        
-        # Générer la fiche pour cet employé
-        payslip_buffer = generate_payslip(employe, mois, annee, heures, salaire_horaire)
-        # Note: Pour combiner plusieurs PDFs, utilisez PyPDF2 ou reportlab plus avancé
+    pdf = canvas.Canvas(output, pagesize=A4, pageCompression=1)
+    pdf.setTitle(f"Fiches de paie {get_month_name(mois)} {annee}")
     
-    return buffer 
\ No newline at end of file
+    for employe, heures in employes_data:
+        draw_pages(pdf, payslip_elements(employe, mois, annee, heures, salaire_horaire))
+    
+    pdf.save()
+    if hasattr(output, 'seek'):
+        output.seek(0)
+    return output
+
+def draw_pages(pdf, elements):
+    """Dessiner des éléments sur un canvas, une nouvelle page par cadre rempli"""
+    width, height = A4
+    while elements:
+        frame = Frame(PAGE_MARGIN, PAGE_MARGIN, width - 2 * PAGE_MARGIN, height - 2 * PAGE_MARGIN)
+        remaining = len(elements)
+        frame.addFromList(elements, pdf)
+        if len(elements) == remaining:
+            raise ValueError("Élément trop grand pour une page de fiche de paie")
+        pdf.showPage()
@@ -0,0 +1,36 @@
+"""
+Fixtures communes des tests
+"""
+import os
+
+# config importe ProductionConfig, qui exige SECRET_KEY dès l'import
+os.environ.setdefault('SECRET_KEY', 'test')
+
+import pytest
+from app import create_app, db
+from config import BaseConfig
+
+
+class TestingConfig(BaseConfig):
+    """Configuration de test: base SQLite en mémoire"""
+    TESTING = True
+    SECRET_KEY = 'test'
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    WTF_CSRF_ENABLED = False
+    BADGE_TERMINALS = ['T1']
+    SCHEDULER_ENABLED = False  # Ni élection du leader ni threads APScheduler
+
+
+@pytest.fixture
+def app():
+    app = create_app(TestingConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
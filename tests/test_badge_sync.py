@@ -0,0 +1,97 @@
+"""
+Synchronisation des pointages des terminaux hors ligne (/api/badge/sync)
+"""
+from datetime import datetime, timedelta
+from app import db
+from app.models import Attendance, BadgeSyncEvent, Employee
+
+
+def sync_batch(*events, terminal_id='T1'):
+    return {'terminal_id': terminal_id, 'events': list(events)}
+
+
+def yesterday_at(hour, minute=0):
+    day = datetime.now() - timedelta(days=1)
+    return day.replace(hour=hour, minute=minute, second=0, microsecond=0).isoformat()
+
+
+def badge_event(key, timestamp, value='B001'):
+    return {'idempotency_key': key, 'timestamp': timestamp, 'method': 'badge', 'value': value}
+
+
+def add_employee():
+    employee = Employee(employee_code='E001', badge_number='B001', is_active=True)
+    db.session.add(employee)
+    db.session.commit()
+    return employee
+
+
+def test_single_event_batch_is_applied(client):
+    add_employee()
+
+    response = client.post('/api/badge/sync', json=sync_batch(badge_event('k1', yesterday_at(8))))
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['applied'] == 1
+    assert data['results'][0]['status'] == 'applied'
+    assert data['results'][0]['action_type'] == 'check_in'
+    assert BadgeSyncEvent.query.count() == 1
+    assert Attendance.query.count() == 1
+
+
+def test_replayed_batch_returns_original_result(client):
+    add_employee()
+    batch = sync_batch(badge_event('k1', yesterday_at(8)))
+
+    first = client.post('/api/badge/sync', json=batch).get_json()
+    replay = client.post('/api/badge/sync', json=batch)
+
+    assert replay.status_code == 200
+    data = replay.get_json()
+    assert data['applied'] == 0
+    assert data['results'][0]['duplicate'] is True
+    assert data['results'][0]['attendance_id'] == first['results'][0]['attendance_id']
+    assert BadgeSyncEvent.query.count() == 1
+    assert Attendance.query.count() == 1
+
+
+def test_unknown_credential_is_rejected_in_batch(client):
+    add_employee()
+
+    response = client.post('/api/badge/sync', json=sync_batch(
+        badge_event('k1', yesterday_at(8), value='INCONNU'),
+        badge_event('k2', yesterday_at(8, 5))
+    ))
+
+    assert response.status_code == 200
+    statuses = [result['status'] for result in response.get_json()['results']]
+    assert statuses == ['rejected', 'applied']
+
+
+def test_unregistered_terminal_is_refused(client):
+    add_employee()
+
+    response = client.post('/api/badge/sync', json=sync_batch(
+        badge_event('k1', yesterday_at(8)), terminal_id='INCONNU'
+    ))
+
+    assert response.status_code == 403
+    assert BadgeSyncEvent.query.count() == 0
+
+
+def test_events_outside_sync_window_are_invalid(client):
+    add_employee()
+    future = (datetime.now() + timedelta(hours=2)).isoformat()
+    too_old = (datetime.now() - timedelta(days=30)).isoformat()
+
+    response = client.post('/api/badge/sync', json=sync_batch(
+        badge_event('k1', future),
+        badge_event('k2', too_old),
+        badge_event('k3', yesterday_at(8))
+    ))
+
+    assert response.status_code == 200
+    statuses = [result['status'] for result in response.get_json()['results']]
+    assert statuses == ['invalid', 'invalid', 'applied']
+    assert Attendance.query.count() == 1
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Mise à niveau de la table employee_statistics (agrégats de présence)
+
+db.create_all() ne modifie pas une table existante. Ce script ajoute les
+colonnes billable_hours et late_days, supprime les doublons de période (la
+ligne la plus récente est gardée) puis crée l'index unique
+(employee_id, period_type, period_start) et l'index (period_type,
+period_start). Chaque étape est ignorée si elle est déjà appliquée.
+
+DDL équivalent:
+    ALTER TABLE employee_statistics ADD COLUMN billable_hours FLOAT DEFAULT 0;
+    ALTER TABLE employee_statistics ADD COLUMN late_days INTEGER DEFAULT 0;
+    DELETE FROM employee_statistics WHERE id NOT IN (
+        SELECT id FROM (SELECT MAX(id) AS id FROM employee_statistics
+                        GROUP BY employee_id, period_type, period_start) AS keep);
+    CREATE UNIQUE INDEX uq_employee_statistics_period
+        ON employee_statistics (employee_id, period_type, period_start);
+    CREATE INDEX ix_employee_statistics_period
+        ON employee_statistics (period_type, period_start);
+
+Lancer ensuite la reconstruction des agrégats:
+    flask backfill-statistics --start AAAA-MM-JJ
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app, db
+from sqlalchemy import inspect, text
+
+TABLE = 'employee_statistics'
+
+COLUMNS = {
+    'billable_hours': 'FLOAT DEFAULT 0',
+    'late_days': 'INTEGER DEFAULT 0'
+}
+
+PERIOD_COLUMNS = ['employee_id', 'period_type', 'period_start']
+UNIQUE_INDEX = 'uq_employee_statistics_period'
+PERIOD_INDEX = 'ix_employee_statistics_period'
+
+
+def upgrade(connection):
+    inspector = inspect(connection)
+    
+    if not inspector.has_table(TABLE):
+        print(f"Table {TABLE} absente: créée par db.create_all(), rien à faire")
+        return
+    
+    existing = {column['name'] for column in inspector.get_columns(TABLE)}
+    for name, definition in COLUMNS.items():
+        if name in existing:
+            print(f"Colonne {name} déjà présente")
+            continue
+        connection.execute(text(f"ALTER TABLE {TABLE} ADD COLUMN {name} {definition}"))
+        print(f"Colonne {name} ajoutée")
+    
+    indexes = inspector.get_indexes(TABLE)
+    unique_columns = [constraint['column_names'] for constraint in inspector.get_unique_constraints(TABLE)]
+    unique_columns += [index['column_names'] for index in indexes if index.get('unique')]
+    
+    if PERIOD_COLUMNS in unique_columns:
+        print("Unicité (employé, période) déjà en place")
+    else:
+        deleted = connection.execute(text(
+            f"DELETE FROM {TABLE} WHERE id NOT IN ("
+            f"SELECT id FROM (SELECT MAX(id) AS id FROM {TABLE} "
+            f"GROUP BY employee_id, period_type, period_start) AS keep)"
+        )).rowcount
+        print(f"Doublons supprimés: {deleted}")
+        connection.execute(text(
+            f"CREATE UNIQUE INDEX {UNIQUE_INDEX} ON {TABLE} ({', '.join(PERIOD_COLUMNS)})"
+        ))
+        print(f"Index unique {UNIQUE_INDEX} créé")
+    
+    if any(index['name'] == PERIOD_INDEX for index in indexes):
+        print(f"Index {PERIOD_INDEX} déjà présent")
+    else:
+        connection.execute(text(f"CREATE INDEX {PERIOD_INDEX} ON {TABLE} (period_type, period_start)"))
+        print(f"Index {PERIOD_INDEX} créé")
+
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        with db.engine.begin() as connection:
+            upgrade(connection)
+    print("Mise à niveau terminée. Lancer: flask backfill-statistics --start AAAA-MM-JJ")